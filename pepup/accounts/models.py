@@ -93,10 +93,18 @@ class Profile(models.Model):
         """
         if self.thumbnail_img.name != "default_profile.png":
             return self.thumbnail_img.url
-        elif hasattr(self.user.socialaccount_set.last(), 'extra_data'):
-            if 'properties' in self.user.socialaccount_set.last().extra_data:
-                if self.user.socialaccount_set.last().extra_data['properties'].get('profile_image'):
-                    return self.user.socialaccount_set.last().extra_data['properties'].get('profile_image')
+        return self.get_profile_img_url(self.user.socialaccount_set.last())
+
+    def get_profile_img_url(self, social_account):
+        """
+        socialaccount 를 미리 조회해 둔 경우(여러 유저를 한번에 serialize 할 때) 사용합니다.
+        """
+        if self.thumbnail_img.name != "default_profile.png":
+            return self.thumbnail_img.url
+        if hasattr(social_account, 'extra_data'):
+            if 'properties' in social_account.extra_data:
+                if social_account.extra_data['properties'].get('profile_image'):
+                    return social_account.extra_data['properties'].get('profile_image')
                 else:
                     return "http://pepup-server-storages.s3.ap-northeast-2.amazonaws.com/media/default_profile.png"
         else:
@@ -122,14 +130,7 @@ class DeliveryPolicy(models.Model):
     active_amount = models.BooleanField(default=False, help_text='배송정책 on off')
     volume = models.IntegerField(verbose_name='총량조건', default=0)
     active_volume = models.BooleanField(default=False, help_text='배송정책 on off')
-
-    def get_delivery_charge(self, amount,volume,mountain=False):
-        ret = 0
-        if mountain:
-            ret += self.mountain
-        if amount < self.amount and volume < self.volume:
-            ret += self.general
-        return ret
+    # 배송비 계산은 payment.utils.calculate_delivery_fees
 
 
 class StoreAccount(models.Model):
@@ -133,10 +133,15 @@ class UserSerializer(serializers.ModelSerializer):
         model = User
         fields = ['id', 'nickname', 'profile', 'review_score', 'sold', 'followers']
 
+    # sold_count, review_score, follower_count 는 미리 annotate 된 경우 그 값을 사용합니다.
     def get_sold(self, obj):
+        if hasattr(obj, 'sold_count'):
+            return obj.sold_count
         return obj.product_set.filter(sold=True).count()
 
     def get_review_score(self, obj):
+        if hasattr(obj, 'review_score'):
+            return obj.review_score
         if obj.received_reviews.first():
             score = obj.received_reviews.all().values('satisfaction').\
                 annotate(score=Avg('satisfaction')).values('score')[0]['score']
@@ -144,6 +149,8 @@ class UserSerializer(serializers.ModelSerializer):
         return 0.0
 
     def get_followers(self, obj):
+        if hasattr(obj, 'follower_count'):
+            return obj.follower_count
         return obj._to.count()
 
     def get_profile(self, obj):
@@ -44,7 +44,12 @@ class ProductAdmin(admin.ModelAdmin):
     list_editable = ('sold', 'is_refundable', 'discount_rate', 'on_discount', 'is_active')
     fields = ('seller', 'name', 'price', 'brand', 'first_category', 'second_category', 'size', 'content',
               'tag')
+    actions = ['update_discounted_price']
 
+    def update_discounted_price(self, request, queryset):
+        count = queryset.update_discounted_price()
+        self.message_user(request, '{}개 상품의 할인가를 다시 계산했습니다.'.format(count))
+    update_discounted_price.short_description = '선택된 상품 할인가 다시 계산'
 
     def prod_thumb_img(self, obj):
         prod_thumb = obj.prodthumbnail
@@ -0,0 +1,202 @@
+"""
+검색어 자동완성 index 입니다.
+
+태그(Tag.product_count 가중치), 브랜드, 판매자 닉네임(StoreStats.seller_score 가중치)을 자모 단위로 분해한 key 의 정렬된 배열로 메모리에 두고
+bisect 로 prefix 범위를 찾으므로 키 입력마다 DB 를 조회하지 않습니다.
+자모로 비교하므로 '후ㄷ', '훋' 처럼 입력 중인 글자도 '후드' 에 매칭됩니다.
+index 는 api.signals 에서 변경분만 갱신하며, 다른 process 에서의 변경을 반영하기 위해
+AUTOCOMPLETE_REFRESH_SECONDS 마다 DB 에서 다시 읽습니다. 다시 읽는 동안 다른 요청은 기존 index 로 응답합니다.
+"""
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+
+from accounts.models import User
+from .models import Brand, Tag
+
+HANGUL_BASE = 0xAC00
+HANGUL_LAST = 0xD7A3
+INITIALS = 'ㄱㄲㄴㄷㄸㄹㅁㅂㅃㅅㅆㅇㅈㅉㅊㅋㅌㅍㅎ'
+MEDIALS = ['ㅏ', 'ㅐ', 'ㅑ', 'ㅒ', 'ㅓ', 'ㅔ', 'ㅕ', 'ㅖ', 'ㅗ', 'ㅗㅏ', 'ㅗㅐ', 'ㅗㅣ', 'ㅛ', 'ㅜ', 'ㅜㅓ', 'ㅜㅔ',
+           'ㅜㅣ', 'ㅠ', 'ㅡ', 'ㅡㅣ', 'ㅣ']
+FINALS = ['', 'ㄱ', 'ㄲ', 'ㄱㅅ', 'ㄴ', 'ㄴㅈ', 'ㄴㅎ', 'ㄷ', 'ㄹ', 'ㄹㄱ', 'ㄹㅁ', 'ㄹㅂ', 'ㄹㅅ', 'ㄹㅌ', 'ㄹㅍ', 'ㄹㅎ',
+          'ㅁ', 'ㅂ', 'ㅂㅅ', 'ㅅ', 'ㅆ', 'ㅇ', 'ㅈ', 'ㅊ', 'ㅋ', 'ㅌ', 'ㅍ', 'ㅎ']
+# 단독으로 입력된 겹자모
+COMPOUND_JAMO = {
+    'ㄳ': 'ㄱㅅ', 'ㄵ': 'ㄴㅈ', 'ㄶ': 'ㄴㅎ', 'ㄺ': 'ㄹㄱ', 'ㄻ': 'ㄹㅁ', 'ㄼ': 'ㄹㅂ', 'ㄽ': 'ㄹㅅ', 'ㄾ': 'ㄹㅌ',
+    'ㄿ': 'ㄹㅍ', 'ㅀ': 'ㄹㅎ', 'ㅄ': 'ㅂㅅ', 'ㅘ': 'ㅗㅏ', 'ㅙ': 'ㅗㅐ', 'ㅚ': 'ㅗㅣ', 'ㅝ': 'ㅜㅓ', 'ㅞ': 'ㅜㅔ',
+    'ㅟ': 'ㅜㅣ', 'ㅢ': 'ㅡㅣ',
+}
+
+
+def decompose(text):
+    """
+    text 를 소문자, 자모 단위 문자열로 바꿉니다. ex) '후드' -> 'ㅎㅜㄷㅡ'
+    """
+    result = []
+    for char in text.lower():
+        code = ord(char)
+        if HANGUL_BASE <= code <= HANGUL_LAST:
+            offset = code - HANGUL_BASE
+            result.append(INITIALS[offset // 588])
+            result.append(MEDIALS[(offset % 588) // 28])
+            result.append(FINALS[offset % 28])
+        else:
+            result.append(COMPOUND_JAMO.get(char, char))
+    return ''.join(result)
+
+
+class AutocompleteIndex:
+    """
+    (key, item_id) 의 정렬된 배열입니다. 기본적으로 label 의 각 단어 시작 위치부터의 문자열을 key 로 넣으므로
+    단어 시작 기준으로 매칭됩니다. substring=True 이면 모든 글자 위치부터의 문자열(suffix) 을 넣어
+    label 중간의 글자와도 매칭됩니다. (닉네임처럼 짧은 label 용)
+    """
+
+    def __init__(self, substring=False):
+        self.substring = substring
+        self.keys = []
+        self.items = {}  # item_id: (label, weight)
+
+    def get_keys(self, label):
+        if self.substring:
+            return {decompose(label[i:]) for i in range(len(label)) if not label[i].isspace()}
+        keys = set()
+        words = label.split()
+        for i in range(len(words)):
+            keys.add(decompose(' '.join(words[i:])))
+        return keys
+
+    def add(self, item_id, label, weight=0):
+        self.remove(item_id)
+        self.items[item_id] = (label, weight)
+        for key in self.get_keys(label):
+            insort(self.keys, (key, item_id))
+
+    def add_many(self, rows):
+        """
+        빈 index 에 (item_id, label, weight) 들을 한번에 넣습니다. key 를 모두 모은 뒤 한번만 정렬합니다. (load 용)
+        """
+        for item_id, label, weight in rows:
+            self.items[item_id] = (label, weight)
+            self.keys.extend((key, item_id) for key in self.get_keys(label))
+        self.keys.sort()
+
+    def remove(self, item_id):
+        item = self.items.pop(item_id, None)
+        if item is None:
+            return
+        for key in self.get_keys(item[0]):
+            i = bisect_left(self.keys, (key, item_id))
+            if i < len(self.keys) and self.keys[i] == (key, item_id):
+                del self.keys[i]
+
+    def add_weight(self, item_id, delta):
+        if item_id in self.items:
+            label, weight = self.items[item_id]
+            self.items[item_id] = (label, weight + delta)
+
+    def search(self, prefix, limit):
+        """
+        prefix 로 시작하는 item 을 가중치 역순, id 순으로 limit 개 return 합니다. [(item_id, label), ...]
+        """
+        key = decompose(prefix.strip())
+        if not key:
+            return []
+        matched = set()
+        i = bisect_left(self.keys, (key,))
+        while i < len(self.keys) and self.keys[i][0].startswith(key):
+            matched.add(self.keys[i][1])
+            i += 1
+        top = heapq.nsmallest(limit, matched, key=lambda item_id: (-self.items[item_id][1], item_id))
+        return [(item_id, self.items[item_id][0]) for item_id in top]
+
+
+class AutocompleteService:
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.load_lock = threading.Lock()  # load 는 한번에 하나만
+        self.loaded_at = None
+        self.tags = AutocompleteIndex()
+        self.brands = AutocompleteIndex()
+        self.sellers = AutocompleteIndex(substring=True)
+
+    def get_refresh_seconds(self):
+        return getattr(settings, 'AUTOCOMPLETE_REFRESH_SECONDS', 60 * 5)
+
+    def load(self):
+        tags = AutocompleteIndex()
+        tags.add_many(Tag.objects.values_list('id', 'tag', 'product_count'))
+        brands = AutocompleteIndex()
+        brands.add_many((brand_id, name, 0)
+                        for brand_id, name in Brand.objects.exclude(name='Other').values_list('id', 'name'))
+        # 판매자는 StoreStats.seller_score(판매중 상품, 최근 판매, follower) 순
+        sellers = AutocompleteIndex(substring=True)
+        rows = User.objects.filter(is_active=True, nickname__isnull=False)\
+            .values_list('id', 'nickname', 'store_stats__seller_score')
+        sellers.add_many((user_id, nickname, seller_score or 0) for user_id, nickname, seller_score in rows)
+        with self.lock:
+            self.tags, self.brands, self.sellers = tags, brands, sellers
+            self.loaded_at = time.monotonic()
+
+    def is_stale(self):
+        return time.monotonic() - self.loaded_at > self.get_refresh_seconds()
+
+    def ensure_loaded(self):
+        if self.loaded_at is None:
+            # 처음에는 응답할 index 가 없으므로 기다립니다. 동시에 들어온 요청 중 하나만 load 합니다.
+            with self.load_lock:
+                if self.loaded_at is None:
+                    self.load()
+            return
+        if not self.is_stale():
+            return
+        # 한 요청만 다시 읽고, 그동안 다른 요청은 기존 index 로 응답합니다.
+        if self.load_lock.acquire(blocking=False):
+            try:
+                if self.is_stale():
+                    self.load()
+            finally:
+                self.load_lock.release()
+
+    def search_tags(self, keyword, limit):
+        self.ensure_loaded()
+        with self.lock:
+            return [{'tag': label, 'id': tag_id} for tag_id, label in self.tags.search(keyword, limit)]
+
+    def search_brands(self, keyword, limit):
+        self.ensure_loaded()
+        with self.lock:
+            return self.brands.search(keyword, limit)
+
+    def search_sellers(self, keyword, limit):
+        self.ensure_loaded()
+        with self.lock:
+            return [user_id for user_id, _ in self.sellers.search(keyword, limit)]
+
+    # 아래는 api.signals 에서 호출되는 변경분 갱신입니다. 아직 load 되지 않았다면 load 시 반영되므로 무시합니다.
+    def update(self, index_name, item_id, label=None, weight=None):
+        with self.lock:
+            if self.loaded_at is None:
+                return
+            index = getattr(self, index_name)
+            if label is None:
+                index.remove(item_id)
+                return
+            if weight is None:
+                weight = index.items.get(item_id, (None, 0))[1]
+            index.add(item_id, label, weight)
+
+    def add_tag_weights(self, tag_ids, delta):
+        with self.lock:
+            if self.loaded_at is None:
+                return
+            for tag_id in tag_ids:
+                self.tags.add_weight(tag_id, delta)
+
+
+autocomplete = AutocompleteService()
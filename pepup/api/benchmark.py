@@ -0,0 +1,201 @@
+"""
+검색 relevance / latency benchmark 입니다. (benchmark_search command)
+
+한글/영문 상품명, 브랜드, 태그로 이루어진 가상 catalog 를 만들고, 가상 query(또는 SearchQueryLog 에 기록된 query) 를
+SearchViewSet 의 searching, product_search, tag_search 에 재생하여
+api 별 p50/p95/p99 latency, 요청당 쿼리 수, product_search 의 recall@k 를 측정합니다.
+상품은 signal 없이 bulk_create 하고 검색 index, Tag.product_count, 자동완성 index 는 직접 만듭니다.
+"""
+import math
+import random
+import time
+from collections import defaultdict
+
+from django.db import connection
+from django.db.models import Max
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from accounts.models import User, Profile
+from .autocomplete import autocomplete
+from .cache import get_cache
+from .models import Brand, Product, Tag, SearchQueryLog
+from .search import build_document, get_search_backend
+
+BRANDS = ['나이키', '아디다스', '유니클로', '자라', '폴로', '리바이스', '칼하트', '노스페이스', '뉴발란스', '컨버스',
+          'nike', 'adidas', 'uniqlo', 'zara', 'polo', 'levis', 'carhartt', 'stussy', 'patagonia', 'champion']
+ADJECTIVES = ['빈티지', '오버핏', '크롭', '와이드', '스트라이프', '체크', '데님', '울', '린넨', '코듀로이',
+              'vintage', 'oversized', 'cropped', 'striped', 'wool']
+NOUNS = ['후드티', '맨투맨', '청바지', '셔츠', '코트', '자켓', '니트', '스커트', '원피스', '슬랙스', '가디건', '패딩',
+         'hoodie', 'sweatshirt', 'jeans', 'shirt', 'coat', 'jacket', 'knit', 'skirt']
+TAGS = ['빈티지', '스트릿', '캐주얼', '미니멀', '아메카지', '레트로', '오피스룩', '데이트룩', 'y2k', 'outdoor',
+        'workwear', 'preppy']
+SELLER_WORDS = ['빈티지', '구제', '옷장', '샵', '마켓', 'closet', 'store', 'vintage', '창고', '셀렉']
+
+ENDPOINTS = ('searching', 'product_search', 'tag_search')
+
+
+def percentile(values, rank):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[max(math.ceil(len(values) * rank) - 1, 0)]
+
+
+class SyntheticCatalog:
+    """
+    size 개의 상품을 가진 가상 catalog 입니다. 생성한 상품의 text 를 메모리에 두고 ground truth 계산에 사용합니다.
+    """
+
+    def __init__(self, size, seed=0):
+        self.size = size
+        self.random = random.Random(seed)
+        self.texts = {}  # product_id: 상품 document 의 원문 (소문자)
+        self.tag_ids = []
+        self.ground_truth = {}
+
+    def create(self, batch_size=5000):
+        brands = {name: Brand.objects.get_or_create(name=name)[0] for name in BRANDS}
+        tags = {name: Tag.objects.get_or_create(tag=name)[0] for name in TAGS}
+        self.tag_ids = [tag.id for tag in tags.values()]
+        sellers = self.create_sellers(max(self.size // 100, 1))
+
+        next_id = (Product.objects.aggregate(max_id=Max('id'))['max_id'] or 0) + 1
+        tag_counts = defaultdict(int)
+        search_backend = get_search_backend()
+        for start in range(0, self.size, batch_size):
+            products, relations, documents = [], [], {}
+            for product_id in range(next_id + start, next_id + min(start + batch_size, self.size)):
+                brand = self.random.choice(BRANDS)
+                name = '{} {} {}'.format(brand, self.random.choice(ADJECTIVES), self.random.choice(NOUNS))
+                content = '{} {} 입니다'.format(self.random.choice(ADJECTIVES), self.random.choice(NOUNS))
+                tag_names = self.random.sample(TAGS, self.random.randint(1, 3))
+                price = self.random.randint(1, 100) * 1000
+                products.append(Product(id=product_id, name=name, brand=brands[brand], price=price,
+                                        discounted_price=price, content=content,
+                                        seller_id=self.random.choice(sellers)))
+                for tag_name in tag_names:
+                    relations.append(Product.tag.through(product_id=product_id, tag_id=tags[tag_name].id))
+                    tag_counts[tags[tag_name].id] += 1
+                documents[product_id] = build_document(name, brand, content, tag_names)
+                self.texts[product_id] = ' '.join([name, content] + tag_names).lower()
+            Product.objects.bulk_create(products)
+            Product.tag.through.objects.bulk_create(relations)
+            search_backend.index_documents(documents)
+
+        for tag_id, count in tag_counts.items():
+            Tag.increase_product_count([tag_id], count)
+        autocomplete.load()
+
+    def create_sellers(self, count):
+        next_id = (User.objects.aggregate(max_id=Max('id'))['max_id'] or 0) + 1
+        users = []
+        for i in range(count):
+            nickname = '{}{}{}'.format(self.random.choice(SELLER_WORDS), self.random.choice(SELLER_WORDS), i)
+            users.append(User(id=next_id + i, email='benchmark{}@pepup.com'.format(next_id + i),
+                              nickname=nickname, phone='bench{}'.format(next_id + i)))
+        User.objects.bulk_create(users)
+        Profile.objects.bulk_create([Profile(user_id=user.id) for user in users])
+        return [user.id for user in users]
+
+    def get_ground_truth(self, query):
+        """
+        query 의 단어가 모두 상품명/설명/태그에 포함된 상품 id
+        """
+        words = tuple(query.lower().split())
+        if words not in self.ground_truth:
+            self.ground_truth[words] = {product_id for product_id, text in self.texts.items()
+                                        if all(word in text for word in words)}
+        return self.ground_truth[words]
+
+    def generate_queries(self, count):
+        """
+        (endpoint, query) 를 실제 검색처럼 몇개의 인기 검색어에 몰리도록 생성합니다.
+        """
+        keywords = BRANDS + NOUNS + TAGS + ['{} {}'.format(adjective, noun) for adjective in ADJECTIVES[:5]
+                                            for noun in NOUNS[:6]]
+        weights = [1 / (rank + 1) for rank in range(len(keywords))]
+        queries = []
+        for _ in range(count):
+            keyword = self.random.choices(keywords, weights=weights)[0]
+            endpoint = self.random.choices(ENDPOINTS, weights=[5, 3, 2])[0]
+            if endpoint == 'searching':
+                # 입력 중인 검색어
+                keyword = keyword[:self.random.randint(1, len(keyword))]
+            elif endpoint == 'tag_search':
+                keyword = self.random.choice(self.tag_ids)
+            queries.append((endpoint, keyword))
+        return queries
+
+
+def get_logged_queries(count):
+    """
+    SearchQueryLog 에 기록된 최근 query 를 (endpoint, query) 로 return 합니다.
+    """
+    endpoints = {SearchQueryLog.PRODUCT: 'product_search', SearchQueryLog.TAG: 'tag_search'}
+    logs = SearchQueryLog.objects.order_by('-id').values_list('kind', 'query')[:count]
+    return [(endpoints[kind], query) for kind, query in logs]
+
+
+class SearchBenchmark:
+
+    def __init__(self, user, catalog=None, k=10):
+        from .views import SearchViewSet
+
+        self.user = user
+        self.catalog = catalog
+        self.k = k
+        self.factory = APIRequestFactory()
+        self.views = {
+            'searching': SearchViewSet.as_view({'post': 'searching'}),
+            'product_search': SearchViewSet.as_view({'post': 'product_search'}),
+            'tag_search': SearchViewSet.as_view({'get': 'tag_search'}),
+        }
+
+    def request(self, endpoint, query):
+        if endpoint == 'tag_search':
+            request = self.factory.get('/api/search/tag_search/{}/'.format(query))
+            kwargs = {'pk': query}
+        else:
+            request = self.factory.post('/api/search/{}/'.format(endpoint), {'keyword': query}, format='json')
+            kwargs = {}
+        force_authenticate(request, user=self.user)
+        return self.views[endpoint](request, **kwargs)
+
+    def get_recall(self, query, response):
+        truth = self.catalog.get_ground_truth(query)
+        if not truth:
+            return None
+        found = {product['id'] for product in response.data['results'][:self.k]}
+        return len(found & truth) / min(self.k, len(truth))
+
+    def run(self, queries):
+        latencies = defaultdict(list)
+        query_counts = defaultdict(list)
+        recalls = []
+        get_cache().clear()
+        for endpoint, query in queries:
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = self.request(endpoint, query)
+                latencies[endpoint].append((time.perf_counter() - started) * 1000)
+            query_counts[endpoint].append(len(context.captured_queries))
+            if endpoint == 'product_search' and self.catalog is not None and response.status_code == 200:
+                recall = self.get_recall(query, response)
+                if recall is not None:
+                    recalls.append(recall)
+
+        report = {}
+        for endpoint in ENDPOINTS:
+            if not latencies[endpoint]:
+                continue
+            report[endpoint] = {
+                'requests': len(latencies[endpoint]),
+                'p50': round(percentile(latencies[endpoint], 0.50), 2),
+                'p95': round(percentile(latencies[endpoint], 0.95), 2),
+                'p99': round(percentile(latencies[endpoint], 0.99), 2),
+                'queries': round(sum(query_counts[endpoint]) / len(query_counts[endpoint]), 2),
+            }
+        if recalls and 'product_search' in report:
+            report['product_search']['recall@{}'.format(self.k)] = round(sum(recalls) / len(recalls), 4)
+        return report
@@ -0,0 +1,53 @@
+"""
+상품 상세(ProductViewSet.retrieve) 에서 유저와 무관한 부분(product, delivery_policy, 연관 상품 id)을
+상품별로 캐싱합니다. 캐시는 api.signals 에서 상품 관련 모델이 바뀔 때 삭제됩니다.
+"""
+from django.conf import settings
+from django.core.cache import caches
+
+PRODUCT_DETAIL_KEY = 'product-detail:{}'
+PRODUCT_DETAIL_HIT_KEY = 'product-detail-stats:hit'
+PRODUCT_DETAIL_MISS_KEY = 'product-detail-stats:miss'
+
+
+def get_cache():
+    return caches[getattr(settings, 'PRODUCT_DETAIL_CACHE', 'default')]
+
+
+def _increase(key):
+    cache = get_cache()
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # add 와 incr 사이에 key 가 만료된 경우
+        cache.set(key, 1, timeout=None)
+
+
+def get_product_detail(pk):
+    data = get_cache().get(PRODUCT_DETAIL_KEY.format(pk))
+    _increase(PRODUCT_DETAIL_HIT_KEY if data is not None else PRODUCT_DETAIL_MISS_KEY)
+    return data
+
+
+def set_product_detail(pk, data):
+    timeout = getattr(settings, 'PRODUCT_DETAIL_CACHE_TIMEOUT', 60 * 10)
+    get_cache().set(PRODUCT_DETAIL_KEY.format(pk), data, timeout=timeout)
+
+
+def invalidate_product_detail(product_ids):
+    keys = [PRODUCT_DETAIL_KEY.format(pk) for pk in product_ids]
+    if keys:
+        get_cache().delete_many(keys)
+
+
+def get_product_detail_stats():
+    cache = get_cache()
+    hit = cache.get(PRODUCT_DETAIL_HIT_KEY, 0)
+    miss = cache.get(PRODUCT_DETAIL_MISS_KEY, 0)
+    total = hit + miss
+    return {
+        'hit': hit,
+        'miss': miss,
+        'hit_rate': round(hit / total, 4) if total else 0.0,
+    }
@@ -0,0 +1,67 @@
+from collections import OrderedDict
+
+from django.db.models import Count
+
+# request key -> ProductFacet column
+FACET_FIELDS = [
+    ('gender', 'gender_id'),
+    ('first_category', 'first_category_id'),
+    ('second_category', 'second_category_id'),
+    ('size', 'size_id'),
+    ('brand', 'brand_id'),
+]
+
+# True 인 상품 개수만 집계하는 facet
+FLAG_FACET_FIELDS = [
+    ('on_sale', 'on_discount'),
+    ('free_delivery', 'free_delivery'),
+]
+
+
+def get_facet_filters(filter_data):
+    """
+    filter api 의 request body 를 ProductFacet 조회 조건으로 변환합니다.
+    on_sale 인 경우 가격 범위는 할인가(discounted_price) 기준입니다.
+    """
+    filters = {}
+    for key, field in FACET_FIELDS:
+        if key in filter_data:
+            filters[field] = filter_data.get(key)
+
+    price_field = 'price'
+    if filter_data.get('on_sale'):
+        filters['on_discount'] = True
+        price_field = 'discounted_price'
+
+    if 'lower_price' in filter_data:
+        filters['{}__gte'.format(price_field)] = filter_data.get('lower_price')
+
+    if 'higher_price' in filter_data:
+        filters['{}__lte'.format(price_field)] = filter_data.get('higher_price')
+
+    if 'free_delivery' in filter_data:
+        filters['free_delivery'] = True
+
+    return filters
+
+
+def get_facet_counts(queryset, filters):
+    """
+    facet 별 상품 개수를 return 합니다.
+    각 facet 은 자신의 조건을 뺀 나머지 조건으로 집계하므로, 해당 facet 의 값을 바꿨을 때의 상품 개수가 됩니다.
+    """
+    counts = OrderedDict()
+    for key, field in FACET_FIELDS:
+        other_filters = {k: v for k, v in filters.items() if k != field}
+        rows = queryset.filter(**other_filters)\
+            .filter(**{'{}__isnull'.format(field): False})\
+            .values(field)\
+            .annotate(count=Count('pk'))\
+            .order_by('-count')
+        counts[key] = [{'id': row[field], 'count': row['count']} for row in rows]
+
+    for key, field in FLAG_FACET_FIELDS:
+        other_filters = {k: v for k, v in filters.items() if k != field}
+        counts[key] = queryset.filter(**other_filters).filter(**{field: True}).count()
+
+    return counts
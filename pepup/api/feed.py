@@ -0,0 +1,129 @@
+from django.conf import settings
+from django.db.models import IntegerField, OuterRef, Subquery, Value
+from django.db.models import Q as q
+from django.db.models.functions import Coalesce
+
+from .models import Product, Follow, FeedItem, StoreStats
+
+
+def get_fan_out_limit():
+    return getattr(settings, 'FOLLOW_FEED_FANOUT_LIMIT', 5000)
+
+
+def get_backfill_count():
+    return getattr(settings, 'FOLLOW_FEED_BACKFILL_COUNT', 50)
+
+
+def is_fan_out_on_read(seller_id):
+    """
+    follower 가 많은 판매자는 상품 등록시 inbox 에 넣지 않고 조회 시점에 합칩니다.
+    """
+    return StoreStats.objects.filter(user_id=seller_id, follower_count__gte=get_fan_out_limit()).exists()
+
+
+def add_seller_items(user_ids, products):
+    """
+    판매자 follow 로 들어온 상품을 inbox 에 넣습니다. 이미 태그로 들어와 있던 상품은 by 만 seller 로 바꿉니다.
+    """
+    product_ids = [product.id for product in products]
+    if not user_ids or not product_ids:
+        return
+    FeedItem.objects.filter(user_id__in=user_ids, product_id__in=product_ids, by=FeedItem.BY_TAG)\
+        .update(by=FeedItem.BY_SELLER)
+    FeedItem.objects.bulk_create(
+        [FeedItem(user_id=user_id, product_id=product_id, by=FeedItem.BY_SELLER)
+         for user_id in user_ids for product_id in product_ids],
+        ignore_conflicts=True
+    )
+
+
+def add_tag_items(user_ids, products, tag_id):
+    """
+    태그 follow 로 들어온 상품을 inbox 에 넣습니다. 이미 판매자로 들어와 있던 상품은 follow 한 태그만 기록합니다.
+    """
+    product_ids = [product.id for product in products]
+    if not user_ids or not product_ids:
+        return
+    FeedItem.objects.filter(user_id__in=user_ids, product_id__in=product_ids, tag__isnull=True)\
+        .update(tag_id=tag_id)
+    FeedItem.objects.bulk_create(
+        [FeedItem(user_id=user_id, product_id=product_id, by=FeedItem.BY_TAG, tag_id=tag_id)
+         for user_id in user_ids for product_id in product_ids],
+        ignore_conflicts=True
+    )
+
+
+def fan_out_to_seller_followers(product):
+    if is_fan_out_on_read(product.seller_id):
+        return
+    follower_ids = list(Follow.objects.filter(_to_id=product.seller_id, is_follow=True)
+                        .values_list('_from_id', flat=True))
+    add_seller_items(follower_ids, [product])
+
+
+def fan_out_to_tag_followers(product, tag_ids):
+    follows = Follow.objects.filter(tag_id__in=tag_ids, is_follow=True).values_list('tag_id', '_from_id')
+    followers_by_tag = {}
+    for tag_id, user_id in follows:
+        followers_by_tag.setdefault(tag_id, []).append(user_id)
+    for tag_id, user_ids in followers_by_tag.items():
+        add_tag_items(user_ids, [product], tag_id)
+
+
+def backfill_follow(follow):
+    """
+    새로 follow 한 판매자/태그의 최근 상품을 inbox 에 채웁니다.
+    """
+    products = Product.objects.filter(is_active=True).order_by('-id')
+    if follow._to_id:
+        if is_fan_out_on_read(follow._to_id):
+            return
+        add_seller_items([follow._from_id], products.filter(seller_id=follow._to_id)[:get_backfill_count()])
+    elif follow.tag_id:
+        add_tag_items([follow._from_id], products.filter(tag__id=follow.tag_id)[:get_backfill_count()],
+                      follow.tag_id)
+
+
+def remove_follow(follow):
+    """
+    unfollow 한 판매자/태그로 들어온 상품을 inbox 에서 뺍니다.
+    다른 follow 로도 들어온 상품은 남겨둡니다.
+    """
+    items = FeedItem.objects.filter(user_id=follow._from_id)
+    if follow._to_id:
+        items = items.filter(product__seller_id=follow._to_id, by=FeedItem.BY_SELLER)
+        items.filter(tag__isnull=True).delete()
+        items.update(by=FeedItem.BY_TAG)
+    elif follow.tag_id:
+        items = items.filter(tag_id=follow.tag_id)
+        # 아직 follow 중인 다른 태그가 달린 상품은 그 태그로 남겨둡니다.
+        followed_tags = Follow.objects.filter(_from_id=follow._from_id, is_follow=True, tag__isnull=False)\
+            .exclude(tag_id=follow.tag_id).values('tag_id')
+        relations = Product.tag.through.objects\
+            .filter(product_id__in=items.values('product_id'), tag_id__in=followed_tags)\
+            .values_list('product_id', 'tag_id')
+        products_by_tag = {}
+        for product_id, tag_id in dict(relations).items():
+            products_by_tag.setdefault(tag_id, []).append(product_id)
+        for tag_id, product_ids in products_by_tag.items():
+            items.filter(product_id__in=product_ids).update(tag_id=tag_id)
+        items.filter(by=FeedItem.BY_TAG).delete()
+        items.update(tag=None)
+
+
+def get_feed_queryset(user):
+    """
+    user 의 inbox 상품과 fan-out 하지 않는(follower 가 많은) follow 판매자의 상품을 합친 queryset 입니다.
+    feed_by, feed_tag_id 는 FollowSerializer 의 by, follow_tag 에 사용됩니다.
+    """
+    inbox = FeedItem.objects.filter(user=user)
+    on_read_sellers = Follow.objects\
+        .filter(_from=user, is_follow=True, _to__store_stats__follower_count__gte=get_fan_out_limit())\
+        .values('_to_id')
+    item = inbox.filter(product=OuterRef('pk'))
+    return Product.objects\
+        .filter(is_active=True)\
+        .filter(q(id__in=inbox.values('product_id')) | q(seller_id__in=on_read_sellers))\
+        .annotate(feed_by=Coalesce(Subquery(item.values('by')[:1]), Value(FeedItem.BY_SELLER),
+                                   output_field=IntegerField()),
+                  feed_tag_id=Subquery(item.values('tag_id')[:1]))
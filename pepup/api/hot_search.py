@@ -0,0 +1,164 @@
+"""
+검색 query log 와 hot query 결과 캐시입니다.
+
+최근 HOT_SEARCH_WINDOW 동안 가장 많이 검색된 HOT_SEARCH_SIZE 개 query 의 첫 페이지(상품 id, 전체 개수)를
+캐시에 둡니다. 캐시 backend(locmem, redis) 의 LRU 정리와 HOT_SEARCH_TIMEOUT 으로 크기와 수명이 제한되며,
+warm_search_cache command 로 미리 채우고, 상품이 바뀌면 api.signals 에서 해당 상품에 매칭되는 query 만 지웁니다.
+"""
+import datetime
+import hashlib
+import math
+import time
+
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .cache import get_cache
+from .models import Product, SearchQueryLog
+from .search import build_document, search_products, tokenize
+
+HOT_SEARCH_PAGE_KEY = 'hot-search:{}:{}'
+HOT_SEARCH_QUERIES_KEY = 'hot-search-queries:{}'
+
+
+def get_hot_search_size():
+    return getattr(settings, 'HOT_SEARCH_SIZE', 300)
+
+
+def get_hot_search_timeout():
+    return getattr(settings, 'HOT_SEARCH_TIMEOUT', 60 * 10)
+
+
+def get_hot_search_window():
+    return datetime.timedelta(hours=getattr(settings, 'HOT_SEARCH_WINDOW_HOURS', 24))
+
+
+def normalize_query(query):
+    return ' '.join(str(query).lower().split())[:100]
+
+
+def get_page_key(kind, query):
+    return HOT_SEARCH_PAGE_KEY.format(kind, hashlib.md5(query.encode()).hexdigest())
+
+
+class SearchTimer:
+    """
+    with SearchTimer(kind, query, user) as timer: ... timer.cached = True
+    블록이 끝나면 SearchQueryLog 에 latency 와 함께 기록합니다.
+    """
+
+    def __init__(self, kind, query, user=None):
+        self.kind = kind
+        self.query = normalize_query(query)
+        self.user = user if user is not None and user.is_authenticated else None
+        self.cached = False
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            latency = (time.perf_counter() - self.started) * 1000
+            SearchQueryLog.objects.create(kind=self.kind, query=self.query, user=self.user,
+                                          latency=latency, cached=self.cached)
+        return False
+
+
+def get_hot_queries(kind, refresh=False):
+    """
+    최근 가장 많이 검색된 query 의 set 을 return 합니다. (HOT_SEARCH_TIMEOUT 동안 캐싱)
+    """
+    key = HOT_SEARCH_QUERIES_KEY.format(kind)
+    queries = None if refresh else get_cache().get(key)
+    if queries is None:
+        since = timezone.now() - get_hot_search_window()
+        queries = set(SearchQueryLog.objects.filter(kind=kind, created_at__gte=since)
+                      .values('query')
+                      .annotate(count=Count('id'))
+                      .order_by('-count')
+                      .values_list('query', flat=True)[:get_hot_search_size()])
+        get_cache().set(key, queries, timeout=get_hot_search_timeout())
+    return queries
+
+
+def get_page(kind, query):
+    """
+    캐시된 첫 페이지 (count, product_ids) 를 return 합니다. 없으면 None
+    """
+    return get_cache().get(get_page_key(kind, normalize_query(query)))
+
+
+def set_page(kind, query, count, product_ids):
+    query = normalize_query(query)
+    if query in get_hot_queries(kind):
+        get_cache().set(get_page_key(kind, query), (count, list(product_ids)), timeout=get_hot_search_timeout())
+
+
+def get_product_search_queryset(query):
+    return search_products(Product.objects.filter(is_active=True), query)
+
+
+def warm(page_sizes):
+    """
+    hot query 의 첫 페이지를 캐시에 채웁니다. warm_search_cache command 에서 주기적으로 호출합니다.
+    :param page_sizes: {kind: 첫 페이지 상품 수}
+    """
+    count = 0
+    builders = {
+        SearchQueryLog.PRODUCT: get_product_search_queryset,
+    }
+    for kind, builder in builders.items():
+        for query in get_hot_queries(kind, refresh=True):
+            queryset = builder(query)
+            product_ids = list(queryset.values_list('id', flat=True)[:page_sizes[kind]])
+            set_page(kind, query, queryset.count(), product_ids)
+            count += 1
+    return count
+
+
+def invalidate_product(product, previous=None):
+    """
+    product 가 결과에 포함될 수 있는 hot query(query token 이 모두 상품 document 에 있는 경우) 의 캐시를 지웁니다.
+    :param previous: 저장 전 {'name', 'content', 'brand__name'}. 주어지면 수정 전 document 에 매칭되던 query 도 지웁니다.
+    """
+    product_queries = get_hot_queries(SearchQueryLog.PRODUCT)
+    if not product_queries:
+        return
+    tag_names = [tag.tag for tag in product.tag.all()]
+    documents = [set(build_document(product.name, product.brand.name, product.content, tag_names))]
+    if previous is not None:
+        documents.append(set(build_document(previous['name'], previous['brand__name'], previous['content'],
+                                            tag_names)))
+    keys = []
+    for query in product_queries:
+        query_tokens = tokenize(query)
+        if query_tokens and any(query_tokens <= tokens for tokens in documents):
+            keys.append(get_page_key(SearchQueryLog.PRODUCT, query))
+    if keys:
+        get_cache().delete_many(keys)
+
+
+def get_stats():
+    """
+    검색 종류별 요청 수, 캐시 hit rate, p95 latency(ms) 를 return 합니다.
+    """
+    since = timezone.now() - get_hot_search_window()
+    stats = {}
+    for kind, _ in SearchQueryLog.KIND_CHOICES:
+        logs = SearchQueryLog.objects.filter(kind=kind, created_at__gte=since)
+        counts = logs.order_by().aggregate(count=Count('id'), hit=Count('id', filter=Q(cached=True)))
+        count, hit = counts['count'], counts['hit']
+        p95 = 0.0
+        if count:
+            # 전체를 읽지 않고 latency 순으로 p95 위치의 값 하나만 조회합니다.
+            offset = max(math.ceil(count * 0.95) - 1, 0)
+            p95 = round(logs.order_by('latency').values_list('latency', flat=True)[offset], 2)
+        stats[kind] = {
+            'count': count,
+            'hit': hit,
+            'hit_rate': round(hit / count, 4) if count else 0.0,
+            'p95': p95,
+        }
+    return stats
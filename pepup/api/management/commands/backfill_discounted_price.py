@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Product 의 저장된 할인가(discounted_price)를 price, discount_rate 로부터 다시 계산합니다.'
+
+    def handle(self, *args, **options):
+        count = Product.objects.all().update_discounted_price()
+        self.stdout.write(self.style.SUCCESS('{} products backfilled'.format(count)))
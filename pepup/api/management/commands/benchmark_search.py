@@ -0,0 +1,49 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounts.models import User
+from api.benchmark import SyntheticCatalog, SearchBenchmark, get_logged_queries
+
+
+class Command(BaseCommand):
+    help = '가상 catalog 를 만들고 검색 api 의 latency, 쿼리 수, recall@k 를 측정합니다. ' \
+           '개발/benchmark 용 DB 에서 실행하세요. (--keep 이 없으면 생성한 데이터는 rollback 됩니다)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=10000, choices=[10000, 100000, 1000000],
+                            help='가상 상품 수')
+        parser.add_argument('--queries', type=int, default=1000, help='재생할 query 수')
+        parser.add_argument('--k', type=int, default=10, help='recall@k 의 k')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--from-log', action='store_true',
+                            help='가상 query 대신 SearchQueryLog 에 기록된 query 를 재생합니다. (recall 제외)')
+        parser.add_argument('--keep', action='store_true', help='생성한 catalog 를 rollback 하지 않습니다.')
+        parser.add_argument('--json', action='store_true', help='결과를 json 으로 출력합니다.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            catalog = SyntheticCatalog(options['size'], seed=options['seed'])
+            catalog.create()
+            user, _ = User.objects.get_or_create(email='benchmark@pepup.com',
+                                                 defaults={'nickname': 'benchmark', 'phone': 'benchmark'})
+
+            if options['from_log']:
+                queries = get_logged_queries(options['queries'])
+                benchmark = SearchBenchmark(user, k=options['k'])
+            else:
+                queries = catalog.generate_queries(options['queries'])
+                benchmark = SearchBenchmark(user, catalog=catalog, k=options['k'])
+            report = benchmark.run(queries)
+
+            if not options['keep']:
+                transaction.set_rollback(True)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write('products: {}, queries: {}'.format(options['size'], len(queries)))
+        for endpoint, row in report.items():
+            self.stdout.write('{:<16} '.format(endpoint) + '  '.join(
+                '{}={}'.format(key, value) for key, value in row.items()))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api.feed import backfill_follow
+from api.models import Follow
+
+
+class Command(BaseCommand):
+    help = '모든 follow 에 대해 follow feed inbox(FeedItem) 를 최근 상품으로 채웁니다.'
+
+    def handle(self, *args, **options):
+        count = 0
+        for follow in Follow.objects.filter(is_follow=True, _from__isnull=False).iterator():
+            backfill_follow(follow)
+            count += 1
+        self.stdout.write(self.style.SUCCESS('{} follows backfilled'.format(count)))
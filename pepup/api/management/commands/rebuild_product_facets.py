@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Product, ProductFacet
+
+
+class Command(BaseCommand):
+    help = 'Product 로부터 ProductFacet 테이블을 다시 생성합니다.'
+
+    def handle(self, *args, **options):
+        products = Product.objects\
+            .select_related('first_category', 'seller__delivery_policy', 'prodthumbnail')
+        count = 0
+        for product in products.iterator():
+            ProductFacet.sync(product)
+            count += 1
+        self.stdout.write(self.style.SUCCESS('{} product facets rebuilt'.format(count)))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Product
+from api.recommend import rebuild_related_products
+
+
+class Command(BaseCommand):
+    help = '모든 상품의 연관 상품(RelatedProduct) top-K 를 다시 계산합니다.'
+
+    def handle(self, *args, **options):
+        count = 0
+        for product in Product.objects.filter(is_active=True).iterator():
+            rebuild_related_products(product)
+            count += 1
+        self.stdout.write(self.style.SUCCESS('{} products rebuilt'.format(count)))
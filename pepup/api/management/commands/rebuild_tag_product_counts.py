@@ -0,0 +1,17 @@
+from django.db.models import Count, Q
+from django.core.management.base import BaseCommand
+
+from api.models import Tag
+
+
+class Command(BaseCommand):
+    help = '판매중인 상품 기준으로 Tag.product_count 를 다시 계산합니다.'
+
+    def handle(self, *args, **options):
+        tags = Tag.objects.annotate(count=Count('product', filter=Q(product__is_active=True)))
+        fixed = 0
+        for tag in tags.iterator():
+            if tag.product_count != tag.count:
+                Tag.objects.filter(id=tag.id).update(product_count=tag.count)
+                fixed += 1
+        self.stdout.write(self.style.SUCCESS('{} tags updated'.format(fixed)))
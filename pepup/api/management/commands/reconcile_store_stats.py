@@ -0,0 +1,64 @@
+import datetime
+
+from django.db.models import Count, Sum
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import Follow, Product, StoreStats
+from payment.models import Review, Trade
+
+# 결제완료 ~ 정산완료
+SOLD_DEAL_STATUS = [2, 3, 4, 5, 6]
+
+
+class Command(BaseCommand):
+    help = 'Review, Follow, Product, Deal 로부터 StoreStats 를 다시 계산하여 어긋난 counter 를 바로잡습니다. ' \
+           '(recent_sold_count 를 위해 매일 실행)'
+
+    def handle(self, *args, **options):
+        stats = {}
+
+        def get(user_id):
+            return stats.setdefault(user_id, {
+                'review_count': 0, 'review_sum': 0, 'follower_count': 0, 'following_count': 0,
+                'product_count': 0, 'recent_sold_count': 0,
+            })
+
+        for row in Review.objects.values('seller').annotate(count=Count('id'), total=Sum('satisfaction')).order_by():
+            get(row['seller']).update(review_count=row['count'], review_sum=row['total'])
+
+        followers = Follow.objects.filter(is_follow=True, _to__isnull=False)\
+            .values('_to').annotate(count=Count('id'))
+        for row in followers:
+            get(row['_to'])['follower_count'] = row['count']
+
+        followings = Follow.objects.filter(is_follow=True, tag__isnull=True, _from__isnull=False)\
+            .values('_from').annotate(count=Count('id'))
+        for row in followings:
+            get(row['_from'])['following_count'] = row['count']
+
+        products = Product.objects.filter(is_active=True).values('seller').annotate(count=Count('id')).order_by()
+        for row in products:
+            get(row['seller'])['product_count'] = row['count']
+
+        # 최근 판매 : 결제완료 시각(Deal.transaction_completed_date) 기준, 환불되지 않은 거래의 상품 수
+        since = timezone.now() - datetime.timedelta(days=StoreStats.RECENT_SOLD_DAYS)
+        sold = Trade.objects.filter(deal__status__in=SOLD_DEAL_STATUS, deal__transaction_completed_date__gte=since)\
+            .values('seller').annotate(count=Count('id')).order_by()
+        for row in sold:
+            get(row['seller'])['recent_sold_count'] = row['count']
+
+        # 집계 결과가 없는 기존 row 는 0 으로
+        for user_id in StoreStats.objects.exclude(user_id__in=stats.keys()).values_list('user_id', flat=True):
+            get(user_id)
+
+        fixed = 0
+        existing = StoreStats.objects.in_bulk(list(stats.keys()))
+        for user_id, values in stats.items():
+            current = existing.get(user_id)
+            if current and all(getattr(current, field) == value for field, value in values.items()):
+                continue
+            StoreStats.objects.update_or_create(user_id=user_id, defaults=values)
+            fixed += 1
+        StoreStats.objects.update(seller_score=StoreStats.get_seller_score_expression())
+        self.stdout.write(self.style.SUCCESS('{} store stats reconciled'.format(fixed)))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from api import hot_search, postings
+from api.models import SearchQueryLog
+from api.pagination import ProductSearchResultPagination
+
+
+class Command(BaseCommand):
+    help = '최근 많이 검색된 query 의 첫 페이지, 태그의 posting list 를 캐시에 채웁니다. ' \
+           '(cron 으로 HOT_SEARCH_TIMEOUT 보다 짧게 실행)'
+
+    def handle(self, *args, **options):
+        count = hot_search.warm({
+            SearchQueryLog.PRODUCT: ProductSearchResultPagination.page_size,
+        })
+        tag_ids = hot_search.get_hot_queries(SearchQueryLog.TAG, refresh=True)
+        for tag_id in tag_ids:
+            postings.build(int(tag_id))
+        self.stdout.write(self.style.SUCCESS('{} queries, {} tags warmed'.format(count, len(tag_ids))))
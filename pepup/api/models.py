@@ -6,9 +6,12 @@ import requests
 from django.core.files import File
 from django.core.files.uploadedfile import InMemoryUploadedFile
 from django.db import models
+from django.db.models import F, ExpressionWrapper, OuterRef, Subquery
+from django.db.models.functions import Ceil
 from django.conf import settings
 import math
 from core.fields import S3ImageKeyField
+from .cache import invalidate_product_detail
 from imagekit.models import ProcessedImageField
 from imagekit.processors import ResizeToFill
 import urllib.request
@@ -93,10 +96,35 @@ class Size(models.Model):
 
 class Tag(models.Model):
     tag = models.CharField(max_length=30)
+    # 판매중(is_active) 상품 수. Product.tag 변경(api.signals)과 상품 삭제시 갱신됩니다.
+    product_count = models.IntegerField(default=0, db_index=True, verbose_name='상품 수')
+
+    class Meta:
+        index_together = ['tag', 'product_count']
 
     def __str__(self):
         return self.tag
 
+    @classmethod
+    def increase_product_count(cls, tag_ids, delta):
+        if tag_ids and delta:
+            cls.objects.filter(id__in=tag_ids).update(product_count=F('product_count') + delta)
+
+
+class ProductQuerySet(models.QuerySet):
+
+    def update_discounted_price(self):
+        """
+        discount_rate 를 bulk 로 수정했을 때(queryset.update, admin action) 저장된 할인가를 한번의 update 로 다시 계산합니다.
+        """
+        count = self.update(discounted_price=ExpressionWrapper(
+            Ceil((F('price') * (1 - F('discount_rate'))) / 100) * 100,
+            output_field=models.IntegerField()))
+        ProductFacet.objects.filter(product__in=self).update(discounted_price=Subquery(
+            Product.objects.filter(pk=OuterRef('product_id')).values('discounted_price')[:1]))
+        invalidate_product_detail(self.values_list('id', flat=True))
+        return count
+
 
 class Product(models.Model):
     SOLD_STATUS = [
@@ -116,12 +144,15 @@ class Product(models.Model):
     sold_status = models.IntegerField(choices=SOLD_STATUS, null=True, blank=True)
     on_discount = models.BooleanField(default=False, verbose_name='세일중')
     discount_rate = models.FloatField(default=0, verbose_name='할인율')
+    discounted_price = models.IntegerField(default=0, db_index=True, verbose_name='할인가')
     first_category = models.ForeignKey(FirstCategory, on_delete=models.CASCADE, null=True)
     second_category = models.ForeignKey(SecondCategory, on_delete=models.CASCADE, null=True)
     is_refundable = models.BooleanField(default=False)
     tag = models.ManyToManyField(Tag)
     is_active = models.BooleanField(default=True)
 
+    objects = ProductQuerySet.as_manager()
+
     # todo:
     # 환불가능, 사이즈(카테고리화: 남자->XL),
     # TODO : 판매완료(sold)시 할인율 수정하면 안됨! (정산시 꼬임) => 할인 상품 고르는 api에서 sold로 거르고, admin page
@@ -133,11 +164,31 @@ class Product(models.Model):
     def __str__(self):
         return self.name
 
-    @property
-    def discounted_price(self):
+    def save(self, *args, **kwargs):
+        self.discounted_price = self.calculate_discounted_price()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'discounted_price' not in update_fields:
+            kwargs['update_fields'] = list(update_fields) + ['discounted_price']
+        super(Product, self).save(*args, **kwargs)
+
+    def calculate_discounted_price(self):
         return math.ceil(self.price * (1 - self.discount_rate)/100) * 100
 
 
+class RelatedProduct(models.Model):
+    """
+    상품 상세의 연관 상품 테이블입니다.
+    같은 소분류에서 공유하는 태그가 많은 순서로 상품별 top-K 만 저장하며, api.recommend 에서 갱신됩니다.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_products')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_to')
+    score = models.PositiveIntegerField(default=0, help_text='공유하는 태그 수')
+
+    class Meta:
+        unique_together = ('product', 'related')
+        ordering = ['-score', '-related_id']
+
+
 def img_directory_path(instance, filename):
     return 'user/{}/products/{}'.format(instance.product.seller.email, filename)
 
@@ -215,3 +266,179 @@ class Follow(models.Model):
                             on_delete=models.CASCADE)
     tag = models.ForeignKey(Tag, blank=True, null=True, on_delete=models.CASCADE)
     is_follow = models.BooleanField(default=True)
+
+
+class ProductFacet(models.Model):
+    """
+    filter api 에서 사용하는 비정규화 상품 검색(facet) 테이블입니다.
+    Product, DeliveryPolicy, ProdThumbnail 이 바뀔 때 api.signals 에서 갱신되며,
+    join 없이 가격/카테고리/무료배송 조건을 index 로 조회합니다.
+    """
+    product = models.OneToOneField(Product, primary_key=True, on_delete=models.CASCADE, related_name='facet')
+    is_active = models.BooleanField(default=True, db_index=True)
+    sold = models.BooleanField(default=False)
+    is_refundable = models.BooleanField(default=False)
+    on_discount = models.BooleanField(default=False, db_index=True)
+    gender_id = models.IntegerField(null=True, db_index=True)
+    first_category_id = models.IntegerField(null=True, db_index=True)
+    second_category_id = models.IntegerField(null=True, db_index=True)
+    size_id = models.IntegerField(null=True, db_index=True)
+    brand_id = models.IntegerField(null=True, db_index=True)
+    price = models.IntegerField(db_index=True)
+    discounted_price = models.IntegerField(db_index=True)
+    free_delivery = models.BooleanField(default=False, db_index=True)
+    thumbnail = models.CharField(max_length=400, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-product_id']
+
+    @classmethod
+    def get_values(cls, product):
+        """
+        product 로부터 facet row 의 값을 계산합니다.
+        """
+        delivery_policy = getattr(product.seller, 'delivery_policy', None)
+        thumbnail = getattr(product, 'prodthumbnail', None)
+        return {
+            'is_active': product.is_active,
+            'sold': product.sold,
+            'is_refundable': product.is_refundable,
+            'on_discount': product.on_discount,
+            'gender_id': product.first_category.gender_id if product.first_category else None,
+            'first_category_id': product.first_category_id,
+            'second_category_id': product.second_category_id,
+            'size_id': product.size_id,
+            'brand_id': product.brand_id,
+            'price': product.price,
+            'discounted_price': product.discounted_price,
+            'free_delivery': bool(delivery_policy and delivery_policy.general == 0),
+            'thumbnail': thumbnail.image_url if thumbnail and thumbnail.thumbnail else None,
+        }
+
+    @classmethod
+    def sync(cls, product):
+        facet, _ = cls.objects.update_or_create(product=product, defaults=cls.get_values(product))
+        return facet
+
+
+class StoreStats(models.Model):
+    """
+    store 헤더(StoreSerializer, SimpleProfileSerializer)에서 사용하는 통계 counter cache 입니다.
+    Review 생성/수정/삭제(api.signals) 와 FollowViewSet.following 에서 같은 transaction 안에서 갱신되며,
+    reconcile_store_stats command 로 다시 계산할 수 있습니다.
+    product_count, recent_sold_count, seller_score 는 판매자 검색 순위(api.autocomplete)에 사용됩니다.
+    """
+    # seller_score = sum(field * weight)
+    SELLER_SCORE_WEIGHTS = {
+        'product_count': 1,
+        'recent_sold_count': 3,
+        'follower_count': 2,
+    }
+    # recent_sold_count 기간 (일)
+    RECENT_SOLD_DAYS = 30
+
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, primary_key=True, on_delete=models.CASCADE,
+                                related_name='store_stats')
+    review_count = models.IntegerField(default=0)
+    review_sum = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    follower_count = models.IntegerField(default=0)
+    following_count = models.IntegerField(default=0)
+    product_count = models.IntegerField(default=0, verbose_name='판매중 상품 수')
+    recent_sold_count = models.IntegerField(default=0, verbose_name='최근 판매 수')
+    seller_score = models.IntegerField(default=0, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def review_score(self):
+        if self.review_count:
+            return self.review_sum / self.review_count
+        return None
+
+    @classmethod
+    def get_for_user(cls, user):
+        """
+        select_related('store_stats') 된 user 의 통계를 return 합니다. 통계가 없으면 0 으로 채운 instance 입니다.
+        """
+        stats = getattr(user, 'store_stats', None)
+        if stats is None:
+            stats = cls(user_id=user.id)
+        return stats
+
+    @classmethod
+    def increase(cls, user_id, **deltas):
+        """
+        F expression 으로 counter 를 증감합니다. ex) StoreStats.increase(user.id, follower_count=1)
+        """
+        cls.objects.get_or_create(user_id=user_id)
+        stats = cls.objects.filter(user_id=user_id)
+        stats.update(**{field: F(field) + delta for field, delta in deltas.items()})
+        if cls.SELLER_SCORE_WEIGHTS.keys() & deltas.keys():
+            stats.update(seller_score=cls.get_seller_score_expression())
+
+    @classmethod
+    def get_seller_score_expression(cls):
+        fields = [F(field) * weight for field, weight in cls.SELLER_SCORE_WEIGHTS.items()]
+        expression = fields[0]
+        for field in fields[1:]:
+            expression = expression + field
+        return expression
+
+
+class FeedItem(models.Model):
+    """
+    follow feed inbox 입니다. (fan-out on write)
+    상품 등록시 판매자/태그 follower 의 inbox 에, follow 시 최근 상품이 backfill 되며 (api.feed)
+    follower 가 많은 판매자의 상품은 inbox 에 넣지 않고 조회 시점에 합칩니다.
+    """
+    BY_SELLER = 1
+    BY_TAG = 2
+    BY_CHOICES = (
+        (BY_SELLER, 'seller'),
+        (BY_TAG, 'tag'),
+    )
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='feed_items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='feed_items')
+    by = models.IntegerField(choices=BY_CHOICES, default=BY_SELLER)
+    tag = models.ForeignKey(Tag, null=True, blank=True, on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['user', 'product']
+        index_together = ['user', 'product']
+
+
+class ProductSearchToken(models.Model):
+    """
+    상품 검색 index(api.search.DatabaseSearchBackend) 의 n-gram token 입니다.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='search_tokens')
+    token = models.CharField(max_length=10)
+    weight = models.IntegerField(default=1)
+
+    class Meta:
+        unique_together = ['token', 'product']
+
+
+class SearchQueryLog(models.Model):
+    """
+    검색 요청 log 입니다. (append-only)
+    hot query 선정(api.hot_search)과 검색 종류별 hit rate, latency 통계에 사용됩니다.
+    """
+    PRODUCT = 'product'
+    TAG = 'tag'
+    KIND_CHOICES = (
+        (PRODUCT, '상품 검색'),
+        (TAG, '태그 검색'),
+    )
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    query = models.CharField(max_length=100)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    latency = models.FloatField(verbose_name='응답시간(ms)')
+    cached = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        index_together = ['kind', 'created_at']
@@ -1,5 +1,5 @@
 from rest_framework.response import Response
-from core.pagination import PepupPagination
+from core.pagination import PepupPagination, PepupCursorPagination
 from collections import OrderedDict
 
 
@@ -7,17 +7,94 @@ class HomePagination(PepupPagination):
     page_size = 51  # 한페이지에 담기는 개수
 
 
+class HomeCursorPagination(PepupCursorPagination):
+    """
+    home feed 용 keyset(cursor) pagination 입니다.
+    id 역순으로 다음 페이지를 조회하므로 OFFSET scan 과 COUNT 쿼리가 없고,
+    상품이 새로 등록되어도 페이지가 밀리지 않습니다.
+    """
+    page_size = 51
+    ordering = '-id'
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+
+class FilterPagination(PepupPagination):
+    page_size = 51
+
+    def get_paginated_response(self, data, facets=None):
+
+        return Response(OrderedDict([
+            ('count', self.page.paginator.count),
+            ('next', self.get_next_page_num()),
+            ('previous', self.get_prev_page_num()),
+            ('facets', facets),
+            ('results', data)
+        ]))
+
+
 class FollowPagination(PepupPagination):
     page_size = 20  # 한페이지에 담기는 개수
 
 
-class ProductSearchResultPagination(PepupPagination):
+class FollowCursorPagination(PepupCursorPagination):
+    """
+    follow feed(inbox) 용 cursor pagination 입니다.
+    """
+    page_size = 20
+    ordering = '-id'
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+
+class FirstPageResponseMixin:
+    """
+    캐시된 첫 페이지(api.hot_search)를 paginate 하지 않고 같은 형태로 return 합니다.
+    """
+
+    def is_first_page(self, request):
+        return request.query_params.get(self.page_query_param, '1') == '1'
+
+    def get_first_page_response(self, count, data, **extra):
+        return Response(OrderedDict([
+            ('count', count),
+            ('next', 2 if count > self.page_size else None),
+            ('previous', None),
+        ] + list(extra.items()) + [
+            ('results', data)
+        ]))
+
+
+class ProductSearchResultPagination(FirstPageResponseMixin, PepupPagination):
     page_size = 30  # 한페이지에 담기는 개수
 
 
 class TagSearchResultPagination(PepupPagination):
     page_size = 30  # 한페이지에 담기는 개수
 
+    def get_postings_response(self, count, next_page, previous_page, data, tag_followed=None):
+        """
+        태그 posting list(api.postings) 를 잘라 만든 페이지의 response 입니다.
+        next, previous 는 page 번호 또는 cursor(상품 id) 입니다.
+        """
+        return Response(OrderedDict([
+            ('count', count),
+            ('next', next_page),
+            ('previous', previous_page),
+            ('tag_followed', tag_followed),
+            ('results', data)
+        ]))
+
     def get_paginated_response(self, data, tag_followed=None):
 
         return Response(OrderedDict([
@@ -0,0 +1,74 @@
+"""
+태그별 판매중 상품 id posting list 입니다. (tag_search)
+
+tag 별로 판매중인 상품 id 를 오름차순 array('q') 로 캐시에 저장합니다. id 가 클수록 최근 상품이므로
+뒤에서부터 읽으면 최신순이며, cursor(마지막으로 본 상품 id) 는 bisect 로 찾습니다.
+Product.tag 변경과 판매중 여부 변경시 api.signals 에서 해당 태그의 posting list 를 지우고,
+다음 조회시 (tag, is_active) 로 한번 조회해 다시 만듭니다. 여러 process 가 같은 array 를 읽고 고쳐 쓰면
+변경이 유실될 수 있으므로 캐시된 array 는 수정하지 않습니다.
+캐시가 없을 때 같은 태그를 동시에 조회해도 process 안에서는 한 요청만 다시 만들고, 나머지는 기다렸다가
+만들어진 posting list 를 읽습니다. (api.autocomplete 의 load_lock 과 같은 방식)
+"""
+import threading
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+
+from .cache import get_cache
+from .models import Product
+
+TAG_POSTINGS_KEY = 'tag-postings:{}'
+# 태그 id 로 나눠 쓰는 build lock (태그마다 lock 을 만들지 않도록 개수를 고정)
+BUILD_LOCKS = [threading.Lock() for _ in range(64)]
+
+
+def get_timeout():
+    return getattr(settings, 'TAG_POSTINGS_TIMEOUT', 60 * 60)
+
+
+def build(tag_id):
+    product_ids = Product.objects.filter(tag=tag_id, is_active=True).order_by('id').values_list('id', flat=True)
+    postings = array('q', product_ids)
+    save(tag_id, postings)
+    return postings
+
+
+def save(tag_id, postings):
+    get_cache().set(TAG_POSTINGS_KEY.format(tag_id), postings.tobytes(), timeout=get_timeout())
+
+
+def get_postings(tag_id):
+    """
+    (postings, cached) 를 return 합니다.
+    """
+    key = TAG_POSTINGS_KEY.format(tag_id)
+    data = get_cache().get(key)
+    if data is None:
+        with BUILD_LOCKS[tag_id % len(BUILD_LOCKS)]:
+            # 기다리는 동안 다른 요청이 만들었으면 그대로 씁니다.
+            data = get_cache().get(key)
+            if data is None:
+                return build(tag_id), False
+    postings = array('q')
+    postings.frombytes(data)
+    return postings, True
+
+
+def get_page(postings, page_size, cursor=None):
+    """
+    cursor 보다 작은(이전에 등록된) 상품 id 를 최신순으로 page_size 개 return 합니다.
+    """
+    end = len(postings) if cursor is None else bisect_left(postings, cursor)
+    return list(reversed(postings[max(end - page_size, 0):end]))
+
+
+def get_offset_page(postings, page_size, page_number):
+    end = len(postings) - (page_number - 1) * page_size
+    if end <= 0:
+        return []
+    return list(reversed(postings[max(end - page_size, 0):end]))
+
+
+def invalidate(tag_ids):
+    get_cache().delete_many([TAG_POSTINGS_KEY.format(tag_id) for tag_id in tag_ids])
@@ -0,0 +1,143 @@
+from django.db import transaction
+from django.db.models import Count, Min
+
+from .cache import invalidate_product_detail
+from .models import Product, RelatedProduct
+
+# 상품별로 저장하는 연관 상품 개수
+RELATED_PRODUCT_COUNT = 5
+
+
+def get_candidates(product):
+    return Product.objects\
+        .filter(is_active=True, second_category_id=product.second_category_id)\
+        .exclude(id=product.id)
+
+
+def get_shared_tag_scores(product, candidates):
+    """
+    candidates 중 product 와 태그를 공유하는 상품의 {product_id: 공유 태그 수} 를 return 합니다.
+    """
+    tag_ids = list(product.tag.values_list('id', flat=True))
+    if not tag_ids:
+        return {}
+    rows = candidates.filter(tag__id__in=tag_ids)\
+        .values('id')\
+        .annotate(score=Count('tag'))\
+        .order_by()\
+        .values_list('id', 'score')
+    return dict(rows)
+
+
+def rebuild_related_products(product, limit=RELATED_PRODUCT_COUNT):
+    """
+    product 의 top-K 연관 상품을 다시 계산합니다.
+    태그를 공유하는 상품이 K 개보다 적으면 같은 소분류의 최신 상품으로 채웁니다. (score=0)
+    """
+    candidates = get_candidates(product)
+    scores = get_shared_tag_scores(product, candidates)
+    top = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))[:limit]
+
+    if len(top) < limit:
+        exclude_ids = [related_id for related_id, _ in top]
+        fill_ids = candidates.exclude(id__in=exclude_ids)\
+            .order_by('-id')\
+            .values_list('id', flat=True)[:limit - len(top)]
+        top += [(related_id, 0) for related_id in fill_ids]
+
+    with transaction.atomic():
+        RelatedProduct.objects.filter(product=product).delete()
+        RelatedProduct.objects.bulk_create([
+            RelatedProduct(product=product, related_id=related_id, score=score) for related_id, score in top
+        ])
+
+
+def merge_into_neighbors(product, limit=RELATED_PRODUCT_COUNT):
+    """
+    product 의 태그가 바뀌었을 때, 이웃 상품들의 top-K 에 product 를 반영합니다.
+    이웃마다 전체를 다시 계산하지 않고 product 의 score 만 갱신/삽입 후 K 개로 자르며,
+    score 가 줄어든 이웃은 다른 상품이 더 높을 수 있으므로 그 이웃만 다시 계산합니다.
+    :return: RelatedProduct 가 바뀐 이웃 상품 id 의 set
+    """
+    scores = get_shared_tag_scores(product, get_candidates(product))
+
+    # 이미 product 를 연관 상품으로 가지고 있는 이웃 : score 가 같거나 늘었으면 갱신, 줄었으면 다시 계산
+    existing = list(RelatedProduct.objects.filter(related=product))
+    raised, lowered_ids = [], []
+    for row in existing:
+        score = scores.get(row.product_id, 0)
+        if score < row.score:
+            lowered_ids.append(row.product_id)
+        elif score > row.score:
+            row.score = score
+            raised.append(row)
+    RelatedProduct.objects.bulk_update(raised, ['score'])
+    for neighbor in Product.objects.filter(id__in=lowered_ids):
+        rebuild_related_products(neighbor)
+    changed_ids = {row.product_id for row in raised} | set(lowered_ids)
+
+    # 새로 태그를 공유하게 된 이웃 : 자리가 있거나 최저 score 보다 높으면 삽입
+    existing_ids = {row.product_id for row in existing}
+    new_scores = {neighbor_id: score for neighbor_id, score in scores.items() if neighbor_id not in existing_ids}
+    if not new_scores:
+        return changed_ids
+
+    stats = RelatedProduct.objects.filter(product_id__in=new_scores.keys())\
+        .values('product_id')\
+        .annotate(count=Count('id'), min_score=Min('score'))\
+        .order_by()
+    stats = {row['product_id']: row for row in stats}
+
+    inserts = []
+    overflow_ids = []
+    for neighbor_id, score in new_scores.items():
+        stat = stats.get(neighbor_id)
+        if not stat or stat['count'] < limit:
+            inserts.append(RelatedProduct(product_id=neighbor_id, related=product, score=score))
+        elif score > stat['min_score']:
+            inserts.append(RelatedProduct(product_id=neighbor_id, related=product, score=score))
+            overflow_ids.append(neighbor_id)
+    RelatedProduct.objects.bulk_create(inserts)
+
+    if overflow_ids:
+        # 이웃별로 가장 낮은 row 하나씩 삭제
+        lowest = {}
+        rows = RelatedProduct.objects.filter(product_id__in=overflow_ids)\
+            .order_by('product_id', 'score', 'related_id')\
+            .values_list('product_id', 'id')
+        for neighbor_id, row_id in rows:
+            lowest.setdefault(neighbor_id, row_id)
+        RelatedProduct.objects.filter(id__in=lowest.values()).delete()
+    return changed_ids | {row.product_id for row in inserts}
+
+
+def move_category(product):
+    """
+    소분류가 바뀐 product 를 이전 소분류 이웃의 연관 상품에서 빼고, 새 소분류 기준으로 다시 계산합니다.
+    """
+    removed_ids = set(RelatedProduct.objects.filter(related=product)
+                      .exclude(product__second_category_id=product.second_category_id)
+                      .values_list('product_id', flat=True))
+    RelatedProduct.objects.filter(related=product, product_id__in=removed_ids).delete()
+    rebuild_related_products(product)
+    changed_ids = merge_into_neighbors(product) | removed_ids
+    invalidate_product_detail([product.id] + list(changed_ids))
+
+
+def schedule_related_products(product):
+    """
+    product 와 이웃의 연관 상품을 transaction commit 후 한번만 다시 계산합니다.
+    tag.set() 은 post_remove, post_add 를 모두 보내므로 같은 instance 의 요청은 하나로 합칩니다.
+    """
+    if getattr(product, '_related_products_scheduled', False):
+        return
+    product._related_products_scheduled = True
+
+    def run():
+        product._related_products_scheduled = False
+        rebuild_related_products(product)
+        changed_ids = merge_into_neighbors(product)
+        # 상품 상세 캐시의 연관 상품 id
+        invalidate_product_detail([product.id] + list(changed_ids))
+
+    transaction.on_commit(run)
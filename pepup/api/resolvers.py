@@ -0,0 +1,54 @@
+from payment.models import Trade
+from .models import Like
+
+
+class ProductStateResolver(object):
+    """
+    list serializer 에서 현재 유저의 like / bag(카트, trade status=1) 상태를 page 단위로 한번에 조회합니다.
+    상품마다 like_set.get 을 호출하지 않고, 처음 필요할 때 page 의 product id 로 IN 쿼리 한번을 실행합니다.
+    """
+
+    def __init__(self, user, products):
+        self.user = user
+        self.product_ids = [product.id for product in products if product is not None]
+        self._liked_ids = None
+        self._bagged_ids = None
+
+    @property
+    def liked_ids(self):
+        if self._liked_ids is None:
+            self._liked_ids = set(
+                Like.objects.filter(user=self.user, product_id__in=self.product_ids, is_liked=True)
+                    .values_list('product_id', flat=True)
+            )
+        return self._liked_ids
+
+    @property
+    def bagged_ids(self):
+        if self._bagged_ids is None:
+            self._bagged_ids = set(
+                Trade.objects.filter(buyer=self.user, product_id__in=self.product_ids, status=1)
+                    .values_list('product_id', flat=True)
+            )
+        return self._bagged_ids
+
+    def is_liked(self, product):
+        return product.id in self.liked_ids
+
+    def is_bagged(self, product):
+        return product.id in self.bagged_ids
+
+
+def get_product_state_resolver(serializer):
+    """
+    serializer context 에 ProductStateResolver 를 만들어 두고 return 합니다.
+    many=True 인 경우 ListSerializer 와 child 가 context 를 공유하므로 page 전체에 대해 한번만 생성됩니다.
+    """
+    context = serializer.context
+    if 'product_states' not in context:
+        if serializer.parent is not None and serializer.parent.instance is not None:
+            products = serializer.parent.instance
+        else:
+            products = [serializer.instance]
+        context['product_states'] = ProductStateResolver(context['request'].user, products)
+    return context['product_states']
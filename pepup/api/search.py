@@ -0,0 +1,264 @@
+"""
+상품 검색 index 입니다.
+
+상품명, 설명, 브랜드명, 태그를 n-gram token 으로 쪼개 저장하고 keyword 의 token 이 모두 포함된 상품을
+(가중치 합, 최신순) 으로 정렬합니다. 한글 상품명은 띄어쓰기가 일정하지 않으므로 단어가 아닌 2-gram 으로 매칭합니다.
+한 글자 검색어도 index 로 찾을 수 있도록 document 에는 한 글자 token 도 함께 저장합니다.
+backend 는 settings.PRODUCT_SEARCH_BACKEND 로 교체할 수 있습니다.
+"""
+import hashlib
+import re
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value, Case, When
+from django.utils.module_loading import import_string
+
+from .cache import get_cache
+from .models import Product, ProductSearchToken
+
+NGRAM_SIZE = 2
+
+# field 별 가중치
+NAME_WEIGHT = 3
+BRAND_WEIGHT = 2
+TAG_WEIGHT = 2
+CONTENT_WEIGHT = 1
+
+# 검색 index 에 영향을 주는 Product field
+INDEXED_FIELDS = {'name', 'content', 'brand', 'is_active'}
+
+WORD_RE = re.compile(r'\w+')
+
+SEARCH_COUNT_KEY = 'product-search-count:{}'
+
+
+def tokenize(text, unigrams=False):
+    """
+    text 를 NGRAM_SIZE 글자 token 의 set 으로 쪼갭니다. NGRAM_SIZE 보다 짧은 단어는 그대로 token 입니다.
+    unigrams=True 이면 한 글자 token 도 함께 만듭니다. (document 용, 한 글자 검색어 매칭)
+    """
+    tokens = set()
+    for word in WORD_RE.findall((text or '').lower()):
+        if unigrams:
+            tokens.update(word)
+        if len(word) <= NGRAM_SIZE:
+            tokens.add(word)
+            continue
+        for i in range(len(word) - NGRAM_SIZE + 1):
+            tokens.add(word[i:i + NGRAM_SIZE])
+    return tokens
+
+
+def get_document(product):
+    """
+    product 의 {token: weight} 를 return 합니다.
+    """
+    return build_document(product.name, product.brand.name, product.content, [tag.tag for tag in product.tag.all()])
+
+
+def build_document(name, brand_name, content, tag_names):
+    """
+    여러 field 에 나오는 token 은 가장 큰 가중치를 사용합니다.
+    """
+    fields = [(name, NAME_WEIGHT), (brand_name, BRAND_WEIGHT), (content, CONTENT_WEIGHT)]
+    fields += [(tag_name, TAG_WEIGHT) for tag_name in tag_names]
+
+    document = {}
+    for text, weight in fields:
+        for token in tokenize(text, unigrams=True):
+            document[token] = max(document.get(token, 0), weight)
+    return document
+
+
+class BaseSearchBackend:
+
+    def index(self, product):
+        raise NotImplementedError
+
+    def remove(self, product_ids):
+        raise NotImplementedError
+
+    def search(self, queryset, keyword):
+        """
+        queryset 중 keyword 에 맞는 상품을 관련도, 최신순으로 정렬해 return 합니다.
+        """
+        raise NotImplementedError
+
+    def get_token_counts(self, tokens):
+        """
+        token 별 index 된 상품 수(posting list 크기) 를 return 합니다. {token: count}
+        """
+        raise NotImplementedError
+
+    def estimate_count(self, keyword):
+        """
+        keyword 의 token 중 가장 작은 posting list 크기로 검색 결과 수를 추정합니다. (실제 결과 수 이상)
+        """
+        query_tokens = tokenize(keyword)
+        if not query_tokens:
+            return 0
+        counts = self.get_token_counts(query_tokens)
+        return min(counts.get(token, 0) for token in query_tokens)
+
+    def index_documents(self, documents):
+        """
+        미리 만든 {product_id: document} 를 한번에 index 합니다. (대량 생성, benchmark 용)
+        """
+        for product_id, document in documents.items():
+            self.index_document(product_id, document)
+
+    def index_document(self, product_id, document):
+        raise NotImplementedError
+
+    def update(self, product):
+        if product.is_active:
+            self.index(product)
+        else:
+            self.remove([product.id])
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """
+    ProductSearchToken 테이블을 사용하는 backend 입니다.
+    token index 의 equality 조회만 하므로 MySQL, SQLite 모두 full scan 없이 동작합니다.
+    """
+
+    @transaction.atomic
+    def index(self, product):
+        ProductSearchToken.objects.filter(product_id=product.id).delete()
+        self.index_document(product.id, get_document(product))
+
+    def index_document(self, product_id, document):
+        ProductSearchToken.objects.bulk_create(
+            [ProductSearchToken(product_id=product_id, token=token, weight=weight)
+             for token, weight in document.items()]
+        )
+
+    def index_documents(self, documents):
+        ProductSearchToken.objects.filter(product_id__in=list(documents)).delete()
+        ProductSearchToken.objects.bulk_create(
+            [ProductSearchToken(product_id=product_id, token=token, weight=weight)
+             for product_id, document in documents.items() for token, weight in document.items()]
+        )
+
+    def remove(self, product_ids):
+        ProductSearchToken.objects.filter(product_id__in=product_ids).delete()
+
+    def search(self, queryset, keyword):
+        query_tokens = tokenize(keyword)
+        if not query_tokens:
+            return queryset.none()
+
+        tokens = ProductSearchToken.objects.filter(token__in=query_tokens)
+        matched = tokens.values('product_id')\
+            .annotate(matched=Count('id'))\
+            .filter(matched=len(query_tokens))\
+            .values('product_id')
+        score = tokens.filter(product=OuterRef('pk'))\
+            .values('product_id')\
+            .annotate(score=Sum('weight'))\
+            .values('score')
+        return queryset\
+            .filter(id__in=matched)\
+            .annotate(search_score=Subquery(score, output_field=IntegerField()))\
+            .order_by('-search_score', '-id')
+
+    def get_token_counts(self, tokens):
+        rows = ProductSearchToken.objects.filter(token__in=tokens)\
+            .values('token')\
+            .annotate(count=Count('id'))\
+            .values_list('token', 'count')
+        return dict(rows)
+
+
+class MemorySearchBackend(BaseSearchBackend):
+    """
+    process 메모리에 index 를 두는 pure-python backend 입니다. test, 로컬 개발용입니다.
+    """
+
+    def __init__(self):
+        self.postings = defaultdict(dict)  # token: {product_id: weight}
+        self.documents = {}  # product_id: {token: weight}
+
+    def index(self, product):
+        self.index_document(product.id, get_document(product))
+
+    def index_document(self, product_id, document):
+        self.remove([product_id])
+        for token, weight in document.items():
+            self.postings[token][product_id] = weight
+        self.documents[product_id] = document
+
+    def remove(self, product_ids):
+        for product_id in product_ids:
+            for token in self.documents.pop(product_id, {}):
+                self.postings[token].pop(product_id, None)
+
+    def search(self, queryset, keyword):
+        query_tokens = tokenize(keyword)
+        if not query_tokens:
+            return queryset.none()
+
+        postings = [self.postings.get(token, {}) for token in query_tokens]
+        product_ids = set.intersection(*[set(posting) for posting in postings])
+        scores = {product_id: sum(posting[product_id] for posting in postings) for product_id in product_ids}
+        if not scores:
+            return queryset.none()
+        return queryset\
+            .filter(id__in=scores)\
+            .annotate(search_score=Case(*[When(id=product_id, then=Value(score))
+                                          for product_id, score in scores.items()],
+                                        output_field=IntegerField()))\
+            .order_by('-search_score', '-id')
+
+    def get_token_counts(self, tokens):
+        return {token: len(self.postings.get(token, {})) for token in tokens}
+
+    def clear(self):
+        self.postings.clear()
+        self.documents.clear()
+
+
+_backend = None
+
+
+def get_search_backend():
+    global _backend
+    path = getattr(settings, 'PRODUCT_SEARCH_BACKEND', 'api.search.DatabaseSearchBackend')
+    if _backend is None or _backend.__class__.__module__ + '.' + _backend.__class__.__name__ != path:
+        _backend = import_string(path)()
+    return _backend
+
+
+def search_products(queryset, keyword):
+    return get_search_backend().search(queryset, keyword)
+
+
+def count_products(keyword, exact=False):
+    """
+    검색 결과 수와 정확한 값인지 여부를 return 합니다. (count, exact)
+    exact=False 이면 index 의 posting list 크기로 추정한 값을 PRODUCT_SEARCH_COUNT_TIMEOUT 동안 캐싱합니다.
+    """
+    if exact:
+        return search_products(Product.objects.filter(is_active=True), keyword).count(), True
+    key = SEARCH_COUNT_KEY.format(hashlib.md5(keyword.lower().strip().encode()).hexdigest())
+    count = get_cache().get(key)
+    if count is None:
+        count = get_search_backend().estimate_count(keyword)
+        get_cache().set(key, count, timeout=getattr(settings, 'PRODUCT_SEARCH_COUNT_TIMEOUT', 60))
+    return count, False
+
+
+def update_search_index(product):
+    get_search_backend().update(product)
+
+
+def rebuild_search_index():
+    backend = get_search_backend()
+    count = 0
+    for product in Product.objects.select_related('brand').iterator():
+        backend.update(product)
+        count += 1
+    return count
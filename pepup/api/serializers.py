@@ -8,14 +8,44 @@ from django.core.files import File
 from django.http import Http404
 from django.utils.timesince import timesince
 from rest_framework import serializers
-from django.db.models import Avg
+from django.db.models import Avg, Prefetch
 from accounts.models import User, DeliveryPolicy, StoreAccount, Profile
 from accounts.serializers import UserSerializer, ThumbnailSerializer
 from payment.models import Review
 from .models import (Product, Brand, ProdThumbnail,
                      Like, Follow, Tag, SecondCategory, FirstCategory, Size, GenderDivision, ProdImage,
-                     ProdS3Image)
+                     ProdS3Image, ProductFacet, StoreStats)
 from api.loader import load_credential
+from api.resolvers import get_product_state_resolver
+
+
+DEFAULT_THUMBNAIL_URL = "https://pepup-server-storages.s3.ap-northeast-2.amazonaws.com/static/img/prodthumbnail_default.png"
+
+
+def get_images_prefetch():
+    return Prefetch('images', queryset=ProdS3Image.objects.order_by('id'))
+
+
+def get_image_data(product):
+    """
+    prefetch 된 product.images 로 [{"image_url": url}] 를 만듭니다.
+    nested serializer 를 row 마다 생성하지 않고 image_key 로 url 만 조합합니다.
+    view 에서 get_images_prefetch() 를 prefetch 해야 추가 쿼리가 없습니다.
+    """
+    images = product.images.all()
+    if not images:
+        return [{"image": DEFAULT_THUMBNAIL_URL}]
+    return [{"image_url": image.image_key.url} for image in images]
+
+
+def get_thumbnail_data(product):
+    """
+    select_related 된 product.prodthumbnail 로 {"thumbnail": url} 을 만듭니다.
+    """
+    thumbnail = getattr(product, 'prodthumbnail', None)
+    if not thumbnail:
+        return {"thumbnail": DEFAULT_THUMBNAIL_URL}
+    return {"thumbnail": thumbnail.thumbnail.url if thumbnail.thumbnail else None}
 
 
 class BrandSerializer(serializers.ModelSerializer):
@@ -62,6 +92,8 @@ class FirstCategorySerializer(serializers.ModelSerializer):
         fields = ['name', 'id', 'child']
 
     def get_child(self, obj):
+        if hasattr(obj, 'has_child'):
+            return obj.has_child
         if obj.second_category.first():
             return True
         return False
@@ -85,6 +117,8 @@ class GenderSerializer(serializers.ModelSerializer):
         return obj.get_name_display()
 
     def get_child(self, obj):
+        if hasattr(obj, 'has_child'):
+            return obj.has_child
         if obj.category.first():
             return True
         return False
@@ -105,6 +139,32 @@ class SizeSerializer(serializers.ModelSerializer):
         return "{} ({})".format(obj.size_name, obj.size)
 
 
+class FirstCategoryTreeSerializer(FirstCategorySerializer):
+    """
+    category_tree api 에서 사용하며, second_category, size 는 prefetch 된 값을 사용합니다.
+    """
+    second_category = SecondCategorySerializer(many=True)
+    size = SizeSerializer(many=True)
+
+    class Meta:
+        model = FirstCategory
+        fields = ['name', 'id', 'child', 'second_category', 'size']
+
+    def get_child(self, obj):
+        return len(obj.second_category.all()) > 0
+
+
+class GenderTreeSerializer(GenderSerializer):
+    category = FirstCategoryTreeSerializer(many=True)
+
+    class Meta:
+        model = GenderDivision
+        fields = ['name', 'id', 'child', 'category']
+
+    def get_child(self, obj):
+        return len(obj.category.all()) > 0
+
+
 class RelatedProductSerializer(serializers.ModelSerializer):
     thumbnails = serializers.SerializerMethodField()
     size = serializers.SerializerMethodField()
@@ -114,10 +174,7 @@ class RelatedProductSerializer(serializers.ModelSerializer):
         fields = ['id', 'thumbnails', 'size', 'price', 'name']
 
     def get_thumbnails(self, obj):
-        thumbnails = obj.prodthumbnail
-        if thumbnails:
-            return ProdThumbnailSerializer(thumbnails).data
-        return {"thumbnail":"https://pepup-server-storages.s3.ap-northeast-2.amazonaws.com/static/img/prodthumbnail_default.png"}
+        return get_thumbnail_data(obj)
 
     def get_size(self, obj):
         if hasattr(obj.size, 'size_name'):
@@ -132,7 +189,6 @@ class ProductSerializer(serializers.ModelSerializer):
     """
     brand = BrandSerializer(read_only=True)
     seller = UserSerializer()
-    discounted_price = serializers.SerializerMethodField()
     images = serializers.SerializerMethodField() # TODO : FIX field name 'thumbnalis' -> 'images'
     size = serializers.SerializerMethodField()
     second_category = SecondCategorySerializer(allow_null=True)
@@ -143,10 +199,7 @@ class ProductSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
     def get_images(self, obj):
-        images = obj.images.select_related('product').all()
-        if not images:
-            return [{"image": "https://pepup-server-storages.s3.ap-northeast-2.amazonaws.com/static/img/prodthumbnail_default.png"}]
-        return ProdImageSerializer(images, many=True).data
+        return get_image_data(obj)
 
     def get_size(self, obj):
         if not obj.size:
@@ -159,9 +212,6 @@ class ProductSerializer(serializers.ModelSerializer):
             return "-"
         return "{}({})".format(obj.size.size_name, obj.size.size)
 
-    def get_discounted_price(self, obj):
-        return obj.discounted_price
-
 
 class ProductCreateSerializer(serializers.ModelSerializer):
     seller = serializers.HiddenField(default=serializers.CurrentUserDefault())
@@ -208,7 +258,6 @@ class FollowSerializer(serializers.ModelSerializer):
     images = serializers.SerializerMethodField()
     tag = TagSerializer(many=True)
     by = serializers.SerializerMethodField()
-    discounted_price = serializers.SerializerMethodField()
     liked = serializers.SerializerMethodField()
     second_category = SecondCategorySerializer(allow_null=True)
     size = serializers.SerializerMethodField()
@@ -220,27 +269,14 @@ class FollowSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
     def get_images(self, obj):
-        images = obj.images.select_related('product').all()
-        if not images:
-            return [{"image":"https://pepup-server-storages.s3.ap-northeast-2.amazonaws.com/static/img/prodthumbnail_default.png"}]
-        return ProdImageSerializer(images, many=True).data
+        return get_image_data(obj)
 
     def get_by(self, obj):
-        if obj.id in self.context['by_seller']:
-            return 1
-        return 2
-
-    def get_discounted_price(self,obj):
-        return obj.discounted_price
+        # feed inbox(api.feed.get_feed_queryset) 에서 annotate 된 값
+        return obj.feed_by
 
     def get_liked(self, obj):
-        request = self.context['request']
-        user = request.user
-        try:
-            liked = obj.like_set.get(user=user).is_liked
-            return liked
-        except:
-            return False
+        return get_product_state_resolver(self).is_liked(obj)
 
     def get_size(self, obj):
         if not obj.size:
@@ -252,10 +288,8 @@ class FollowSerializer(serializers.ModelSerializer):
         return "{}({})".format(obj.size.size_name, obj.size.size)
 
     def get_follow_tag(self, obj):
-        follow_tag_ids = self.context['follow_tag_ids']
-        tags = obj.tag.all()
-        for tag in tags:
-            if tag.id in follow_tag_ids:
+        for tag in obj.tag.all():
+            if tag.id == obj.feed_tag_id:
                 return TagSerializer(tag).data
         return None
 
@@ -283,10 +317,24 @@ class MainSerializer(serializers.ModelSerializer):
         fields = ['id', 'on_discount', 'sold', 'is_refundable', 'thumbnails']
 
     def get_thumbnails(self, obj):
-        thumbnails = obj.prodthumbnail
-        if thumbnails:
-            return ProdThumbnailSerializer(thumbnails).data
-        return {"thumbnail":"https://pepup-server-storages.s3.ap-northeast-2.amazonaws.com/static/img/prodthumbnail_default.png"}
+        return get_thumbnail_data(obj)
+
+
+class ProductFacetSerializer(serializers.ModelSerializer):
+    """
+    filter api 에서 사용하는 serializer, MainSerializer 와 같은 형태로 return 합니다.
+    """
+    id = serializers.IntegerField(source='product_id')
+    thumbnails = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ProductFacet
+        fields = ['id', 'on_discount', 'sold', 'is_refundable', 'thumbnails']
+
+    def get_thumbnails(self, obj):
+        if obj.thumbnail:
+            return {"thumbnail": obj.thumbnail}
+        return {"thumbnail": DEFAULT_THUMBNAIL_URL}
 
 
 class FilterSerializer(serializers.Serializer):
@@ -310,7 +358,6 @@ class UserinfoSerializer(serializers.ModelSerializer):
 
 class SearchResultSerializer(serializers.ModelSerializer):
     images = serializers.SerializerMethodField()
-    discounted_price = serializers.SerializerMethodField()
     liked = serializers.SerializerMethodField()
     size = serializers.SerializerMethodField()
 
@@ -321,22 +368,13 @@ class SearchResultSerializer(serializers.ModelSerializer):
                   'liked', 'is_refundable', 'size']
 
     def get_images(self, obj):
-        images = obj.images.select_related('product').first()
-        if not images:
-            return [{"image":"https://pepup-server-storages.s3.ap-northeast-2.amazonaws.com/static/img/prodthumbnail_default.png"}]
-        return ProdImageSerializer(images).data
-
-    def get_discounted_price(self,obj):
-        return obj.discounted_price
+        images = get_image_data(obj)
+        if not images[0].get('image_url'):
+            return images
+        return images[0]
 
     def get_liked(self, obj):
-        request = self.context['request']
-        user = request.user
-        try:
-            liked = obj.like_set.get(user=user).is_liked
-            return liked
-        except:
-            return False
+        return get_product_state_resolver(self).is_liked(obj)
 
     def get_size(self, obj):
         if hasattr(obj.size, 'size_name'):
@@ -357,17 +395,13 @@ class ProductForTradeSerializer(serializers.ModelSerializer):
     thumbnails = serializers.SerializerMethodField()
     size = serializers.SerializerMethodField()
     second_category = SecondCategorySerializer(allow_null=True)
-    discounted_price = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
         fields = ['id','name','price', 'discount_rate','discounted_price','brand', 'thumbnails', 'size', 'second_category']
 
     def get_thumbnails(self, obj):
-        thumbnails = obj.prodthumbnail
-        if not thumbnails:
-            return {"thumbnail": "https://pepup-server-storages.s3.ap-northeast-2.amazonaws.com/static/img/prodthumbnail_default.png"}
-        return ProdThumbnailSerializer(thumbnails).data
+        return get_thumbnail_data(obj)
 
     def get_size(self, obj):
         if hasattr(obj.size, 'size_max'):
@@ -379,9 +413,6 @@ class ProductForTradeSerializer(serializers.ModelSerializer):
             return "{}({})".format(obj.size.size_name, obj.size.size)
         return ""
 
-    def get_discounted_price(self,obj):
-        return obj.discounted_price
-
 
 class StoreProductSerializer(serializers.ModelSerializer):
     thumbnails = serializers.SerializerMethodField()
@@ -391,10 +422,7 @@ class StoreProductSerializer(serializers.ModelSerializer):
         fields = ['thumbnails', 'id']
 
     def get_thumbnails(self, obj):
-        thumbnails = obj.prodthumbnail
-        if thumbnails:
-            return ProdThumbnailSerializer(thumbnails).data
-        return {"thumbnail":"https://pepup-server-storages.s3.ap-northeast-2.amazonaws.com/static/img/prodthumbnail_default.png"}
+        return get_thumbnail_data(obj)
 
 
 class StoreSerializer(serializers.ModelSerializer):
@@ -421,25 +449,21 @@ class StoreSerializer(serializers.ModelSerializer):
                 return profile.introduce
         return ''
 
+    # review, follow 통계는 StoreStats(select_related('store_stats')) 에서 읽습니다.
     def get_review_score(self, obj):
-        if obj.received_reviews.first():
-            score = obj.received_reviews.all().values('satisfaction').annotate(score=Avg('satisfaction')).values('score')[0]['score']
-            return score
-        return 0.0
+        score = StoreStats.get_for_user(obj).review_score
+        if score is None:
+            return 0.0
+        return score
 
     def get_review_count(self, obj):
-        if obj.received_reviews.first():
-            count = obj.received_reviews.all().count()
-            return count
-        return 0
+        return StoreStats.get_for_user(obj).review_count
 
     def get_followers(self, obj):
-        follower = Follow.objects.filter(_to=obj, is_follow=True)
-        return follower.count()
+        return StoreStats.get_for_user(obj).follower_count
 
     def get_followings(self, obj):
-        following = Follow.objects.filter(_from=obj, is_follow=True, tag__isnull=True)
-        return following.count()
+        return StoreStats.get_for_user(obj).following_count
 
     def get_user_followed(self, obj):
         user_followed = self.context['user_followed']
@@ -456,10 +480,7 @@ class StoreLikeSerializer(serializers.ModelSerializer):
         fields = ['thumbnails', 'id', 'sold']
 
     def get_thumbnails(self, obj):
-        thumbnails = obj.product.prodthumbnail
-        if thumbnails:
-            return ProdThumbnailSerializer(thumbnails).data
-        return {"thumbnail":"https://pepup-server-storages.s3.ap-northeast-2.amazonaws.com/static/img/prodthumbnail_default.png"}
+        return get_thumbnail_data(obj.product)
 
     def get_id(self, obj):
         if obj.product:
@@ -484,11 +505,28 @@ class SimpleProfileSerializer(serializers.ModelSerializer):
         return obj.profile.profile_img_url
 
     def get_review_score(self, obj):
-        if obj.received_reviews.first():
-            score = obj.received_reviews.all().values('satisfaction').\
-                annotate(score=Avg('satisfaction')).values('score')[0]['score']
-            return score
-        return 0
+        score = StoreStats.get_for_user(obj).review_score
+        if score is None:
+            return 0
+        return score
+
+
+class SellerSearchSerializer(serializers.ModelSerializer):
+    """
+    판매자 검색(자동완성) 결과입니다.
+    context 의 social_accounts({user_id: socialaccount}) 를 사용하므로 profile 외에 추가 쿼리가 없습니다.
+    """
+    profile = serializers.SerializerMethodField()
+
+    class Meta:
+        model = User
+        fields = ['id', 'nickname', 'profile']
+
+    def get_profile(self, obj):
+        social_accounts = self.context.get('social_accounts')
+        if social_accounts is None:
+            return obj.profile.profile_img_url
+        return obj.profile.get_profile_img_url(social_accounts.get(obj.id))
 
 
 class StoreReviewSerializer(serializers.ModelSerializer):
@@ -0,0 +1,334 @@
+from decimal import Decimal
+
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from accounts.models import User, Profile, DeliveryPolicy
+from payment.models import Review
+from .cache import invalidate_product_detail
+from .models import (Brand, GenderDivision, FirstCategory, SecondCategory, Size, Product, ProdThumbnail,
+                     ProdS3Image, Tag, ProductFacet, StoreStats, Follow)
+from .recommend import schedule_related_products, move_category
+from .autocomplete import autocomplete
+from .snapshot import brand_catalog, category_tree
+from .hot_search import invalidate_product as invalidate_hot_search
+from . import postings as tag_postings
+from .search import INDEXED_FIELDS, update_search_index
+from .feed import fan_out_to_seller_followers, fan_out_to_tag_followers, add_tag_items
+
+
+@receiver(post_save, sender=Product)
+def sync_product_facet(sender, instance=None, **kwargs):
+    ProductFacet.sync(instance)
+
+
+@receiver(post_save, sender=ProdThumbnail)
+def sync_facet_thumbnail(sender, instance=None, **kwargs):
+    thumbnail = instance.image_url if instance.thumbnail else None
+    ProductFacet.objects.filter(product_id=instance.product_id).update(thumbnail=thumbnail)
+
+
+@receiver(post_delete, sender=ProdThumbnail)
+def clear_facet_thumbnail(sender, instance=None, **kwargs):
+    ProductFacet.objects.filter(product_id=instance.product_id).update(thumbnail=None)
+
+
+@receiver(post_save, sender=DeliveryPolicy)
+def sync_facet_free_delivery(sender, instance=None, **kwargs):
+    ProductFacet.objects.filter(product__seller_id=instance.seller_id)\
+        .update(free_delivery=instance.general == 0)
+
+
+@receiver(post_delete, sender=DeliveryPolicy)
+def clear_facet_free_delivery(sender, instance=None, **kwargs):
+    ProductFacet.objects.filter(product__seller_id=instance.seller_id).update(free_delivery=False)
+
+
+@receiver(post_save, sender=FirstCategory)
+def sync_facet_gender(sender, instance=None, **kwargs):
+    ProductFacet.objects.filter(first_category_id=instance.id).update(gender_id=instance.gender_id)
+
+
+@receiver(m2m_changed, sender=Product.tag.through)
+def sync_related_products(sender, instance=None, action=None, reverse=False, **kwargs):
+    if reverse or action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    schedule_related_products(instance)
+
+
+@receiver(post_save, sender=Product)
+def sync_product_related_products(sender, instance=None, created=False, **kwargs):
+    # 새 상품은 같은 소분류 상품으로 채우고, 태그는 추가될 때 sync_related_products 에서 반영
+    if created:
+        schedule_related_products(instance)
+        return
+    previous = getattr(instance, '_previous_state', None)
+    if previous is not None and previous['second_category_id'] != instance.second_category_id:
+        move_category(instance)
+
+
+@receiver(post_save, sender=Product)
+def invalidate_product_cache(sender, instance=None, **kwargs):
+    invalidate_product_detail([instance.pk])
+
+
+@receiver(post_save, sender=ProdS3Image)
+@receiver(post_delete, sender=ProdS3Image)
+@receiver(post_save, sender=ProdThumbnail)
+@receiver(post_delete, sender=ProdThumbnail)
+def invalidate_image_cache(sender, instance=None, **kwargs):
+    invalidate_product_detail([instance.product_id])
+
+
+@receiver(m2m_changed, sender=Product.tag.through)
+def invalidate_tag_relation_cache(sender, instance=None, action=None, reverse=False, pk_set=None, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate_product_detail([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        # tag.product_set 으로 변경된 경우 pk_set 은 product id
+        invalidate_product_detail(pk_set)
+    elif action == 'pre_clear':
+        invalidate_product_detail(instance.product_set.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Tag)
+def invalidate_tag_cache(sender, instance=None, created=False, **kwargs):
+    if not created:
+        invalidate_product_detail(instance.product_set.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=DeliveryPolicy)
+@receiver(post_delete, sender=DeliveryPolicy)
+def invalidate_delivery_policy_cache(sender, instance=None, **kwargs):
+    invalidate_product_detail(Product.objects.filter(seller_id=instance.seller_id).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=User)
+def invalidate_seller_cache(sender, instance=None, created=False, update_fields=None, **kwargs):
+    # 상품 상세의 seller nickname (로그인시 last_login 만 저장하는 경우는 제외)
+    if created or (update_fields and 'nickname' not in update_fields):
+        return
+    invalidate_product_detail(Product.objects.filter(seller_id=instance.id).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Profile)
+def invalidate_seller_profile_cache(sender, instance=None, **kwargs):
+    # 상품 상세의 seller profile 이미지
+    invalidate_product_detail(Product.objects.filter(seller_id=instance.user_id).values_list('id', flat=True))
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_satisfaction(sender, instance=None, **kwargs):
+    # 리뷰 수정시 이전 별점을 빼주기 위해 저장
+    instance._previous_review = None
+    if instance.pk:
+        instance._previous_review = Review.objects.filter(pk=instance.pk)\
+            .values_list('seller_id', 'satisfaction').first()
+
+
+@receiver(post_save, sender=Review)
+def sync_store_review_stats(sender, instance=None, created=False, **kwargs):
+    satisfaction = Decimal(str(instance.satisfaction))
+    previous = getattr(instance, '_previous_review', None)
+    if created or previous is None:
+        StoreStats.increase(instance.seller_id, review_count=1, review_sum=satisfaction)
+        return
+    previous_seller_id, previous_satisfaction = previous
+    if previous_seller_id == instance.seller_id:
+        StoreStats.increase(instance.seller_id, review_sum=satisfaction - previous_satisfaction)
+    else:
+        StoreStats.increase(previous_seller_id, review_count=-1, review_sum=-previous_satisfaction)
+        StoreStats.increase(instance.seller_id, review_count=1, review_sum=satisfaction)
+
+
+@receiver(post_delete, sender=Review)
+def remove_store_review_stats(sender, instance=None, **kwargs):
+    StoreStats.increase(instance.seller_id, review_count=-1, review_sum=-Decimal(str(instance.satisfaction)))
+
+
+@receiver(post_save, sender=Product)
+def fan_out_new_product(sender, instance=None, created=False, **kwargs):
+    if created:
+        fan_out_to_seller_followers(instance)
+
+
+@receiver(post_save, sender=Product)
+def count_active_product(sender, instance=None, created=False, **kwargs):
+    # 판매중 상품 수 (판매자 검색 순위). 새 상품과 판매중 여부가 바뀐 상품(삭제, 복구 포함)을 반영합니다.
+    if created:
+        if instance.is_active:
+            StoreStats.increase(instance.seller_id, product_count=1)
+    elif is_active_changed(instance):
+        StoreStats.increase(instance.seller_id, product_count=1 if instance.is_active else -1)
+
+
+@receiver(m2m_changed, sender=Product.tag.through)
+def fan_out_tagged_product(sender, instance=None, action=None, reverse=False, pk_set=None, **kwargs):
+    if action != 'post_add' or not pk_set:
+        return
+    if not reverse:
+        fan_out_to_tag_followers(instance, pk_set)
+        return
+    # tag.product_set 으로 추가된 경우 pk_set 은 product id
+    follower_ids = list(Follow.objects.filter(tag=instance, is_follow=True).values_list('_from_id', flat=True))
+    add_tag_items(follower_ids, Product.objects.filter(id__in=pk_set, is_active=True), instance.id)
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance=None, update_fields=None, **kwargs):
+    if update_fields and not INDEXED_FIELDS.intersection(update_fields):
+        return
+    if not indexed_fields_changed(instance):
+        return
+    update_search_index(instance)
+
+
+@receiver(m2m_changed, sender=Product.tag.through)
+def index_product_tags(sender, instance=None, action=None, reverse=False, pk_set=None, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        update_search_index(instance)
+    elif pk_set:
+        for product in Product.objects.select_related('brand').filter(id__in=pk_set):
+            update_search_index(product)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Brand)
+def index_renamed_products(sender, instance=None, created=False, **kwargs):
+    if created:
+        return
+    for product in instance.product_set.select_related('brand'):
+        update_search_index(product)
+
+
+@receiver(post_save, sender=Tag)
+def update_tag_autocomplete(sender, instance=None, created=False, **kwargs):
+    autocomplete.update('tags', instance.id, instance.tag, weight=0 if created else None)
+
+
+@receiver(post_save, sender=Brand)
+def update_brand_autocomplete(sender, instance=None, **kwargs):
+    autocomplete.update('brands', instance.id, None if instance.name == 'Other' else instance.name)
+
+
+@receiver(post_save, sender=User)
+def update_seller_autocomplete(sender, instance=None, **kwargs):
+    nickname = instance.nickname if instance.is_active else None
+    autocomplete.update('sellers', instance.id, nickname)
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Brand)
+@receiver(post_delete, sender=User)
+def remove_autocomplete(sender, instance=None, **kwargs):
+    index_name = {Tag: 'tags', Brand: 'brands', User: 'sellers'}[sender]
+    autocomplete.update(index_name, instance.id)
+
+
+@receiver(m2m_changed, sender=Product.tag.through)
+def update_tag_product_count(sender, instance=None, action=None, reverse=False, pk_set=None, **kwargs):
+    """
+    Tag.product_count 와 자동완성 가중치를 판매중인 상품 기준으로 증감합니다.
+    """
+    delta = {'post_add': 1, 'post_remove': -1, 'pre_clear': -1}.get(action)
+    if delta is None:
+        return
+    if not reverse:
+        if not instance.is_active:
+            return
+        if action == 'pre_clear':
+            # clear 는 pk_set 이 없으므로 지우기 전에 조회
+            pk_set = list(instance.tag.values_list('id', flat=True))
+        tag_ids = pk_set
+    else:
+        products = instance.product_set.all() if action == 'pre_clear' else Product.objects.filter(id__in=pk_set)
+        delta *= products.filter(is_active=True).count()
+        tag_ids = [instance.id]
+    Tag.increase_product_count(tag_ids, delta)
+    autocomplete.add_tag_weights(tag_ids, delta)
+
+
+@receiver(post_save, sender=Product)
+def invalidate_product_hot_search(sender, instance=None, **kwargs):
+    invalidate_hot_search(instance, getattr(instance, '_previous_state', None))
+
+
+@receiver(m2m_changed, sender=Product.tag.through)
+def invalidate_tag_hot_search(sender, instance=None, action=None, reverse=False, **kwargs):
+    # 추가는 추가된 후, 삭제는 삭제되기 전 태그로 매칭되는 query 를 지웁니다.
+    if action in ('post_add', 'pre_remove', 'pre_clear') and not reverse:
+        invalidate_hot_search(instance)
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_state(sender, instance=None, **kwargs):
+    # post_save 에서 변경 여부를 확인하기 위해 저장 전 값을 보관
+    instance._previous_state = None
+    if instance.pk:
+        instance._previous_state = Product.objects.filter(pk=instance.pk)\
+            .values('is_active', 'name', 'content', 'brand_id', 'brand__name', 'second_category_id').first()
+
+
+def indexed_fields_changed(instance):
+    # 저장 전 값이 없으면(새 상품) 변경된 것으로 봅니다.
+    previous = getattr(instance, '_previous_state', None)
+    if previous is None:
+        return True
+    return (previous['name'] != instance.name or previous['content'] != instance.content
+            or previous['brand_id'] != instance.brand_id or previous['is_active'] != instance.is_active)
+
+
+def is_active_changed(instance):
+    previous = getattr(instance, '_previous_state', None)
+    return previous is not None and previous['is_active'] != instance.is_active
+
+
+@receiver(post_save, sender=Product)
+def sync_tag_postings(sender, instance=None, created=False, **kwargs):
+    """
+    판매중 여부가 바뀐 상품의 태그 posting list 를 지우고, Tag.product_count 와 자동완성 가중치를 증감합니다.
+    새 상품은 tag 추가 signal 에서 반영됩니다.
+    """
+    if created or not is_active_changed(instance):
+        return
+    tag_ids = list(instance.tag.values_list('id', flat=True))
+    tag_postings.invalidate(tag_ids)
+    delta = 1 if instance.is_active else -1
+    Tag.increase_product_count(tag_ids, delta)
+    autocomplete.add_tag_weights(tag_ids, delta)
+
+
+@receiver(m2m_changed, sender=Product.tag.through)
+def sync_tag_relation_postings(sender, instance=None, action=None, reverse=False, pk_set=None, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        tag_postings.invalidate([instance.id])
+        return
+    # 판매중이 아닌 상품은 posting list 에 없으므로 그대로 둡니다.
+    if not instance.is_active:
+        return
+    if action == 'pre_clear':
+        pk_set = list(instance.tag.values_list('id', flat=True))
+    tag_postings.invalidate(pk_set)
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+def invalidate_brand_catalog(sender, **kwargs):
+    brand_catalog.invalidate()
+
+
+@receiver(post_save, sender=GenderDivision)
+@receiver(post_delete, sender=GenderDivision)
+@receiver(post_save, sender=FirstCategory)
+@receiver(post_delete, sender=FirstCategory)
+@receiver(post_save, sender=SecondCategory)
+@receiver(post_delete, sender=SecondCategory)
+@receiver(post_save, sender=Size)
+@receiver(post_delete, sender=Size)
+def invalidate_category_tree(sender, **kwargs):
+    category_tree.invalidate()
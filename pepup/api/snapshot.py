@@ -0,0 +1,117 @@
+"""
+거의 바뀌지 않는 목록(브랜드, 카테고리 등)을 미리 만들어 둔 snapshot 입니다.
+
+snapshot 은 공유 캐시에 (version, data) 로 저장되고 process 메모리에도 복사됩니다.
+요청마다 공유 캐시의 version 만 확인하고 같으면 메모리의 data 를 그대로 사용합니다.
+version 은 data 의 hash 이므로 그대로 ETag 로 사용합니다.
+캐시가 process 별(locmem) 인 경우 다른 process 의 invalidate 가 전달되지 않으므로
+snapshot 은 SNAPSHOT_TIMEOUT 이 지나면 다시 만듭니다.
+"""
+import hashlib
+import json
+import threading
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Case, IntegerField, When, Prefetch
+from django.utils.cache import quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from .cache import get_cache
+from .models import Brand, GenderDivision, FirstCategory, SecondCategory, Size
+from .serializers import BrandSerializer, GenderTreeSerializer
+
+SNAPSHOT_VERSION_KEY = 'snapshot:{}:version'
+SNAPSHOT_DATA_KEY = 'snapshot:{}:data'
+
+
+class Snapshot:
+
+    def __init__(self, name, builder):
+        """
+        :param name: 캐시 key 에 사용할 이름
+        :param builder: json 으로 변환 가능한 data 를 return 하는 함수
+        """
+        self.name = name
+        self.builder = builder
+        self.lock = threading.Lock()
+        self.local = None  # (version, data)
+
+    @property
+    def version_key(self):
+        return SNAPSHOT_VERSION_KEY.format(self.name)
+
+    @property
+    def data_key(self):
+        return SNAPSHOT_DATA_KEY.format(self.name)
+
+    def get_timeout(self):
+        return getattr(settings, 'SNAPSHOT_TIMEOUT', 60 * 5)
+
+    def build(self):
+        data = self.builder()
+        version = hashlib.md5(json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True).encode()).hexdigest()
+        cache = get_cache()
+        cache.set(self.data_key, (version, data), timeout=self.get_timeout())
+        cache.set(self.version_key, version, timeout=self.get_timeout())
+        return version, data
+
+    def get(self):
+        """
+        (version, data) 를 return 합니다.
+        """
+        cache = get_cache()
+        version = cache.get(self.version_key)
+        local = self.local
+        if local is not None and version is not None and local[0] == version:
+            return local
+        with self.lock:
+            stored = cache.get(self.data_key)
+            if version is None or stored is None or stored[0] != version:
+                stored = self.build()
+            self.local = stored
+        return stored
+
+    def invalidate(self):
+        get_cache().delete_many([self.version_key, self.data_key])
+
+    def get_response(self, request):
+        """
+        If-None-Match 가 현재 version 과 같으면 304, 아니면 data 와 ETag 를 return 합니다.
+        """
+        version, data = self.get()
+        etag = quote_etag(version)
+        if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(data)
+        response['ETag'] = etag
+        return response
+
+
+def build_brand_catalog():
+    """
+    Other (선택안함) 이 최상단에 있는 브랜드 목록
+    """
+    brands = Brand.objects.order_by(Case(When(name='Other', then=0), default=1, output_field=IntegerField()), 'id')
+    return json.loads(json.dumps(BrandSerializer(brands, many=True).data, cls=DjangoJSONEncoder))
+
+
+brand_catalog = Snapshot('brand-catalog', build_brand_catalog)
+
+
+def build_category_tree():
+    """
+    gender -> first_category -> (second_category, size) 전체 계층을 4번의 쿼리로 만듭니다.
+    """
+    first_categories = FirstCategory.objects.filter(is_active=True).prefetch_related(
+        Prefetch('second_category', queryset=SecondCategory.objects.filter(is_active=True)),
+        Prefetch('size', queryset=Size.objects.all()),
+    )
+    genders = GenderDivision.objects.filter(is_active=True)\
+        .prefetch_related(Prefetch('category', queryset=first_categories))
+    return json.loads(json.dumps(GenderTreeSerializer(genders, many=True).data, cls=DjangoJSONEncoder))
+
+
+category_tree = Snapshot('category-tree', build_category_tree)
@@ -0,0 +1,621 @@
+import datetime
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from accounts.models import User, Profile, DeliveryPolicy
+from payment.models import Deal, Trade
+from .autocomplete import AutocompleteIndex, autocomplete, decompose
+from . import hot_search
+from .benchmark import SyntheticCatalog, SearchBenchmark
+from .cache import get_cache, get_product_detail_stats
+from .feed import backfill_follow, remove_follow
+from .recommend import rebuild_related_products
+from .search import get_search_backend, search_products, count_products, tokenize
+from .snapshot import category_tree
+from .models import (SearchQueryLog, Product, ProdThumbnail, ProdS3Image, Brand, Tag, Like, Follow, FeedItem,
+                     GenderDivision, FirstCategory, SecondCategory, Size, StoreStats, RelatedProduct)
+
+
+class ProductRetrieveTestCase(TransactionTestCase):
+    """
+    연관 상품은 on_commit 이후 계산되므로 TransactionTestCase 를 사용합니다.
+    """
+
+    def setUp(self):
+        get_cache().clear()
+        self.seller = User.objects.create(email='seller@pepup.com', nickname='seller', phone='01000000001')
+        self.buyer = User.objects.create(email='buyer@pepup.com', nickname='buyer', phone='01000000002')
+        Profile.objects.create(user=self.seller)
+        DeliveryPolicy.objects.create(seller=self.seller, general=2500, mountain=5000)
+
+        brand = Brand.objects.create(name='brand')
+        gender = GenderDivision.objects.create(name=GenderDivision.WOMAN)
+        first_category = FirstCategory.objects.create(gender=gender, name='TOP')
+        second_category = SecondCategory.objects.create(parent=first_category, name='T-SHIRT')
+        size = Size.objects.create(category=first_category, size_name='M', size=95)
+        tags = [Tag.objects.create(tag='tag{}'.format(i)) for i in range(3)]
+
+        products = []
+        for i in range(4):
+            product = Product.objects.create(
+                name='product{}'.format(i), brand=brand, size=size, price=10000, content='',
+                seller=self.seller, first_category=first_category, second_category=second_category)
+            ProdS3Image.objects.create(product=product, image_key='7b0d5f8e-8f4f-4bb5-b0a0-5d0d6f1d4a1{}'.format(i))
+            product.tag.add(*tags[:i + 1])
+            products.append(product)
+        # ProdThumbnail.save 는 이미지를 다운로드하므로 bulk_create 로 생성
+        ProdThumbnail.objects.bulk_create([ProdThumbnail(product=product) for product in products])
+        self.product = products[-1]
+        Like.objects.create(user=self.buyer, product=self.product)
+
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.buyer)
+
+    def test_retrieve_query_count(self):
+        url = reverse('api:products-detail', args=[self.product.pk])
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(context.captured_queries), 5)
+
+        data = response.data
+        self.assertTrue(data['liked'])
+        self.assertFalse(data['isbagged'])
+        self.assertEqual(data['product']['seller']['followers'], 0)
+        self.assertEqual(len(data['product']['tag']), 3)
+        self.assertEqual(len(data['related_products']), 3)
+
+    def test_retrieve_cache(self):
+        url = reverse('api:products-detail', args=[self.product.pk])
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        # 캐시 hit 시 liked, isbagged, seller 통계, 연관 상품만 조회
+        self.assertEqual(len(context.captured_queries), 4)
+        self.assertTrue(response.data['liked'])
+        self.assertEqual(get_product_detail_stats()['hit'], 1)
+
+        # 판매중이 아니게 된 연관 상품은 캐시와 무관하게 제외
+        related_id = response.data['related_products'][0]['id']
+        Product.objects.filter(id=related_id).update(is_active=False)
+        response = self.client.get(url)
+        self.assertNotIn(related_id, [related['id'] for related in response.data['related_products']])
+
+        # seller 통계는 캐시와 무관하게 최신 값
+        StoreStats.increase(self.seller.id, follower_count=1)
+        response = self.client.get(url)
+        self.assertEqual(response.data['product']['seller']['followers'], 1)
+        self.assertEqual(get_product_detail_stats()['hit'], 3)
+
+        self.product.name = 'renamed'
+        self.product.save()
+        response = self.client.get(url)
+        self.assertEqual(response.data['product']['name'], 'renamed')
+        self.assertEqual(get_product_detail_stats()['miss'], 2)
+
+        # 판매자 nickname 변경
+        self.seller.nickname = 'renamed seller'
+        self.seller.save()
+        response = self.client.get(url)
+        self.assertEqual(response.data['product']['seller']['nickname'], 'renamed seller')
+        self.assertEqual(get_product_detail_stats()['miss'], 3)
+
+
+    def test_related_products_sync(self):
+        other_category = SecondCategory.objects.create(parent=self.product.first_category, name='SHIRT')
+        moved = Product.objects.get(name='product0')
+        moved.second_category = other_category
+        moved.save()
+        # 이전 소분류 이웃의 연관 상품에서 빠짐
+        self.assertFalse(RelatedProduct.objects.filter(related=moved).exists())
+
+        # 새 상품은 태그가 없어도 같은 소분류 상품으로 채워짐
+        product = Product.objects.create(name='new', brand=moved.brand, price=10000, content='',
+                                         seller=self.seller, second_category=other_category)
+        self.assertEqual(list(RelatedProduct.objects.filter(product=product).values_list('related_id', flat=True)),
+                         [moved.id])
+
+
+    def test_related_products_once_per_edit(self):
+        neighbor = Product.objects.get(name='product2')
+        self.assertEqual(RelatedProduct.objects.get(product=neighbor, related=self.product).score, 2)
+        with mock.patch('api.recommend.rebuild_related_products', wraps=rebuild_related_products) as rebuild:
+            # set 은 post_remove, post_add 를 모두 보냄
+            self.product.tag.set(list(Tag.objects.filter(tag__in=['tag0', 'tag2'])))
+        self.assertEqual(len([call for call in rebuild.call_args_list if call[0][0] == self.product]), 1)
+        # score 가 줄어든 이웃은 다시 계산
+        self.assertEqual(RelatedProduct.objects.get(product=neighbor, related=self.product).score, 1)
+
+
+class ListImageQueryBenchmark(TestCase):
+    """
+    list api 별로 이미지(ProdS3Image, ProdThumbnail) 관련 쿼리 수를 측정합니다.
+    상품 수와 관계없이 테이블마다 최대 한번(select_related join 또는 prefetch)만 조회해야 합니다.
+    """
+    IMAGE_TABLES = ('api_prods3image', 'api_prodthumbnail')
+    PRODUCT_COUNT = 6
+
+    def setUp(self):
+        self.seller = User.objects.create(email='seller@pepup.com', nickname='seller', phone='01000000001')
+        self.buyer = User.objects.create(email='buyer@pepup.com', nickname='buyer', phone='01000000002')
+        Profile.objects.create(user=self.seller)
+        Profile.objects.create(user=self.buyer)
+        DeliveryPolicy.objects.create(seller=self.seller, general=0, mountain=5000)
+        Follow.objects.create(_from=self.buyer, _to=self.seller)
+
+        brand = Brand.objects.create(name='brand')
+        self.tag = Tag.objects.create(tag='tag')
+        products = []
+        for i in range(self.PRODUCT_COUNT):
+            product = Product.objects.create(name='product{}'.format(i), brand=brand, price=10000,
+                                             content='', seller=self.seller)
+            for j in range(2):
+                ProdS3Image.objects.create(product=product,
+                                           image_key='7b0d5f8e-8f4f-4bb5-b0a0-5d0d6f1d4a{}{}'.format(i, j))
+            product.tag.add(self.tag)
+            Like.objects.create(user=self.buyer, product=product)
+            products.append(product)
+        ProdThumbnail.objects.bulk_create([ProdThumbnail(product=product) for product in products])
+
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.buyer)
+
+    def count_image_queries(self, response_getter):
+        with CaptureQueriesContext(connection) as context:
+            response = response_getter()
+        self.assertEqual(response.status_code, 200)
+        return {table: len([query for query in context.captured_queries if table in query['sql']])
+                for table in self.IMAGE_TABLES}
+
+    def assert_image_queries_bounded(self, response_getter):
+        for table, count in self.count_image_queries(response_getter).items():
+            self.assertLessEqual(count, 1, table)
+
+    def test_home_list(self):
+        self.assert_image_queries_bounded(lambda: self.client.get(reverse('api:products-list')))
+
+    def test_home_pagination(self):
+        # 기본은 page 번호, cursor 를 보낸 경우에만 cursor pagination
+        self.assertIn('count', self.client.get(reverse('api:products-list')).data)
+        data = self.client.get(reverse('api:products-list'), {'cursor': ''}).data
+        self.assertNotIn('count', data)
+        self.assertIn('next', data)
+
+    def test_filter(self):
+        self.assert_image_queries_bounded(
+            lambda: self.client.post(reverse('api:products-filter'), {}, format='json'))
+
+    def test_follow_list(self):
+        self.assert_image_queries_bounded(lambda: self.client.get(reverse('api:follow-list')))
+
+    def test_follow_pagination(self):
+        self.assertIn('count', self.client.get(reverse('api:follow-list')).data)
+        self.assertNotIn('count', self.client.get(reverse('api:follow-list'), {'cursor': ''}).data)
+
+    def test_product_search(self):
+        self.assert_image_queries_bounded(
+            lambda: self.client.post(reverse('api:search-product-search'), {'keyword': 'product'}, format='json'))
+
+    def test_tag_search(self):
+        self.assert_image_queries_bounded(
+            lambda: self.client.get(reverse('api:search-tag-search', args=[self.tag.pk])))
+
+    def test_store_shop(self):
+        self.assert_image_queries_bounded(
+            lambda: self.client.get(reverse('api:shop-shop', args=[self.seller.pk])))
+
+    def test_store_like(self):
+        self.assert_image_queries_bounded(
+            lambda: self.client.get(reverse('api:shop-like', args=[self.buyer.pk])))
+
+
+class FollowFeedTestCase(TestCase):
+
+    def setUp(self):
+        self.seller = User.objects.create(email='seller@pepup.com', nickname='seller', phone='01000000001')
+        self.user = User.objects.create(email='user@pepup.com', nickname='user', phone='01000000002')
+        self.vintage = Tag.objects.create(tag='빈티지')
+        self.hood = Tag.objects.create(tag='후드')
+        brand = Brand.objects.create(name='brand')
+        self.both = Product.objects.create(name='빈티지 후드', brand=brand, price=10000, content='', seller=self.seller)
+        self.both.tag.add(self.vintage, self.hood)
+        self.vintage_only = Product.objects.create(name='빈티지 셔츠', brand=brand, price=10000, content='',
+                                                   seller=self.seller)
+        self.vintage_only.tag.add(self.vintage)
+
+    def follow(self, tag):
+        follow = Follow.objects.create(_from=self.user, tag=tag)
+        backfill_follow(follow)
+        return follow
+
+    def test_unfollow_tag(self):
+        follow = self.follow(self.vintage)
+        self.follow(self.hood)
+        follow.is_follow = False
+        follow.save()
+        remove_follow(follow)
+        # 다른 follow 태그(후드) 가 달린 상품은 남음
+        self.assertEqual(dict(FeedItem.objects.filter(user=self.user).values_list('product_id', 'tag_id')),
+                         {self.both.id: self.hood.id})
+
+
+class ProductSearchTestCase(TestCase):
+
+    def setUp(self):
+        self.seller = User.objects.create(email='seller@pepup.com', nickname='seller', phone='01000000001')
+        brand = Brand.objects.create(name='나이키')
+        tag = Tag.objects.create(tag='빈티지')
+        self.old = Product.objects.create(name='나이키 후드티', brand=brand, price=10000,
+                                          content='오버핏 후드', seller=self.seller)
+        self.new = Product.objects.create(name='데님 자켓', brand=brand, price=10000,
+                                          content='후드 없음', seller=self.seller)
+        self.new.tag.add(tag)
+        self.other = Product.objects.create(name='청바지', brand=Brand.objects.create(name='levis'),
+                                            price=10000, content='', seller=self.seller)
+
+    def search(self, keyword):
+        return list(search_products(Product.objects.filter(is_active=True), keyword))
+
+    def assert_search(self):
+        # 상품명 매칭(가중치 3)이 설명 매칭(가중치 1)보다 앞에 옵니다.
+        self.assertEqual(self.search('후드'), [self.old, self.new])
+        # 띄어쓰기 없이도 n-gram 으로 매칭됩니다.
+        self.assertEqual(self.search('후드티'), [self.old])
+        self.assertEqual(self.search('빈티지'), [self.new])
+        self.assertEqual(self.search('나이키'), [self.old, self.new])
+        self.assertEqual(self.search('없는상품'), [])
+        # NGRAM_SIZE 보다 짧은 검색어는 한 글자 token 으로 매칭됩니다.
+        self.assertEqual(self.search('후'), [self.old, self.new])
+        self.assertEqual(self.search('나'), [self.old, self.new])
+
+        self.old.is_active = False
+        self.old.save()
+        self.assertEqual(self.search('후드'), [self.new])
+
+    def test_count(self):
+        get_cache().clear()
+        self.assertEqual(count_products('후드티', exact=True), (1, True))
+        # '후드' posting 2개, '드티' posting 1개 중 작은 값
+        self.assertEqual(count_products('후드티'), (1, False))
+        self.assertEqual(count_products('후드'), (2, False))
+        self.assertEqual(count_products('나'), (2, False))
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize('후드티 M'), {'후드', '드티', 'm'})
+        self.assertEqual(tokenize('후드티 M', unigrams=True), {'후드', '드티', '후', '드', '티', 'm'})
+
+    def test_database_backend(self):
+        self.assert_search()
+
+    def test_skip_unchanged(self):
+        # 검색 대상 필드가 그대로인 저장은 다시 index 하지 않습니다.
+        self.old.price = 20000
+        with CaptureQueriesContext(connection) as context:
+            self.old.save()
+        self.assertFalse(any('api_productsearchtoken' in query['sql'] for query in context.captured_queries))
+
+        self.old.name = '나이키 맨투맨'
+        self.old.save()
+        self.assertEqual(self.search('맨투맨'), [self.old])
+
+    @override_settings(PRODUCT_SEARCH_BACKEND='api.search.MemorySearchBackend')
+    def test_memory_backend(self):
+        get_search_backend().clear()
+        for product in Product.objects.all():
+            get_search_backend().update(product)
+        self.assert_search()
+
+
+class AutocompleteTestCase(TestCase):
+
+    def test_decompose(self):
+        self.assertEqual(decompose('후드'), 'ㅎㅜㄷㅡ')
+        # 입력 중인 글자
+        self.assertTrue(decompose('후드').startswith(decompose('훋')))
+        self.assertTrue(decompose('과자').startswith(decompose('ㄱㅘ')))
+
+    def test_index(self):
+        index = AutocompleteIndex()
+        index.add(1, '후드티', 3)
+        index.add(2, '빈티지 후드', 10)
+        index.add(3, '후리스', 1)
+        self.assertEqual(index.search('후', 5), [(2, '빈티지 후드'), (1, '후드티'), (3, '후리스')])
+        self.assertEqual(index.search('훋', 5), [(2, '빈티지 후드'), (1, '후드티')])
+        bulk = AutocompleteIndex()
+        bulk.add_many([(1, '후드티', 3), (2, '빈티지 후드', 10), (3, '후리스', 1)])
+        self.assertEqual(bulk.keys, index.keys)
+
+        index.remove(2)
+        index.add_weight(3, 5)
+        self.assertEqual(index.search('후', 5), [(3, '후리스'), (1, '후드티')])
+
+    def test_signals(self):
+        autocomplete.load()
+        tag = Tag.objects.create(tag='빈티지')
+        brand = Brand.objects.create(name='나이키')
+        seller = User.objects.create(email='seller@pepup.com', nickname='빈티지샵', phone='01000000001')
+        product = Product.objects.create(name='후드', brand=brand, price=10000, content='', seller=seller)
+        product.tag.add(tag)
+
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(autocomplete.search_tags('빈ㅌ', 5), [{'tag': '빈티지', 'id': tag.id}])
+            self.assertEqual(autocomplete.search_brands('나', 5), [(brand.id, '나이키')])
+            self.assertEqual(autocomplete.search_sellers('빈티', 5), [seller.id])
+        self.assertEqual(len(context.captured_queries), 0)
+        self.assertEqual(autocomplete.tags.items[tag.id], ('빈티지', 1))
+        self.assertEqual(Tag.objects.get(id=tag.id).product_count, 1)
+
+        # 판매중 여부가 바뀔 때만 증감
+        product.is_active = False
+        product.save()
+        product.save()
+        self.assertEqual(Tag.objects.get(id=tag.id).product_count, 0)
+        self.assertEqual(autocomplete.tags.items[tag.id], ('빈티지', 0))
+        product.is_active = True
+        product.save()
+        self.assertEqual(Tag.objects.get(id=tag.id).product_count, 1)
+
+        seller.is_active = False
+        seller.save()
+        self.assertEqual(autocomplete.search_sellers('빈티', 5), [])
+
+
+class HotSearchTestCase(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.seller = User.objects.create(email='seller@pepup.com', nickname='seller', phone='01000000001')
+        self.buyer = User.objects.create(email='buyer@pepup.com', nickname='buyer', phone='01000000002')
+        brand = Brand.objects.create(name='brand')
+        self.products = [Product.objects.create(name='후드 {}'.format(i), brand=brand, price=10000,
+                                                content='', seller=self.seller) for i in range(3)]
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.buyer)
+        self.url = reverse('api:search-product-search')
+
+    def search(self):
+        response = self.client.post(self.url, {'keyword': ' 후드 '}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_hot_query_cache(self):
+        self.search()
+        self.assertEqual(hot_search.get_hot_queries(SearchQueryLog.PRODUCT, refresh=True), {'후드'})
+        self.search()
+        data = self.search()
+        self.assertEqual(data['count'], 3)
+        self.assertEqual([product['id'] for product in data['results']],
+                         [product.id for product in reversed(self.products)])
+
+        # 매칭되는 상품이 바뀌면 캐시 삭제
+        self.products[0].is_active = False
+        self.products[0].save()
+        self.assertEqual(self.search()['count'], 2)
+
+        stats = hot_search.get_stats()[SearchQueryLog.PRODUCT]
+        self.assertEqual(stats['count'], 4)
+        self.assertEqual(stats['hit'], 1)
+
+        # 수정으로 더 이상 매칭되지 않는 상품도 수정 전 document 로 캐시 삭제
+        self.products[1].name = '셔츠'
+        self.products[1].save()
+        self.assertEqual(self.search()['count'], 1)
+
+    def test_stats(self):
+        SearchQueryLog.objects.bulk_create([
+            SearchQueryLog(kind=SearchQueryLog.TAG, query='1', latency=latency, cached=latency % 2 == 0)
+            for latency in range(20, 0, -1)])
+        with CaptureQueriesContext(connection) as context:
+            stats = hot_search.get_stats()
+        # 종류별 집계, p95 조회
+        self.assertEqual(len(context.captured_queries), 3)
+        self.assertEqual(stats[SearchQueryLog.TAG], {'count': 20, 'hit': 10, 'hit_rate': 0.5, 'p95': 19.0})
+        self.assertEqual(stats[SearchQueryLog.PRODUCT]['p95'], 0.0)
+
+
+class TagPostingsTestCase(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.seller = User.objects.create(email='seller@pepup.com', nickname='seller', phone='01000000001')
+        self.tag = Tag.objects.create(tag='빈티지')
+        brand = Brand.objects.create(name='brand')
+        self.products = []
+        for i in range(3):
+            product = Product.objects.create(name='후드 {}'.format(i), brand=brand, price=10000,
+                                             content='', seller=self.seller)
+            product.tag.add(self.tag)
+            self.products.append(product)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.seller)
+        self.url = reverse('api:search-tag-search', args=[self.tag.id])
+
+    def get_ids(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [product['id'] for product in response.data['results']], response.data
+
+    def test_pagination(self):
+        newest = [product.id for product in reversed(self.products)]
+        # 기본은 page 번호 pagination
+        ids, data = self.get_ids()
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(ids, newest)
+        self.assertIsNone(data['next'])
+        # 범위를 벗어난 page 는 404
+        self.assertEqual(self.client.get(self.url, {'page': 2}).status_code, 404)
+
+        # cursor pagination 은 cursor 를 보낸 경우에만
+        ids, data = self.get_ids(cursor='')
+        self.assertEqual(ids, newest)
+        ids, data = self.get_ids(cursor=newest[0])
+        self.assertEqual(ids, newest[1:])
+        self.assertIsNone(data['next'])
+
+    def test_sync(self):
+        self.get_ids()
+        self.products[0].is_active = False
+        self.products[0].save()
+        self.products[1].tag.remove(self.tag)
+        product = Product.objects.create(name='후드 new', brand=self.products[0].brand, price=10000,
+                                         content='', seller=self.seller)
+        product.tag.add(self.tag)
+
+        ids, data = self.get_ids()
+        self.assertEqual(ids, [product.id, self.products[2].id])
+        self.assertEqual(data['count'], 2)
+
+        # 판매중 여부가 그대로인 저장은 posting list 를 지우지 않음
+        self.products[2].name = '후드 수정'
+        self.products[2].save()
+        with CaptureQueriesContext(connection) as context:
+            self.get_ids()
+        self.assertFalse(any('api_product_tag' in query['sql'] for query in context.captured_queries))
+
+
+class BrandCatalogTestCase(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create(email='user@pepup.com', nickname='user', phone='01000000001')
+        Brand.objects.create(name='nike')
+        self.other = Brand.objects.create(name='Other')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.url = '/api/brand/'
+
+    def test_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual([brand['name'] for brand in response.data], ['Other', 'nike'])
+        etag = response['ETag']
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(context.captured_queries), 0)
+
+        Brand.objects.create(name='adidas')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.data), 3)
+
+
+class CategoryTreeTestCase(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create(email='user@pepup.com', nickname='user', phone='01000000001')
+        for name in (GenderDivision.WOMAN, GenderDivision.MAN):
+            gender = GenderDivision.objects.create(name=name)
+            for category_name in ('TOP', 'BAG'):
+                first_category = FirstCategory.objects.create(gender=gender, name=category_name)
+                SecondCategory.objects.create(parent=first_category, name='{}-1'.format(category_name))
+                Size.objects.create(category=first_category, size_name='M', size=95)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.url = '/api/category/category_tree/'
+
+    def test_category_tree(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(context.captured_queries), 4)
+        self.assertEqual(len(response.data), 2)
+        bag = response.data[0]['category'][1]
+        self.assertEqual(bag['size'][0]['name'], '없음')
+        self.assertEqual(bag['second_category'][0]['name'], 'BAG-1')
+
+        etag = response['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        SecondCategory.objects.create(parent=FirstCategory.objects.first(), name='new')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_expired(self):
+        etag = self.client.get(self.url)['ETag']
+        # signal 이 전달되지 않은 다른 process 의 변경도 snapshot 이 만료되면 반영됩니다.
+        SecondCategory.objects.filter(name='BAG-1').update(name='BAG-2')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        get_cache().delete(category_tree.version_key)  # SNAPSHOT_TIMEOUT 경과
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['category'][1]['second_category'][0]['name'], 'BAG-2')
+
+
+class SellerSearchTestCase(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create(email='user@pepup.com', nickname='user', phone='01000000001')
+        brand = Brand.objects.create(name='brand')
+        self.sellers = []
+        for i, nickname in enumerate(['빈티지샵', '샵빈티지', '구제샵']):
+            seller = User.objects.create(email='seller{}@pepup.com'.format(i), nickname=nickname,
+                                         phone='0100000001{}'.format(i))
+            Profile.objects.create(user=seller)
+            for _ in range(i + 1):
+                Product.objects.create(name='product', brand=brand, price=10000, content='', seller=seller)
+            self.sellers.append(seller)
+        autocomplete.load()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_ranked_by_seller_score(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(reverse('api:search-searching'), {'keyword': '빈티'}, format='json')
+        # 추정 상품 수, 판매자, socialaccount
+        self.assertLessEqual(len(context.captured_queries), 3)
+        self.assertEqual([seller['id'] for seller in response.data['seller_result']],
+                         [self.sellers[1].id, self.sellers[0].id])
+        self.assertEqual(set(response.data['seller_result'][0]), {'id', 'nickname', 'profile'})
+
+    def test_product_count(self):
+        seller = self.sellers[2]
+        product = Product.objects.filter(seller=seller).first()
+        self.assertEqual(StoreStats.objects.get(user=seller).product_count, 3)
+        # 판매중 여부가 바뀔 때만 증감
+        product.is_active = False
+        product.save()
+        product.save()
+        self.assertEqual(StoreStats.objects.get(user=seller).product_count, 2)
+        product.is_active = True
+        product.save()
+        self.assertEqual(StoreStats.objects.get(user=seller).product_count, 3)
+
+    def test_reconcile_recent_sold(self):
+        seller = self.sellers[2]
+        products = list(Product.objects.filter(seller=seller))
+        now = datetime.datetime.now()
+        for product, (status, completed) in zip(products, [(2, now), (5, now - datetime.timedelta(days=60)),
+                                                           (-3, now)]):
+            deal = Deal.objects.create(seller=seller, buyer=self.user, total=10000, remain=10000,
+                                       delivery_charge=0, status=status, transaction_completed_date=completed)
+            Trade.objects.create(deal=deal, product=product, seller=seller, buyer=self.user)
+        # 상품 수정 시각은 판매 시각과 무관
+        Product.objects.filter(seller=seller).update(sold=True)
+
+        call_command('reconcile_store_stats', stdout=StringIO())
+        self.assertEqual(StoreStats.objects.get(user=seller).recent_sold_count, 1)
+        self.assertEqual(StoreStats.objects.get(user=self.sellers[0]).recent_sold_count, 0)
+
+
+class SearchBenchmarkTestCase(TestCase):
+
+    def test_run(self):
+        get_cache().clear()
+        catalog = SyntheticCatalog(200)
+        catalog.create()
+        user = User.objects.create(email='user@pepup.com', nickname='user', phone='01000000001')
+        report = SearchBenchmark(user, catalog=catalog, k=10).run(catalog.generate_queries(50))
+
+        self.assertEqual(set(report), {'searching', 'product_search', 'tag_search'})
+        self.assertEqual(sum(row['requests'] for row in report.values()), 50)
+        self.assertLessEqual(report['product_search']['p50'], report['product_search']['p99'])
+        self.assertTrue(0 <= report['product_search']['recall@10'] <= 1)
@@ -7,17 +7,19 @@ import uuid
 
 import boto3
 import requests
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework import mixins
 from rest_framework.decorators import action
 from rest_framework import status, viewsets
-from django.db.models import F, Count, ExpressionWrapper
+from django.db.models import F, Count, ExpressionWrapper, Exists, OuterRef, Subquery
 from django.http import Http404
+from django.shortcuts import get_object_or_404
 from django.db.models import Q as q
 from django.db import transaction
 from django.db.models import IntegerField, Value, Case, When
 from django.db.models.functions import Ceil
+from allauth.socialaccount.models import SocialAccount
 
 # model
 from accounts.models import User, DeliveryPolicy, Profile, StoreAccount
@@ -25,7 +27,8 @@ from payment.models import Trade
 from .loader import load_credential
 from .models import (Product, ProdThumbnail,
                      Brand, Like, Follow,
-                     Tag, FirstCategory, SecondCategory, Size, GenderDivision, ProdImage, ProdS3Image)
+                     Tag, FirstCategory, SecondCategory, Size, GenderDivision, ProdImage, ProdS3Image,
+                     ProductFacet, StoreStats, SearchQueryLog)
 
 # serializer
 from .serializers import (
@@ -38,18 +41,31 @@ from .serializers import (
     StoreSerializer, StoreLikeSerializer, FirstCategorySerializer, SecondCategorySerializer,
     GenderSerializer, SizeSerializer, ProductCreateSerializer, ReviewCreateSerializer,
     SimpleProfileSerializer, StoreReviewSerializer, DeliveryPolicyWriteSerializer,
-    StoreProfileRetrieveSerializer, StoreAccountSerializer, StoreAccountWriteSerializer)
+    StoreProfileRetrieveSerializer, StoreAccountSerializer, StoreAccountWriteSerializer,
+    ProductFacetSerializer, SellerSearchSerializer, get_images_prefetch)
 
 from accounts.serializers import UserSerializer
 
-from api.pagination import FollowPagination, HomePagination, ProductSearchResultPagination, \
-    TagSearchResultPagination, StorePagination, StoreReviewPagination
+from api.pagination import FollowPagination, FollowCursorPagination, HomePagination, ProductSearchResultPagination, \
+    TagSearchResultPagination, StorePagination, StoreReviewPagination, HomeCursorPagination, FilterPagination
 
 # bootpay
 from payment.Bootpay import BootpayApi
 
 # utils
 from .utils import generate_s3_presigned_post
+from .facets import get_facet_filters, get_facet_counts
+from .search import search_products, count_products
+from . import hot_search
+from . import postings as tag_postings
+from .hot_search import SearchTimer
+from .autocomplete import autocomplete
+from .snapshot import brand_catalog, category_tree
+from .feed import get_feed_queryset, backfill_follow, remove_follow
+from .cache import get_product_detail, set_product_detail, get_product_detail_stats
+
+# 상품 상세의 seller 통계 (UserSerializer), 캐싱하지 않고 요청마다 조회
+SELLER_STATS_FIELDS = ('review_score', 'sold', 'followers')
 
 
 class ProductViewSet(viewsets.GenericViewSet):
@@ -59,109 +75,54 @@ class ProductViewSet(viewsets.GenericViewSet):
     serializer_class = ProductSerializer
 
     def get_serializer_class(self):
-        if self.action in ['list', 'filter']:
+        if self.action == 'list':
             return MainSerializer
+        elif self.action == 'filter':
+            return ProductFacetSerializer
         elif self.action in ['create', 'update']:
             return ProductCreateSerializer
         elif self.action in ['like', 'liked']:
             return LikeSerializer
         return super(ProductViewSet, self).get_serializer_class()
 
+    def get_home_paginator(self, request):
+        """
+        기본은 기존 앱 빌드와 같은 page 번호 HomePagination 이며,
+        cursor 를 보내는 경우(첫 페이지는 빈 값 cursor=)에만 opaque cursor 를 주는 HomeCursorPagination 을 사용합니다.
+        """
+        if HomeCursorPagination.cursor_query_param in request.query_params:
+            return HomeCursorPagination()
+        return HomePagination()
+
     def list(self, request):
         """
         :method: GET
-        :param request:
+        :param request: page (page 번호 pagination), cursor (cursor pagination 사용시, 첫 페이지는 빈 값)
         :return:
         """
         products = self.get_queryset().\
             select_related('prodthumbnail').all()
 
-        paginator = self.pagination_class()
+        paginator = self.get_home_paginator(request)
         page = paginator.paginate_queryset(queryset=products, request=request)
         serializer = self.get_serializer(page, many=True)
         return paginator.get_paginated_response(serializer.data)
 
     @action(methods=['post'], detail=False)
     def filter(self, request, *args, **kwargs):
-        filter_data = self.request.data.copy()
+        """
+        ProductFacet 테이블에서 조건에 맞는 상품과 facet 별 상품 개수를 함께 return 합니다.
+        :param request: gender, first_category, second_category, size, brand,
+                        on_sale, lower_price, higher_price, free_delivery
+        :return: paginated data, facets
+        """
+        filters = get_facet_filters(self.request.data)
+        facets = ProductFacet.objects.filter(is_active=True)
 
-        queryset = self.get_queryset()\
-            .select_related(
-            'brand',
-            'first_category',
-            'first_category__gender',
-            'second_category',
-            'size',
-            'seller__delivery_policy',
-            'second_category__parent',
-            'prodthumbnail'
-            ).all()
-
-        if 'gender' in filter_data:
-            gender = filter_data.pop('gender')  # gender obj id(int)
-            queryset = queryset \
-                .filter(first_category__isnull=False) \
-                .filter(first_category__gender_id=gender)
-
-        if 'first_category' in filter_data:
-            first_category = filter_data.pop('first_category')
-            queryset = queryset \
-                .filter(first_category_id=first_category)
-
-        if 'second_category' in filter_data:
-            second_category = filter_data.pop('second_category')
-            queryset = queryset \
-                .filter(second_category_id=second_category)
-
-        if 'size' in filter_data:
-            size = filter_data.pop('size')
-            queryset = queryset \
-                .filter(size_id=size)
-
-        if 'brand' in filter_data:
-            brand = filter_data.pop('brand')
-            queryset = queryset \
-                .filter(brand_id=brand)
-
-        if 'on_sale' in filter_data:
-            on_sale = filter_data.pop('on_sale')
-            # on_sale=True
-            if on_sale:
-                queryset = queryset.filter(on_discount=True)
-
-                # calculate discount price
-                queryset = queryset \
-                    .annotate(discount_price=ExpressionWrapper(
-                    Ceil((F('price') * (1 - F('discount_rate'))) / 100) * 100,
-                    output_field=IntegerField()))
-
-                if 'lower_price' in filter_data:
-                    lower_price = filter_data.pop('lower_price')
-                    queryset = queryset.filter(discount_price__gte=lower_price)
-
-                if 'higher_price' in filter_data:
-                    higher_price = filter_data.pop('higher_price')
-                    queryset = queryset.filter(discount_price__lte=higher_price)
-
-        # no on_sale data or on_sale=False
-        if 'lower_price' in filter_data:
-            lower_price = filter_data.pop('lower_price')
-            queryset = queryset.filter(price__gte=lower_price)
-
-        if 'higher_price' in filter_data:
-            higher_price = filter_data.pop('higher_price')
-            queryset = queryset.filter(price__lte=higher_price)
-
-        if 'free_delivery' in filter_data:
-            queryset = queryset.filter(seller__delivery_policy__general=0)
-
-        products = queryset
-
-        paginator = self.pagination_class()
-        page = paginator.paginate_queryset(queryset=products, request=request)
+        paginator = FilterPagination()
+        page = paginator.paginate_queryset(queryset=facets.filter(**filters), request=request)
         serializer = self.get_serializer(page, many=True)
-        return paginator.get_paginated_response(serializer.data)
-
+        return paginator.get_paginated_response(serializer.data, facets=get_facet_counts(facets, filters))
 
     def set_prodThumbnail(self, product, request):
         for thum in request.FILES.getlist('thums'):
@@ -204,9 +165,11 @@ class ProductViewSet(viewsets.GenericViewSet):
             product = serializer.create(data)
 
             # tag relation
+            tag_ids = []
             for tag_value in tags:
                 tag, _ = Tag.objects.get_or_create(tag=tag_value)
-                product.tag.add(tag.id)
+                tag_ids.append(tag.id)
+            product.tag.add(*tag_ids)
 
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -256,15 +219,12 @@ class ProductViewSet(viewsets.GenericViewSet):
         if 'tag' in data:
             tags = data.pop('tag')
 
-            # tag remove
-            exist_tags = product.tag.all()
-            for exist_tag in exist_tags:
-                product.tag.remove(exist_tag)
-
             # tag update
+            tag_ids = []
             for tag_value in tags:
                 tag, _ = Tag.objects.get_or_create(tag=tag_value)
-                product.tag.add(tag)
+                tag_ids.append(tag.id)
+            product.tag.set(tag_ids)
 
         return Response(serializer.data, status=status.HTTP_206_PARTIAL_CONTENT)
 
@@ -278,6 +238,7 @@ class ProductViewSet(viewsets.GenericViewSet):
             return Response(status=status.HTTP_401_UNAUTHORIZED)
         if instance.sold and instance.sold_status == 1:
             return Response(status=status.HTTP_401_UNAUTHORIZED)
+        # 판매중 상품 수(StoreStats, Tag) 는 api.signals 에서 뺍니다.
         instance.is_active = False
         instance.save()
         return Response(status=status.HTTP_204_NO_CONTENT)
@@ -317,8 +278,7 @@ class ProductViewSet(viewsets.GenericViewSet):
         """
         [DEPRECATED] -> SearchViewSet
         """
-        query = q(name__icontains=pk)
-        products = Product.objects.filter(query)
+        products = search_products(Product.objects.all(), pk)
         page = self.paginate_queryset(products)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -326,6 +286,51 @@ class ProductViewSet(viewsets.GenericViewSet):
         serializers = ProductSerializer(products, many=True)
         return Response(serializers.data)
 
+    def get_detail_object(self, pk, user):
+        """
+        상품 상세에 필요한 데이터를 한번에 조회합니다.
+        liked, bagged 와 seller 의 sold 는 subquery annotation 으로, review_score, followers 는 StoreStats join 으로,
+        tag, image 는 prefetch 로 가져오므로 serializer 에서 추가 쿼리가 발생하지 않습니다.
+        """
+        liked = Like.objects.filter(user=user, product=OuterRef('pk')).values('is_liked')[:1]
+        bagged = Trade.objects.filter(product=OuterRef('pk'), buyer=user, status=1)
+        seller_sold = Product.objects.filter(seller=OuterRef('seller'), sold=True)\
+            .values('seller').annotate(count=Count('id')).order_by().values('count')
+
+        queryset = self.get_queryset()\
+            .select_related('brand', 'size', 'size__category', 'second_category',
+                            'seller', 'seller__profile', 'seller__delivery_policy', 'seller__store_stats')\
+            .prefetch_related('tag', get_images_prefetch())\
+            .annotate(is_liked=Subquery(liked),
+                      is_bagged=Exists(bagged),
+                      seller_sold=Subquery(seller_sold))
+        product = get_object_or_404(queryset, pk=pk)
+
+        # UserSerializer 에서 다시 조회하지 않도록 seller 에 넣어줌
+        seller = product.seller
+        stats = StoreStats.get_for_user(seller)
+        seller.sold_count = product.seller_sold or 0
+        seller.review_score = float(stats.review_score) if stats.review_score is not None else 0.0
+        seller.follower_count = stats.follower_count
+        return product
+
+    def get_seller_stats(self, seller_id):
+        """
+        캐시 hit 시 seller 의 review_score, sold, followers 를 한번에 조회합니다.
+        """
+        sold = Product.objects.filter(seller=OuterRef('pk'), sold=True)\
+            .values('seller').annotate(count=Count('id')).order_by().values('count')
+        row = User.objects.filter(id=seller_id)\
+            .annotate(sold=Subquery(sold))\
+            .values('sold', 'store_stats__review_count', 'store_stats__review_sum', 'store_stats__follower_count')\
+            .first() or {}
+        review_count = row.get('store_stats__review_count')
+        return {
+            'review_score': float(row['store_stats__review_sum'] / review_count) if review_count else 0.0,
+            'sold': row.get('sold') or 0,
+            'followers': row.get('store_stats__follower_count') or 0,
+        }
+
     def retrieve(self, request, pk, format=None):
         """
         :method: GET
@@ -333,59 +338,71 @@ class ProductViewSet(viewsets.GenericViewSet):
         :param pk:
         :param format:
         :return:
+        유저와 무관한 product, delivery_policy 와 연관 상품 id 는 api.cache 에 캐싱하고,
+        liked, isbagged 와 follow, 리뷰, 판매로 자주 바뀌는 seller 통계(review_score, sold, followers) 는 요청마다 조회합니다.
+        연관 상품은 다른 상품의 가격, 판매중 여부가 바뀌어도 맞도록 캐시된 id 로 요청마다 조회합니다.
         """
         user = request.user
-        product = self.get_object()
-        try:
-            like = Like.objects.get(user=user, product=product)
-            is_liked = like.is_liked
-        except Like.DoesNotExist:
-            is_liked = False
-        is_bagged = Trade.objects.filter(product=product, buyer=user, status=1)
-        if is_bagged.exists():
-            bagged = True
+        data = get_product_detail(pk)
+
+        if data is None:
+            product = self.get_detail_object(pk, user)
+
+            if not hasattr(product.seller, 'delivery_policy'):
+                return Response({"message: User has no Delivery_policy"}, status=status.HTTP_404_NOT_FOUND)
+
+            related_products = list(self.get_related_products(product))
+            product_data = ProductSerializer(product).data
+            seller_stats = {key: product_data['seller'][key] for key in SELLER_STATS_FIELDS}
+            data = {
+                'product': product_data,
+                'delivery_policy': DeliveryPolicySerializer(product.seller.delivery_policy).data,
+                'related_ids': [related.id for related in related_products]
+            }
+            # seller 통계는 캐싱하지 않음
+            seller_data = {key: value for key, value in product_data['seller'].items()
+                           if key not in SELLER_STATS_FIELDS}
+            set_product_detail(pk, dict(data, product=dict(product_data, seller=seller_data)))
+            is_liked = bool(product.is_liked)
+            bagged = product.is_bagged
         else:
-            bagged = False
-
-        serializer = ProductSerializer(product)
-
-        if not hasattr(product.seller, 'delivery_policy'):
-            return Response({"message: User has no Delivery_policy"}, status=status.HTTP_404_NOT_FOUND)
-
-        delivery_policy = DeliveryPolicySerializer(product.seller.delivery_policy)
+            is_liked = Like.objects.filter(user=user, product_id=pk, is_liked=True).exists()
+            bagged = Trade.objects.filter(product_id=pk, buyer=user, status=1).exists()
+            seller_stats = self.get_seller_stats(data['product']['seller']['id'])
+            related_products = self.get_related_products_by_ids(data['related_ids'])
 
-        related_products = self.get_related_products(product)
-        if related_products:
-            related_products = RelatedProductSerializer(related_products, many=True).data
-        else:
-            related_products = []
         return Response({
-            'product': serializer.data,
+            'product': dict(data['product'], seller=dict(data['product']['seller'], **seller_stats)),
             'isbagged': bagged,
             'liked': is_liked,
-            'delivery_policy': delivery_policy.data,
-            'related_products': related_products
+            'delivery_policy': data['delivery_policy'],
+            'related_products': RelatedProductSerializer(related_products, many=True).data
         })
 
-    # TODO : filter by second category
+    @action(methods=['get'], detail=False, permission_classes=[IsAdminUser, ])
+    def cache_stats(self, request):
+        """
+        상품 상세 캐시의 hit/miss 횟수를 return 합니다.
+        """
+        return Response(get_product_detail_stats())
+
     def get_related_products(self, product):
-        second_category = product.second_category
-        tags = product.tag.all()
-        filtered_products = self.get_queryset()\
-            .select_related('size','size__category','size__category__gender')\
-            .prefetch_related('tag').\
-            exclude(id=product.id).\
-            filter(second_category=second_category).\
-            annotate(count=Count(
-                Case(
-                    When(
-                        tag__id__in=list(tag.id for tag in tags), then=1),
-                    output_field=IntegerField(),
-                )
-            )
-        ).distinct().order_by('-count')[:5]
+        """
+        RelatedProduct 에 미리 계산된 연관 상품을 조회합니다.
+        """
+        return self.get_queryset()\
+            .select_related('size', 'prodthumbnail')\
+            .filter(related_to__product=product)\
+            .order_by('-related_to__score', '-id')
 
-        return filtered_products
+    def get_related_products_by_ids(self, product_ids):
+        """
+        캐시된 연관 상품 id 순서대로, 판매중인 상품만 조회합니다.
+        """
+        if not product_ids:
+            return []
+        products = self.get_queryset().select_related('size', 'prodthumbnail').in_bulk(product_ids)
+        return [products[product_id] for product_id in product_ids if product_id in products]
 
     # todo: response fix -> code and status
     @action(methods=['post'], detail=True)
@@ -435,13 +452,16 @@ class ProductCategoryAPIViewSet(viewsets.GenericViewSet):
     permission_classes = [IsAuthenticated, ]
 
     def get_queryset(self):
-        queryset = FirstCategory.objects.filter(is_active=True)
+        # has_child 는 serializer 의 child 에서 사용
+        queryset = FirstCategory.objects.filter(is_active=True)\
+            .annotate(has_child=Exists(SecondCategory.objects.filter(parent=OuterRef('pk'))))
         if self.action == 'gender':
-            queryset = GenderDivision.objects.filter(is_active=True)
+            queryset = GenderDivision.objects.filter(is_active=True)\
+                .annotate(has_child=Exists(FirstCategory.objects.filter(gender=OuterRef('pk'))))
         elif self.action == 'second_category':
             queryset = SecondCategory.objects.filter(is_active=True)
         elif self.action == 'size':
-            queryset = Size.objects.all()
+            queryset = Size.objects.select_related('category')
         return queryset
 
     def get_serializer_class(self):
@@ -493,6 +513,15 @@ class ProductCategoryAPIViewSet(viewsets.GenericViewSet):
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
+    @action(methods=['get'], detail=False)
+    def category_tree(self, request, *args, **kwargs):
+        """
+        gender -> first_category -> second_category, size 전체 계층을 한번에 return 합니다.
+        카테고리 모델이 바뀔 때마다 version(ETag) 이 바뀌며, If-None-Match 가 같으면 304 를 return 합니다.
+        다른 process 에서의 변경은 늦어도 SNAPSHOT_TIMEOUT 후에 반영됩니다.
+        """
+        return category_tree.get_response(request)
+
 
 class BrandViewSet(viewsets.GenericViewSet):
     queryset = Brand.objects.all()
@@ -503,10 +532,9 @@ class BrandViewSet(viewsets.GenericViewSet):
         """
         brand list api
         Other (선택안함) 이 최상단에 있도록 설정
+        미리 만들어 둔 brand_catalog snapshot 을 return 하며, If-None-Match 가 ETag 와 같으면 304 를 return 합니다.
         """
-        result = self.get_ordered_queryset()
-        serializer = self.get_serializer(result, many=True)
-        return Response(serializer.data)
+        return brand_catalog.get_response(request)
 
     @action(methods=['post'], detail=False)
     def searching(self, request, *args, **kwargs):
@@ -516,24 +544,12 @@ class BrandViewSet(viewsets.GenericViewSet):
         """
         keyword = request.data['keyword']
         if keyword:
-            value = self.get_queryset()\
-                    .exclude(name='Other')\
-                    .filter(name__icontains=keyword) \
-                    .order_by('id')[:15]
+            value = [Brand(id=brand_id, name=name) for brand_id, name in autocomplete.search_brands(keyword, 15)]
             serializer = self.get_serializer(value, many=True)
             return Response(serializer.data, status=status.HTTP_200_OK)
         else:
-            serializer = self.get_serializer(self.get_ordered_queryset(), many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-
-    def get_ordered_queryset(self):
-        queryset = self.get_queryset()
-        other = queryset.filter(name="Other")
-        qs = queryset.exclude(name="Other")
-        other = list(other)
-        qs = list(qs)
-        result = other + qs
-        return result
+            _, catalog = brand_catalog.get()
+            return Response(catalog, status=status.HTTP_200_OK)
 
 
 class TagViewSet(viewsets.GenericViewSet):
@@ -549,12 +565,7 @@ class TagViewSet(viewsets.GenericViewSet):
         keyword = request.data['keyword']
         if len(keyword) < 2:
             return Response([], status=status.HTTP_200_OK)
-        value = self.get_queryset()\
-                              .prefetch_related('product_set') \
-                              .filter(tag__icontains=keyword) \
-                              .annotate(product_count=Count('product')) \
-                              .values('tag', 'id') \
-                              .order_by('-product_count')[:15]
+        value = autocomplete.search_tags(keyword, 15)
         return Response(value, status=status.HTTP_200_OK)
 
 
@@ -564,66 +575,32 @@ class FollowViewSet(viewsets.GenericViewSet):
     pagination_class = FollowPagination
     permission_classes = [IsAuthenticated]
 
-    def get_recommended_seller(self):
-        self.recommended_seller = User.objects.filter(is_active=True)
-        if self.recommended_seller.count() > 10:
-            self.recommended_seller = self.recommended_seller[:10]
-        # todo: recommend query
-        ########
-        # todo: serializer 최적화
-        self.recommended = UserSerializer(self.recommended_seller, many=True)
-
-    def get_products_by_follow(self):
-        follows = Follow.objects.filter(_from=self.user).filter(_to__is_active=True)
-        self.follows_by_seller = follows.filter(tag=None, is_follow=True)
-        self.follows_by_tag = follows\
-            .prefetch_related('tag')\
-            .filter(_to=None, is_follow=True)
-
-        self.products_by_seller = Product.objects\
-            .select_related('seller', 'brand')\
-            .select_related('seller__profile')\
-            .prefetch_related('seller___to')\
-            .prefetch_related('tag')\
-            .filter(is_active=True)\
-            .filter(seller___to__in=self.follows_by_seller)
-
-        self.products_by_tag = Product.objects\
-            .select_related('brand', 'seller', 'second_category', 'second_category__parent') \
-            .select_related('seller__profile') \
-            .prefetch_related('seller___to') \
-            .prefetch_related('tag')\
-            .filter(is_active=True)\
-            .filter(tag__follow__in=self.follows_by_tag)
+    def get_follow_paginator(self, request):
+        """
+        기본은 page 번호 FollowPagination 이며, cursor 를 보내는 경우(첫 페이지는 빈 값 cursor=)에만
+        FollowCursorPagination 을 사용합니다.
+        """
+        if FollowCursorPagination.cursor_query_param in request.query_params:
+            return FollowCursorPagination()
+        return FollowPagination()
 
     def list(self, request):
         """
+        follow 한 판매자, 태그의 상품을 feed inbox(FeedItem) 에서 조회합니다.
         :method: GET
-        :param request: header token
+        :param request: header token, page (page 번호 pagination), cursor (cursor pagination 사용시, 첫 페이지는 빈 값)
         :return: code, status and paginated response
         """
+        products = get_feed_queryset(request.user)\
+            .select_related('seller', 'brand', 'size', 'size__category', 'second_category')\
+            .select_related('seller__profile')\
+            .prefetch_related('seller___to')\
+            .prefetch_related('tag', get_images_prefetch())
 
-        self.user = request.user
-        self.get_products_by_follow()
-        self.get_recommended_seller()
-
-        products_by_seller = self.products_by_seller
-        products_by_tag = self.products_by_tag
-
-        qs = (products_by_seller | products_by_tag).distinct()
-
-        p_ids = list(products_by_seller.values_list('id', flat=True))
-
-        tag_ids = list(self.follows_by_tag.values_list('tag_id'))
-        tag_id_list = []
-        for tag_id in tag_ids:
-            tag_id_list.append(tag_id[0])
-
-        page = self.paginate_queryset(qs)
-        serializer = self.get_serializer_class()
-        serializer = serializer(page, many=True,
-                                context={"request": self.request, "by_seller": p_ids, "follow_tag_ids": tag_id_list})
-        return self.get_paginated_response({"products": serializer.data, "recommended": []})
+        paginator = self.get_follow_paginator(request)
+        page = paginator.paginate_queryset(queryset=products, request=request)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response({"products": serializer.data, "recommended": []})
 
     @action(methods=['post'], detail=False, serializer_class=FollowingSerializer)
     def check_follow(self, request):
@@ -651,6 +628,7 @@ class FollowViewSet(viewsets.GenericViewSet):
         return Response({'returns': {'is_follow': follow.is_follow}}, status=status.HTTP_200_OK)
 
     @action(methods=['post'], detail=False, serializer_class=FollowingSerializer)
+    @transaction.atomic
     def following(self, request):
         """
         :method: POST
@@ -682,6 +660,19 @@ class FollowViewSet(viewsets.GenericViewSet):
             else:
                 follow.is_follow = True
             follow.save()
+
+        # follow feed inbox
+        if follow.is_follow:
+            backfill_follow(follow)
+        else:
+            remove_follow(follow)
+
+        # store 통계 : 유저 follow 인 경우만 follower / following 증감
+        if follow._to_id:
+            delta = 1 if follow.is_follow else -1
+            StoreStats.increase(follow._to_id, follower_count=delta)
+            StoreStats.increase(follow._from_id, following_count=delta)
+
         return Response({'results': self.get_serializer(follow).data}, status=status.HTTP_200_OK)
 
 
@@ -693,17 +684,21 @@ class SearchViewSet(viewsets.GenericViewSet):
     def searching(self, request):
         """
         검색 시 한 글자마다 자동완성 해 주는 api
+        상품 수(name_result) 는 기본적으로 검색 index 로 추정한 값이며, exact=true 인 경우에만 정확히 셉니다.
+        :param request: keyword, exact (optional)
+        :return: name_result, name_result_exact, tag_result, seller_result
         """
         keyword = request.data['keyword']
         if len(keyword) < 1:
             return Response(status=status.HTTP_400_BAD_REQUEST)
-        product_count = self.search_by_product(keyword)
+        exact = str(request.data.get('exact', '')).lower() in ('1', 'true')
+        product_count, is_exact = self.search_by_product(keyword, exact)
         tags = self.search_by_tag(keyword)
-        seller_qs = UserSerializer(self.search_by_seller(keyword), many=True)
         searched_data = {}
         searched_data['name_result'] = product_count
+        searched_data['name_result_exact'] = is_exact
         searched_data['tag_result'] = tags
-        searched_data['seller_result'] = seller_qs.data
+        searched_data['seller_result'] = self.search_by_seller(keyword)
         return Response(searched_data)
 
     @action(methods=['post'], detail=False)
@@ -716,20 +711,37 @@ class SearchViewSet(viewsets.GenericViewSet):
         keyword = request.data['keyword']
         if len(keyword) < 1:
             return Response(status=status.HTTP_400_BAD_REQUEST)
-        try:
-            products = Product.objects.filter(name__icontains=keyword, is_active=True).order_by('-created_at')
-        except Product.DoesNotExist:
-            raise Http404
-
+        products = Product.objects\
+            .select_related('size')\
+            .prefetch_related(get_images_prefetch())
         paginator = ProductSearchResultPagination()
-        page = paginator.paginate_queryset(products, request)
-        serializer = self.get_serializer(page, many=True)
-        return paginator.get_paginated_response(serializer.data)
+        first_page = paginator.is_first_page(request)
+
+        with SearchTimer(SearchQueryLog.PRODUCT, keyword, request.user) as timer:
+            # hot query 의 첫 페이지는 캐시된 상품 id 로 조회
+            cached = hot_search.get_page(SearchQueryLog.PRODUCT, keyword) if first_page else None
+            if cached is not None:
+                timer.cached = True
+                count, product_ids = cached
+                # 캐시된 뒤 판매중이 아니게 된 상품은 제외
+                page = self.get_products_in_order(products.filter(is_active=True), product_ids)
+                serializer = self.get_serializer(page, many=True)
+                return paginator.get_first_page_response(count, serializer.data)
+
+            products = search_products(products.filter(is_active=True), keyword)
+            page = paginator.paginate_queryset(products, request)
+            if first_page:
+                hot_search.set_page(SearchQueryLog.PRODUCT, keyword,
+                                    paginator.page.paginator.count, [product.id for product in page])
+            serializer = self.get_serializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
 
     @action(methods=['get'], detail=True, serializer_class=MainSerializer)
     def tag_search(self, request, pk):
         """
         searching api 에서 주어졌던 tag_id 기반으로 상품을 return 합니다.
+        태그의 판매중 상품 id posting list(api.postings) 를 잘라 해당 페이지의 상품만 조회합니다.
+        :param request: page (page 번호 pagination), cursor (cursor pagination 사용시, 첫 페이지는 빈 값, 다음 페이지는 이전 응답의 next)
         :return: paginated data, tag_followed: bool, status
         """
         # get user
@@ -748,30 +760,67 @@ class SearchViewSet(viewsets.GenericViewSet):
             tag_followed = False
 
         paginator = TagSearchResultPagination()
-        products = Product.objects.filter(tag=tag, is_active=True).order_by('-created_at')
-        page = paginator.paginate_queryset(queryset=products, request=request)
-        serializer = self.get_serializer(page, many=True)
-        return paginator.get_paginated_response(serializer.data, tag_followed=tag_followed)
+        page_size = paginator.page_size
+        query_params = request.query_params
+
+        with SearchTimer(SearchQueryLog.TAG, tag.id, user) as timer:
+            product_ids, timer.cached = tag_postings.get_postings(tag.id)
+            count = len(product_ids)
+
+            if 'cursor' not in query_params:
+                try:
+                    page_number = int(query_params.get(paginator.page_query_param, 1))
+                except ValueError:
+                    raise Http404
+                page_ids = tag_postings.get_offset_page(product_ids, page_size, page_number)
+                # 범위를 벗어난 page 는 PageNumberPagination 과 같이 404
+                if page_number < 1 or (page_number > 1 and not page_ids):
+                    raise Http404
+                next_page = page_number + 1 if page_number * page_size < count else None
+                previous_page = page_number - 1 if page_number > 1 else None
+            else:
+                try:
+                    cursor = int(query_params['cursor']) if query_params.get('cursor') else None
+                except ValueError:
+                    return Response(status=status.HTTP_400_BAD_REQUEST)
+                page_ids = tag_postings.get_page(product_ids, page_size, cursor)
+                next_page = page_ids[-1] if page_ids and page_ids[-1] > product_ids[0] else None
+                previous_page = None
+
+            page = self.get_products_in_order(Product.objects.select_related('prodthumbnail'), page_ids)
+            serializer = self.get_serializer(page, many=True)
+            return paginator.get_postings_response(count, next_page, previous_page, serializer.data,
+                                                   tag_followed=tag_followed)
+
+    @action(methods=['get'], detail=False, permission_classes=[IsAdminUser, ])
+    def stats(self, request):
+        """
+        검색 종류별 요청 수, hot query 캐시 hit rate, p95 latency(ms) 를 return 합니다.
+        """
+        return Response(hot_search.get_stats())
+
+    def get_products_in_order(self, queryset, product_ids):
+        products = queryset.in_bulk(product_ids)
+        return [products[product_id] for product_id in product_ids if product_id in products]
 
-    def search_by_product(self, keyword):
-        searched_product = Product.objects.filter(name__icontains=keyword).filter(is_active=True)
-        return searched_product.count()
+    def search_by_product(self, keyword, exact=False):
+        return count_products(keyword, exact)
 
     # TODO : recommend by user logs(searched, clicked, liked, followed), optimize
     def search_by_tag(self, keyword):
-        queryset_values = Tag.objects.prefetch_related('product_set')\
-            .filter(tag__icontains=keyword)\
-            .annotate(product_count=Count('product'))\
-            .values('tag', 'id')\
-            .order_by('-product_count')[:5]
-        return queryset_values
-
-    # TODO : ordering by related seller (Seller product's tag), optimize
+        return autocomplete.search_tags(keyword, 5)
+
     def search_by_seller(self, keyword):
-        queryset = User.objects.prefetch_related('product_set')\
-            .filter(nickname__icontains=keyword, is_active=True)\
-            .order_by('nickname')[:5]
-        return queryset
+        """
+        닉네임이 keyword 를 포함하는 판매자를 StoreStats.seller_score 순으로 5명 return 합니다.
+        """
+        seller_ids = autocomplete.search_sellers(keyword, 5)
+        sellers = User.objects.select_related('profile').in_bulk(seller_ids)
+        sellers = [sellers[seller_id] for seller_id in seller_ids if seller_id in sellers]
+        # user 별 마지막 socialaccount (Profile.profile_img_url 과 같은 기준)
+        social_accounts = {account.user_id: account
+                           for account in SocialAccount.objects.filter(user_id__in=seller_ids).order_by('id')}
+        return SellerSearchSerializer(sellers, many=True, context={'social_accounts': social_accounts}).data
 
 
 class StoreViewSet(viewsets.GenericViewSet):
@@ -807,7 +856,8 @@ class StoreViewSet(viewsets.GenericViewSet):
 
         store_serializer = StoreSerializer(retrieve_user, context={'user_followed': user_followed})
 
-        products = retrieve_user.product_set.filter(is_active=True).order_by('-created_at')
+        products = retrieve_user.product_set.select_related('prodthumbnail')\
+            .filter(is_active=True).order_by('-created_at')
 
         paginator = StorePagination()
         page = paginator.paginate_queryset(queryset=products, request=request)
@@ -824,7 +874,8 @@ class StoreViewSet(viewsets.GenericViewSet):
         if not retrieve_user:
             return Response({}, status=status.HTTP_404_NOT_FOUND)
 
-        likes = retrieve_user.liker.filter(is_liked=True, product__is_active=True)
+        likes = retrieve_user.liker.select_related('product', 'product__prodthumbnail')\
+            .filter(is_liked=True, product__is_active=True)
 
         paginator = StorePagination()
         page = paginator.paginate_queryset(queryset=likes, request=request)
@@ -857,7 +908,7 @@ class StoreViewSet(viewsets.GenericViewSet):
 
     def get_retrieve_user(self, pk):
         try:
-            retrieve_user = User.objects.get(pk=pk)
+            retrieve_user = User.objects.select_related('profile', 'store_stats').get(pk=pk)
         except:
             retrieve_user = None
         return retrieve_user
@@ -1,5 +1,22 @@
+"""
+Bootpay REST api client 입니다.
+
+get_bootpay() 는 process 전체에서 하나의 client 를 공유합니다. client 는 keep-alive requests.Session 으로
+connection 을 재사용하고, access token 을 BOOTPAY_TOKEN_TTL 동안 재사용합니다. (bootpay token 유효시간은 30분)
+조회(get, delete) 와 token 발급은 timeout, connection 오류, 5xx 에 대해 BOOTPAY_RETRIES 번 backoff 후 재시도하며
+취소, 결제처럼 중복 실행되면 안되는 요청은 재시도하지 않습니다.
+test 에서는 BOOTPAY_API_URL 을 local stub server 로 바꿔 사용할 수 있습니다.
+"""
+import logging
+import threading
+import time
+
 import requests
-import json
+from django.conf import settings
+
+from .loader import load_credential
+
+logger = logging.getLogger(__name__)
 
 
 class BootpayApi:
@@ -8,42 +25,126 @@ class BootpayApi:
         'production': 'https://api.bootpay.co.kr'
     }
 
-    def __init__(self, application_id, private_key, mode='production'):
+    def __init__(self, application_id, private_key, mode='production', api_url=None):
         self.application_id = application_id
         self.pk = private_key
         self.mode = mode
+        self.url = api_url or self.base_url[mode]
         self.token = None
+        self.token_expires_at = 0
+        self.token_lock = threading.Lock()
+        self.session = requests.Session()
+        self.stats_lock = threading.Lock()
+        self.stats = {}  # endpoint: {'count', 'error', 'retry', 'total_ms', 'max_ms'}
 
     def api_url(self, uri=None):
         if uri is None:
             uri = []
-        return '/'.join([self.base_url[self.mode]] + uri)
+        return '/'.join([self.url] + uri)
+
+    def get_timeout(self):
+        return getattr(settings, 'BOOTPAY_TIMEOUT', (3, 10))
+
+    def get_retries(self):
+        return getattr(settings, 'BOOTPAY_RETRIES', 2)
+
+    def get_backoff(self):
+        return getattr(settings, 'BOOTPAY_BACKOFF', 0.5)
+
+    def get_token_ttl(self):
+        return getattr(settings, 'BOOTPAY_TOKEN_TTL', 60 * 25)
+
+    def request(self, method, uri, data=None, endpoint=None, auth=True, idempotent=False):
+        """
+        json response 를 return 합니다.
+        :param endpoint: latency 집계에 사용할 이름, 없으면 uri 입니다. (receipt_id 등 id 가 들어가는 경우 지정)
+        :param idempotent: True 이면 timeout, connection 오류, 5xx 에 대해 재시도합니다.
+        """
+        endpoint = endpoint or '/'.join(uri)
+        retries = self.get_retries() if idempotent else 0
+        token_refreshed = False
+        attempt = 0
+        while True:
+            headers = {'Authorization': self.token} if auth else None
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, self.api_url(uri), data=data, headers=headers,
+                                                timeout=self.get_timeout())
+            except (requests.ConnectionError, requests.Timeout):
+                self.record(endpoint, started, error=True, retry=attempt > 0)
+                if attempt >= retries:
+                    raise
+            else:
+                failed = response.status_code >= 500
+                self.record(endpoint, started, error=failed, retry=attempt > 0)
+                if auth and response.status_code == 401 and not token_refreshed:
+                    # 다른 곳에서 token 이 재발급되어 만료된 경우 한번만 다시 발급
+                    token_refreshed = True
+                    self.ensure_token(force=True)
+                    continue
+                if not failed or attempt >= retries:
+                    return response.json()
+            time.sleep(self.get_backoff() * (2 ** attempt))
+            attempt += 1
+
+    def record(self, endpoint, started, error=False, retry=False):
+        elapsed = (time.monotonic() - started) * 1000
+        with self.stats_lock:
+            stat = self.stats.setdefault(endpoint, {'count': 0, 'error': 0, 'retry': 0, 'total_ms': 0.0,
+                                                    'max_ms': 0.0})
+            stat['count'] += 1
+            stat['error'] += int(error)
+            stat['retry'] += int(retry)
+            stat['total_ms'] += elapsed
+            stat['max_ms'] = max(stat['max_ms'], elapsed)
+        logger.info('bootpay %s %.1fms%s', endpoint, elapsed, ' error' if error else '')
+
+    def get_stats(self):
+        """
+        endpoint 별 요청 수, 오류 수, 재시도 수, 평균/최대 latency(ms)
+        """
+        with self.stats_lock:
+            return {endpoint: {
+                'count': stat['count'],
+                'error': stat['error'],
+                'retry': stat['retry'],
+                'avg_ms': round(stat['total_ms'] / stat['count'], 2) if stat['count'] else 0.0,
+                'max_ms': round(stat['max_ms'], 2),
+            } for endpoint, stat in self.stats.items()}
 
     def get_access_token(self):
         data = {
             'application_id': self.application_id,
             'private_key': self.pk
         }
-        response = requests.post(self.api_url(['request', 'token']), data=data)
-        result = response.json()
-        if result['status'] is 200:
+        result = self.request('post', ['request', 'token'], data=data, auth=False, idempotent=True)
+        if result['status'] == 200:
             self.token = result['data']['token']
+            self.token_expires_at = time.monotonic() + self.get_token_ttl()
         return result
 
+    def ensure_token(self, force=False):
+        """
+        만료 전의 token 이 있으면 재사용하고, 없으면 발급합니다. 발급에 실패하면 False 를 return 합니다.
+        """
+        if not force and self.token is not None and time.monotonic() < self.token_expires_at:
+            return True
+        with self.token_lock:
+            # lock 을 기다리는 동안 다른 thread 에서 발급한 경우
+            if not force and self.token is not None and time.monotonic() < self.token_expires_at:
+                return True
+            return self.get_access_token()['status'] == 200
+
     def cancel(self, receipt_id, price=None, name=None, reason=None):
         payload = {'receipt_id': receipt_id,
                    'price': price,
                    'name': name,
                    'reason': reason}
 
-        return requests.post(self.api_url(['cancel.json']), data=payload, headers={
-            'Authorization': self.token
-        }).json()
+        return self.request('post', ['cancel.json'], data=payload)
 
     def verify(self, receipt_id):
-        return requests.get(self.api_url(['receipt', receipt_id]), headers={
-            'Authorization': self.token
-        }).json()
+        return self.request('get', ['receipt', receipt_id], endpoint='receipt', idempotent=True)
 
     def subscribe_billing(self, billing_key, item_name, price, order_id, items=None, user_info=None):
         if items is None:
@@ -56,9 +157,7 @@ class BootpayApi:
             'items': items,
             'user_info': user_info
         }
-        return requests.post(self.api_url(['subscribe', 'billing.json']), data=payload, headers={
-            'Authorization': self.token
-        }).json()
+        return self.request('post', ['subscribe', 'billing.json'], data=payload)
 
     def subscribe_billing_reserve(self, billing_key, item_name, price, order_id, execute_at, feedback_url, items=None):
         if items is None:
@@ -73,9 +172,7 @@ class BootpayApi:
             'execute_at': execute_at,
             'feedback_url': feedback_url
         }
-        return requests.post(self.api_url(['subscribe', 'billing', 'reserve.json']), data=payload, headers={
-            'Authorization': self.token
-        }).json()
+        return self.request('post', ['subscribe', 'billing', 'reserve.json'], data=payload)
 
     def get_subscribe_billing_key(self, pg, order_id, item_name, card_no, card_pw, expire_year, expire_month,
                                   identify_number, user_info=None, extra=None):
@@ -93,20 +190,17 @@ class BootpayApi:
             'user_info': user_info,
             'extra': extra
         }
-        return requests.post(self.api_url(['request', 'card_rebill.json']), data=payload, headers={
-            'Authorization': self.token
-        }).json()
+        return self.request('post', ['request', 'card_rebill.json'], data=payload)
 
     def destroy_subscribe_billing_key(self, billing_key):
-        return requests.delete(self.api_url(['subscribe', 'billing', billing_key]), headers={
-            'Authorization': self.token
-        }).json()
+        return self.request('delete', ['subscribe', 'billing', billing_key], endpoint='subscribe/billing',
+                            idempotent=True)
 
     def remote_link(self, payload={}, sms_payload=None):
         if sms_payload is None:
             sms_payload = {}
         payload['sms_payload'] = sms_payload
-        return requests.post(self.api_url(['app', 'rest', 'remote_link.json']), data=payload).json()
+        return self.request('post', ['app', 'rest', 'remote_link.json'], data=payload, auth=False)
 
     def remote_form(self, remoter_form, sms_payload=None):
         if sms_payload is None:
@@ -116,9 +210,7 @@ class BootpayApi:
             'remote_form': remoter_form,
             'sms_payload': sms_payload
         }
-        return requests.post(self.api_url(['app', 'rest', 'remote_form.json']), data=payload, headers={
-            'Authorization': self.token
-        }).json()
+        return self.request('post', ['app', 'rest', 'remote_form.json'], data=payload)
 
     def send_sms(self, receive_numbers, message, send_number=None, extra={}):
         payload = {
@@ -130,9 +222,7 @@ class BootpayApi:
                 'o_id': extra['o_id']
             }
         }
-        return requests.post(self.api_url(['push', 'sms.json']), data=payload, headers={
-            'Authorization': self.token
-        }).json()
+        return self.request('post', ['push', 'sms.json'], data=payload)
 
     def send_lms(self, receive_numbers, message, subject, send_number=None, extra={}):
         payload = {
@@ -145,11 +235,34 @@ class BootpayApi:
                 'o_id': extra['o_id']
             }
         }
-        return requests.post(self.api_url(['push', 'lms.json']), data=payload, headers={
-            'Authorization': self.token
-        }).json()
+        return self.request('post', ['push', 'lms.json'], data=payload)
 
     def certificate(self, receipt_id):
-        return requests.get(self.api_url(['certificate', receipt_id]), headers={
-            'Authorization': self.token
-        }).json()
\ No newline at end of file
+        return self.request('get', ['certificate', receipt_id], endpoint='certificate', idempotent=True)
+
+
+_bootpay = None
+_bootpay_lock = threading.Lock()
+
+
+def get_bootpay():
+    """
+    process 전체에서 공유하는 BootpayApi 를 return 합니다. token 은 ensure_token 으로 확인합니다.
+    """
+    global _bootpay
+    if _bootpay is None:
+        with _bootpay_lock:
+            if _bootpay is None:
+                _bootpay = BootpayApi(application_id=load_credential('application_id'),
+                                      private_key=load_credential('private_key'),
+                                      api_url=getattr(settings, 'BOOTPAY_API_URL', None))
+    return _bootpay
+
+
+def reset_bootpay():
+    """
+    공유 client 를 버립니다. (test, BOOTPAY_API_URL 변경시)
+    """
+    global _bootpay
+    with _bootpay_lock:
+        _bootpay = None
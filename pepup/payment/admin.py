@@ -1,4 +1,5 @@
-from payment.models import Commission, WalletLog, Trade, Deal, Payment, Review, DeliveryMemo, PaymentErrorLog
+from payment.models import Commission, WalletLog, Trade, Deal, Payment, Review, DeliveryMemo, PaymentErrorLog, \
+    PaymentCompletion
 from django.contrib import admin
 from django.urls import reverse
 from django.utils.safestring import mark_safe
@@ -81,6 +82,11 @@ class DeliveryMemoAdmin(admin.ModelAdmin):
     list_editable = ['order']
 
 
+class PaymentCompletionAdmin(admin.ModelAdmin):
+    list_display = ['pk', 'receipt_id', 'payment', 'status', 'attempts', 'locked_until', 'created_at', 'updated_at']
+    list_filter = ['status']
+
+
 admin.site.register(Commission, CommissionAdmin)
 admin.site.register(Trade, TradeAdmin)
 admin.site.register(Deal, DealAdmin)
@@ -89,4 +95,4 @@ admin.site.register(WalletLog, WalletLogAdmin)
 admin.site.register(Review)
 admin.site.register(DeliveryMemo, DeliveryMemoAdmin)
 admin.site.register(PaymentErrorLog)
-
+admin.site.register(PaymentCompletion, PaymentCompletionAdmin)
@@ -0,0 +1,57 @@
+"""
+배송비 계산(payment.utils.calculate_delivery_fees) benchmark 입니다. (benchmark_delivery_fees command)
+
+DB 없이 가상 배송정책과 장바구니를 만들어 장바구니 크기별 계산 시간을 측정합니다.
+가상 장바구니 생성은 payment.tests 의 배송비 test 에서도 사용합니다.
+"""
+import random
+import time
+
+from accounts.models import DeliveryPolicy
+from api.benchmark import percentile
+from .utils import calculate_delivery_fees
+
+
+def random_delivery_policies(rng, seller_count):
+    """
+    저장하지 않은 DeliveryPolicy 를 만듭니다. {seller_id: DeliveryPolicy}
+    """
+    return {seller_id: DeliveryPolicy(
+        general=rng.choice([0, 2500, 3000, 3500]),
+        mountain=rng.choice([3000, 5000, 6000]),
+        amount=rng.choice([0, 30000, 50000, 100000]),
+        active_amount=rng.random() < 0.5,
+        volume=rng.randint(0, 5),
+        active_volume=rng.random() < 0.5,
+    ) for seller_id in range(1, seller_count + 1)}
+
+
+def random_cart(rng, size, seller_ids):
+    """
+    [(seller_id, discounted_price), ...]
+    """
+    return [(rng.choice(seller_ids), rng.randint(1, 200) * 500) for _ in range(size)]
+
+
+def benchmark_delivery_fees(sizes, carts=200, seller_count=20, seed=0):
+    """
+    장바구니 크기별 calculate_delivery_fees 의 p50/p95/p99 (ms) 를 return 합니다.
+    """
+    rng = random.Random(seed)
+    delivery_policies = random_delivery_policies(rng, seller_count)
+    seller_ids = list(delivery_policies)
+    report = {}
+    for size in sizes:
+        latencies = []
+        for _ in range(carts):
+            items = random_cart(rng, size, seller_ids)
+            started = time.perf_counter()
+            calculate_delivery_fees(items, delivery_policies)
+            latencies.append((time.perf_counter() - started) * 1000)
+        report[size] = {
+            'carts': carts,
+            'p50': round(percentile(latencies, 0.50), 4),
+            'p95': round(percentile(latencies, 0.95), 4),
+            'p99': round(percentile(latencies, 0.99), 4),
+        }
+    return report
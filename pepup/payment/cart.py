@@ -0,0 +1,68 @@
+"""
+trade 들을 셀러 별로 묶은 장바구니 데이터입니다. (cart, payform, 구매/판매 내역 상세)
+
+trade 를 셀러, 셀러 배송정책, 상품 정보와 함께 한번에 조회하고, 셀러 별 합계와 배송비는
+create_deals 와 같은 payment.utils.calculate_delivery_fees 로 계산합니다.
+"""
+from collections import OrderedDict
+
+from allauth.socialaccount.models import SocialAccount
+from rest_framework import exceptions
+
+from api.serializers import ProductForTradeSerializer
+from .serializers import SellerForTradeSerializer
+from .utils import calculate_delivery_fees
+
+
+def get_cart_queryset(trades):
+    return trades\
+        .select_related('seller', 'seller__profile', 'seller__delivery_policy')\
+        .select_related('product', 'product__size', 'product__size__category', 'product__brand',
+                        'product__second_category', 'product__prodthumbnail')\
+        .order_by('id')
+
+
+def get_payinfo(delivery_fee, delivery_policy):
+    return {
+        'total': delivery_fee.total,
+        'delivery_charge': delivery_fee.delivery_charge,
+        'mountain_delivery_charge': delivery_fee.mountain_delivery_charge,
+        'active_amount': delivery_policy.active_amount,
+        'active_volume': delivery_policy.active_volume,
+        'lack_amount': delivery_fee.lack_amount,
+        'lack_volume': delivery_fee.lack_volume,
+    }
+
+
+def group_by_seller(trades):
+    """
+    get_cart_queryset 으로 조회한 trades 를 처음 담은 셀러 순으로 묶어 return 합니다.
+    [{'seller': {...}, 'products': [{'trade_id', 'product'}, ...], 'payinfo': {...}}, ...]
+    """
+    trades = list(trades)
+    sellers = OrderedDict()
+    for trade in trades:
+        sellers.setdefault(trade.seller_id, trade.seller)
+    delivery_policies = {seller_id: getattr(seller, 'delivery_policy', None) for seller_id, seller in sellers.items()}
+    if None in delivery_policies.values():
+        raise exceptions.NotAcceptable(detail='배송정책이 없는 셀러의 상품이 포함되어 있습니다.')
+    delivery_fees = calculate_delivery_fees([(trade.seller_id, trade.product.discounted_price) for trade in trades],
+                                            delivery_policies)
+
+    # user 별 마지막 socialaccount (Profile.profile_img_url 과 같은 기준)
+    social_accounts = {account.user_id: account
+                       for account in SocialAccount.objects.filter(user_id__in=list(sellers)).order_by('id')}
+    seller_data = SellerForTradeSerializer(list(sellers.values()), many=True,
+                                           context={'social_accounts': social_accounts}).data
+    product_data = ProductForTradeSerializer([trade.product for trade in trades], many=True).data
+
+    groups = OrderedDict()
+    for seller_id, data in zip(sellers, seller_data):
+        groups[seller_id] = {
+            'seller': data,
+            'products': [],
+            'payinfo': get_payinfo(delivery_fees[seller_id], delivery_policies[seller_id]),
+        }
+    for trade, data in zip(trades, product_data):
+        groups[trade.seller_id]['products'].append({'trade_id': trade.id, 'product': data})
+    return list(groups.values())
@@ -0,0 +1,273 @@
+"""
+결제 완료(done) 처리 pipeline 입니다.
+
+done api 는 receipt_id 로 PaymentCompletion 을 만들고(이미 있으면 그대로 사용) 바로 응답합니다.
+부트페이 검증(verify), 취소(cancel) 같은 network 요청은 transaction 밖의 worker 에서 실행하고,
+각 단계의 DB 변경은 짧은 transaction 안에서 PaymentCompletion.status 와 함께 commit 합니다.
+
+    PENDING -(verify 성공)-> VERIFIED -(상품 sold, trade/deal 상태, walletlog, activity log)-> DONE
+    PENDING -(verify 성공, 금액 불일치)-> CANCEL_REQUIRED -(cancel)-> CANCELED
+    PENDING -(verify 4xx, 영수증 없음 등)-> FAILED (부트페이에서 결제되지 않았으므로 cancel 하지 않음)
+
+worker 는 locked_until lease 로 작업을 점유합니다. 오류가 나거나 worker 가 중간에 종료된 작업은
+process_payment_completions command 가 마지막으로 기록된 단계부터 다시 처리합니다.
+worker backend 는 settings.PAYMENT_COMPLETION_BACKEND 로 교체할 수 있습니다.
+"""
+import datetime
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from api.cache import invalidate_product_detail
+from api.models import Product, ProductFacet
+from user_activity.models import UserActivityLog, UserActivityReference
+from .Bootpay import get_bootpay
+from .models import Payment, PaymentCompletion, Trade, WalletLog
+from .serializers import PaymentDoneSerialzier, PaymentCancelSerialzier
+
+logger = logging.getLogger(__name__)
+
+
+class CompletionError(Exception):
+    """
+    다시 시도해야 하는 오류 (부트페이 장애, 응답 검증 실패 등)
+    """
+    pass
+
+
+def get_lease():
+    return datetime.timedelta(seconds=getattr(settings, 'PAYMENT_COMPLETION_LEASE_SECONDS', 60))
+
+
+def accept(payment, receipt_id):
+    """
+    done api 에서 호출합니다. payment 의 작업을 return 하며, 새로 접수된 경우 commit 후 worker 에 넘깁니다.
+    payment 에 이미 접수된 작업이 있으면 receipt_id 가 달라도 새로 만들지 않고 기존 작업을 return 합니다.
+    """
+    with transaction.atomic():
+        # 같은 payment 로 동시에 들어온 done 요청은 payment row lock 으로 순서대로 처리
+        Payment.objects.select_for_update().filter(id=payment.id).exists()
+        completion = PaymentCompletion.objects.filter(payment=payment).first()
+        if completion is not None:
+            return completion
+        completion, created = PaymentCompletion.objects.get_or_create(receipt_id=receipt_id,
+                                                                      defaults={'payment': payment})
+        if created:
+            # 결제 승인 중 (부트페이에선 결제 되었지만, done 에서 처리 전)
+            payment.status = 3
+            payment.save(update_fields=['status'])
+            # deal : bootpay 결제 완료
+            payment.deal_set.update(status=13)
+            transaction.on_commit(lambda: get_completion_backend().enqueue(completion.id))
+    return completion
+
+
+def claim(completion_id):
+    """
+    진행 중이고 다른 worker 가 점유하지 않은 작업이면 lease 를 잡고 True 를 return 합니다.
+    """
+    now = timezone.now()
+    return PaymentCompletion.objects\
+        .filter(id=completion_id, status__in=PaymentCompletion.IN_PROGRESS)\
+        .filter(Q(locked_until__isnull=True) | Q(locked_until__lt=now))\
+        .update(locked_until=now + get_lease(), attempts=F('attempts') + 1) == 1
+
+
+def process(completion_id):
+    """
+    작업을 마지막으로 기록된 단계부터 끝까지 처리합니다. 다른 worker 가 처리 중이거나, 끝났거나, 실패하면 False
+    """
+    if not claim(completion_id):
+        return False
+    completion = PaymentCompletion.objects.select_related('payment').get(id=completion_id)
+    try:
+        if completion.status == PaymentCompletion.PENDING:
+            verify(completion)
+        if completion.status == PaymentCompletion.VERIFIED:
+            complete(completion)
+        elif completion.status == PaymentCompletion.CANCEL_REQUIRED:
+            cancel(completion)
+    except Exception as e:
+        logger.exception('payment completion %s failed', completion_id)
+        # lease 를 풀어 process_payment_completions 에서 바로 다시 처리할 수 있게 합니다.
+        PaymentCompletion.objects.filter(id=completion_id).update(error=repr(e), locked_until=None)
+        return False
+    return True
+
+
+def get_results(completion):
+    return json.loads(completion.result) if completion.result else {}
+
+
+def get_authorized_bootpay():
+    bootpay = get_bootpay()
+    if not bootpay.ensure_token():
+        raise CompletionError('bootpay access token 확인바람')
+    return bootpay
+
+
+def verify(completion):
+    result = get_authorized_bootpay().verify(completion.receipt_id)
+    if result['status'] >= 500:
+        raise CompletionError('bootpay verify 실패: {}'.format(result))
+    if 400 <= result['status'] < 500:
+        # 다시 시도해도 같은 응답이므로 결제 실패로 끝냅니다.
+        fail(completion, result)
+        return
+    if result['status'] == 200 and result['data']['price'] == completion.payment.price:
+        completion.status = PaymentCompletion.VERIFIED
+    else:
+        completion.status = PaymentCompletion.CANCEL_REQUIRED
+    completion.result = json.dumps({'verify': result})
+    completion.save(update_fields=['status', 'result', 'updated_at'])
+
+
+def lock_in_status(completion, status):
+    """
+    transaction 안에서 작업 row 를 잠그고 아직 status 단계인지 확인합니다. (lease 만료 후 다른 worker 가 처리한 경우 False)
+    """
+    return PaymentCompletion.objects.select_for_update().filter(id=completion.id, status=status).exists()
+
+
+def finish(completion, status):
+    completion.status = status
+    completion.locked_until = None
+    completion.error = ''
+    completion.save(update_fields=['status', 'locked_until', 'error', 'updated_at'])
+
+
+def fail(completion, result):
+    payment = completion.payment
+    with transaction.atomic():
+        if not lock_in_status(completion, PaymentCompletion.PENDING):
+            return
+        # payment : 결제승인실패, deal : 기타처리 (trade 는 결제전 그대로)
+        payment.status = -2
+        payment.save(update_fields=['status'])
+        payment.deal_set.update(status=-20)
+        completion.result = json.dumps({'verify': result})
+        completion.save(update_fields=['result', 'updated_at'])
+        finish(completion, PaymentCompletion.FAILED)
+
+
+def complete(completion):
+    payment = completion.payment
+    serializer = PaymentDoneSerialzier(payment, data=get_results(completion)['verify']['data'])
+    if not serializer.is_valid():
+        raise CompletionError(serializer.errors)
+
+    with transaction.atomic():
+        if not lock_in_status(completion, PaymentCompletion.VERIFIED):
+            return
+        serializer.save()
+        # 관련 상품 sold처리
+        product_ids = list(Product.objects.filter(trade__deal__payment=payment).values_list('id', flat=True))
+        Product.objects.filter(id__in=product_ids).update(sold=True, sold_status=1)
+        ProductFacet.objects.filter(product_id__in=product_ids).update(sold=True)
+        # 하위 trade 2번처리 : 결제완료
+        Trade.objects.filter(deal__payment=payment).update(status=2)
+        # deal : 결제완료, 거래 시간 저장
+        deals = list(payment.deal_set.only('id', 'seller_id'))
+        payment.deal_set.update(status=2, transaction_completed_date=datetime.datetime.now())
+        # walletlog 생성 : 정산은 walletlog를 통해서만 정산
+        WalletLog.objects.bulk_create([WalletLog(deal=deal, user_id=deal.seller_id) for deal in deals])
+        # activity log 생성 : seller, buyer
+        # MySQL 은 bulk_create 후 pk 를 돌려주지 않으므로 reference 를 다시 조회
+        UserActivityReference.objects.bulk_create([UserActivityReference(deal=deal) for deal in deals])
+        reference_ids = dict(UserActivityReference.objects.filter(deal__in=deals).values_list('deal_id', 'id'))
+        logs = []
+        for deal in deals:
+            logs.append(UserActivityLog(user_id=deal.seller_id, status=200, reference_id=reference_ids[deal.id]))
+            logs.append(UserActivityLog(user_id=payment.user_id, status=100, reference_id=reference_ids[deal.id]))
+        UserActivityLog.objects.bulk_create(logs)
+        finish(completion, PaymentCompletion.DONE)
+        transaction.on_commit(lambda: invalidate_product_detail(product_ids))
+
+
+def cancel(completion):
+    payment = completion.payment
+    results = get_results(completion)
+    if 'cancel' not in results:
+        # 취소 요청은 중복 실행되면 안되므로, 성공한 응답을 먼저 저장하고 다음 시도에서는 저장된 응답을 사용합니다.
+        result = get_authorized_bootpay().cancel(completion.receipt_id, reason='결제 검증 실패')
+        if result['status'] != 200:
+            raise CompletionError('bootpay cancel 실패: {}'.format(result))
+        results['cancel'] = result
+        completion.result = json.dumps(results)
+        completion.save(update_fields=['result', 'updated_at'])
+
+    with transaction.atomic():
+        if not lock_in_status(completion, PaymentCompletion.CANCEL_REQUIRED):
+            return
+        serializer = PaymentCancelSerialzier(payment, data=results['cancel']['data'])
+        if serializer.is_valid():
+            serializer.save()
+        # trade, deal : bootpay 환불 완료 (결제되었다가 취소이므로 환불)
+        Trade.objects.filter(deal__payment=payment).update(status=-3)
+        payment.deal_set.update(status=-3)
+        # activity log : buyer 결제 취소됨
+        UserActivityLog.objects.create(user_id=payment.user_id, status=190)
+        finish(completion, PaymentCompletion.CANCELED)
+
+
+def get_resumable(max_attempts=None):
+    """
+    lease 가 없거나 만료된 진행 중 작업
+    """
+    queryset = PaymentCompletion.objects\
+        .filter(status__in=PaymentCompletion.IN_PROGRESS)\
+        .filter(Q(locked_until__isnull=True) | Q(locked_until__lt=timezone.now()))
+    if max_attempts is not None:
+        queryset = queryset.filter(attempts__lt=max_attempts)
+    return queryset.order_by('id')
+
+
+class BaseCompletionBackend:
+
+    def enqueue(self, completion_id):
+        raise NotImplementedError
+
+
+class SyncBackend(BaseCompletionBackend):
+    """
+    요청 process 에서 바로 처리합니다. test, 로컬 개발용입니다.
+    """
+
+    def enqueue(self, completion_id):
+        process(completion_id)
+
+
+class ThreadBackend(BaseCompletionBackend):
+    """
+    process 안의 thread pool(PAYMENT_COMPLETION_WORKERS 개) 에서 처리합니다. 외부 queue 가 필요 없으며,
+    process 가 종료되어 처리되지 못한 작업은 process_payment_completions command 가 처리합니다.
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=getattr(settings, 'PAYMENT_COMPLETION_WORKERS', 4))
+
+    def enqueue(self, completion_id):
+        self.executor.submit(self.run, completion_id)
+
+    def run(self, completion_id):
+        try:
+            process(completion_id)
+        finally:
+            close_old_connections()
+
+
+_backend = None
+
+
+def get_completion_backend():
+    global _backend
+    path = getattr(settings, 'PAYMENT_COMPLETION_BACKEND', 'payment.completion.ThreadBackend')
+    if _backend is None or _backend.__class__.__module__ + '.' + _backend.__class__.__name__ != path:
+        _backend = import_string(path)()
+    return _backend
@@ -0,0 +1,26 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from payment.benchmark import benchmark_delivery_fees
+
+
+class Command(BaseCommand):
+    help = '가상 장바구니로 배송비 계산(payment.utils.calculate_delivery_fees) 시간을 장바구니 크기별로 측정합니다.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 500, 1000], help='장바구니 상품 수')
+        parser.add_argument('--carts', type=int, default=200, help='크기별 장바구니 수')
+        parser.add_argument('--sellers', type=int, default=20, help='셀러 수')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', action='store_true', help='결과를 json 으로 출력합니다.')
+
+    def handle(self, *args, **options):
+        report = benchmark_delivery_fees(options['sizes'], carts=options['carts'],
+                                         seller_count=options['sellers'], seed=options['seed'])
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for size, row in report.items():
+            self.stdout.write('{:<8} '.format(size) + '  '.join(
+                '{}={}'.format(key, value) for key, value in row.items()))
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from payment.completion import get_resumable, process
+
+
+class Command(BaseCommand):
+    help = '실패했거나 worker 가 종료되어 끝나지 않은 결제 완료 처리(PaymentCompletion)를 다시 처리합니다. (cron 으로 주기적으로 실행)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-attempts', type=int,
+                            default=getattr(settings, 'PAYMENT_COMPLETION_MAX_ATTEMPTS', 10),
+                            help='이 횟수 이상 시도한 작업은 건너뜁니다. (admin 에서 확인)')
+
+    def handle(self, *args, **options):
+        completion_ids = list(get_resumable(options['max_attempts']).values_list('id', flat=True))
+        processed = sum(1 for completion_id in completion_ids if process(completion_id))
+        self.stdout.write(self.style.SUCCESS('{} / {} completions processed'.format(processed, len(completion_ids))))
@@ -277,6 +277,39 @@ class PaymentErrorLog(models.Model):
     temp_payment = models.ForeignKey(Payment, null=True, blank=True, on_delete=models.SET_NULL)
 
 
+class PaymentCompletion(models.Model):
+    """
+    done api 로 접수된 결제 완료 처리 작업입니다. (payment.completion)
+    payment, receipt_id 당 하나만 생성되므로 client 가 done 을 다시 호출해도 한번만 처리되며,
+    status 에 진행 단계를 기록하므로 worker 가 중간에 종료되어도 마지막 단계부터 다시 처리합니다.
+    """
+    PENDING = 1
+    VERIFIED = 2
+    DONE = 3
+    CANCEL_REQUIRED = -1
+    CANCELED = -2
+    FAILED = -3
+    STATUS = [
+        (PENDING, '부트페이 검증 대기'),
+        (VERIFIED, '검증 완료, 결제 완료 처리 대기'),
+        (DONE, '결제 완료'),
+        (CANCEL_REQUIRED, '검증 실패, 결제 취소 대기'),
+        (CANCELED, '결제 취소'),
+        (FAILED, '검증 불가, 결제 실패'),
+    ]
+    IN_PROGRESS = [PENDING, VERIFIED, CANCEL_REQUIRED]
+
+    receipt_id = models.CharField(max_length=100, unique=True, verbose_name='영수증키')
+    payment = models.OneToOneField(Payment, on_delete=models.CASCADE, related_name='completion')
+    status = models.IntegerField(choices=STATUS, default=PENDING, db_index=True)
+    result = models.TextField(default='', verbose_name='부트페이 응답(json)')
+    attempts = models.IntegerField(default=0, verbose_name='처리 시도 횟수')
+    locked_until = models.DateTimeField(null=True, blank=True, help_text='처리 중인 worker 의 lease 만료 시각')
+    error = models.TextField(default='', blank=True, verbose_name='마지막 오류')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
 class WalletLog(models.Model):
     """
     정산을 수행하는 모델입니다.
@@ -15,7 +15,10 @@ class SellerForTradeSerializer(serializers.ModelSerializer):
         fields = ['id', 'nickname', 'profile']
 
     def get_profile(self, obj):
-        return obj.profile.profile_img_url
+        social_accounts = self.context.get('social_accounts')
+        if social_accounts is None:
+            return obj.profile.profile_img_url
+        return obj.profile.get_profile_img_url(social_accounts.get(obj.id))
 
     def get_delivery_policy(self, obj):
         return None
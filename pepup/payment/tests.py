@@ -1,14 +1,366 @@
-from payment.models import Deal, Delivery
-from accounts.models import User
-# Create your tests here.
+import json
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-seller = User.objects.all()[12]
-buyer = User.objects.all()[2]
+from django.db import connection
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
 
+from accounts.models import User, Profile, DeliveryPolicy
+from api.models import Brand, Product
+from user_activity.models import UserActivityLog
+from .Bootpay import BootpayApi
+from .benchmark import random_delivery_policies, random_cart, benchmark_delivery_fees
+from .models import Commission, Deal, Delivery, Trade, WalletLog, PaymentCompletion
+from .utils import calculate_delivery_fees
+from .views import PaymentViewSet
 
-def createdeal():
-    delivery = Delivery(sender=seller, receiver=buyer, address='', memo='')
-    deal = Deal(buyer=buyer, seller=seller, total=10000, remain=10000, delivery=delivery, delivery_charge=2500)
-    Delivery.objects.bulk_create([delivery])
-    print(delivery.pk)
-    # Deal.objects.bulk_create([deal])
+
+class StubBootpayServer:
+    """
+    bootpay api 를 흉내내는 local server 입니다. 요청 path 를 기록하고, failures 에 지정한 수만큼 path 별로 500 을 return 합니다.
+    statuses 에 지정한 path 는 항상 해당 status code 로 응답합니다.
+    영수증 조회(receipt) 는 price 금액으로 결제된 것으로 응답합니다.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.failures = {}
+        self.statuses = {}
+        self.price = 1000
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def handle_request(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                self.rfile.read(length)
+                stub.requests.append((self.command, self.path, self.headers.get('Authorization')))
+                if stub.failures.get(self.path):
+                    stub.failures[self.path] -= 1
+                    self.respond(500, {'status': 500})
+                elif self.path in stub.statuses:
+                    self.respond(stub.statuses[self.path], {'status': stub.statuses[self.path]})
+                elif self.path == '/request/token':
+                    self.respond(200, {'status': 200, 'data': {'token': 'token{}'.format(len(stub.requests))}})
+                elif self.path.startswith('/receipt/'):
+                    self.respond(200, {'status': 200, 'data': {'receipt_id': self.path.split('/')[-1],
+                                                               'price': stub.price, 'status': 1}})
+                else:
+                    self.respond(200, {'status': 200, 'data': {}})
+
+            do_GET = do_POST = do_DELETE = handle_request
+
+            def respond(self, code, data):
+                body = json.dumps(data).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        # keep-alive 연결이 남아 있어도 shutdown 이 기다리지 않도록
+        self.server.daemon_threads = True
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@override_settings(BOOTPAY_BACKOFF=0, BOOTPAY_RETRIES=2)
+class BootpayApiTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.stub = StubBootpayServer().__enter__()
+        self.bootpay = BootpayApi(application_id='app', private_key='key', api_url=self.stub.url)
+
+    def tearDown(self):
+        self.bootpay.session.close()
+        self.stub.__exit__()
+
+    def test_token_reuse(self):
+        self.assertTrue(self.bootpay.ensure_token())
+        self.assertTrue(self.bootpay.ensure_token())
+        self.assertEqual(self.bootpay.verify('receipt1')['data']['receipt_id'], 'receipt1')
+        self.assertEqual(self.bootpay.verify('receipt2')['data']['receipt_id'], 'receipt2')
+
+        paths = [path for _, path, _ in self.stub.requests]
+        self.assertEqual(paths, ['/request/token', '/receipt/receipt1', '/receipt/receipt2'])
+        self.assertEqual(self.stub.requests[1][2], 'token1')
+        self.assertEqual(self.bootpay.get_stats()['receipt']['count'], 2)
+
+    def test_token_expired(self):
+        self.bootpay.ensure_token()
+        self.bootpay.token_expires_at = 0
+        self.bootpay.ensure_token()
+        self.assertEqual([path for _, path, _ in self.stub.requests], ['/request/token', '/request/token'])
+
+    def test_retry(self):
+        self.bootpay.ensure_token()
+        self.stub.failures = {'/receipt/receipt1': 2, '/cancel.json': 1}
+        self.assertEqual(self.bootpay.verify('receipt1')['status'], 200)
+        self.assertEqual(self.bootpay.get_stats()['receipt']['retry'], 2)
+
+        # 취소는 재시도하지 않음
+        self.assertEqual(self.bootpay.cancel('receipt1')['status'], 500)
+        self.assertEqual(len([path for _, path, _ in self.stub.requests if path == '/cancel.json']), 1)
+
+
+class DeliveryFeeTestCase(SimpleTestCase):
+    """
+    임의의 장바구니에 대해 calculate_delivery_fees 의 성질을 확인합니다.
+    """
+    CARTS = 300
+
+    def setUp(self):
+        self.rng = random.Random(0)
+        self.delivery_policies = random_delivery_policies(self.rng, 8)
+        self.seller_ids = list(self.delivery_policies)
+
+    def get_expected(self, items, seller_id):
+        """
+        셀러 상품만 골라 합계를 내고 배송정책을 그대로 적용한 배송비
+        """
+        prices = [price for item_seller_id, price in items if item_seller_id == seller_id]
+        policy = self.delivery_policies[seller_id]
+        free = (policy.active_amount and sum(prices) >= policy.amount) or \
+               (policy.active_volume and len(prices) >= policy.volume)
+        return sum(prices), len(prices), 0 if free else policy.general
+
+    def test_matches_policy(self):
+        for _ in range(self.CARTS):
+            items = random_cart(self.rng, self.rng.randint(1, 30), self.seller_ids)
+            fees = calculate_delivery_fees(items, self.delivery_policies)
+            self.assertEqual(list(fees), list(dict.fromkeys(seller_id for seller_id, _ in items)))
+            self.assertEqual(sum(fee.total for fee in fees.values()), sum(price for _, price in items))
+            for seller_id, fee in fees.items():
+                self.assertEqual((fee.total, fee.volume, fee.delivery_charge), self.get_expected(items, seller_id))
+                self.assertEqual(fee.get_charge(mountain=True), self.delivery_policies[seller_id].mountain)
+                policy = self.delivery_policies[seller_id]
+                self.assertEqual(fee.lack_amount, max(policy.amount - fee.total, 0))
+                self.assertEqual(fee.lack_volume, max(policy.volume - fee.volume, 0))
+
+    def test_order_independent(self):
+        for _ in range(self.CARTS):
+            items = random_cart(self.rng, self.rng.randint(1, 30), self.seller_ids)
+            shuffled = items[:]
+            self.rng.shuffle(shuffled)
+            self.assertEqual(dict(calculate_delivery_fees(items, self.delivery_policies)),
+                             dict(calculate_delivery_fees(shuffled, self.delivery_policies)))
+
+    def test_more_items_never_cost_more(self):
+        for _ in range(self.CARTS):
+            items = random_cart(self.rng, self.rng.randint(1, 30), self.seller_ids)
+            added = items + random_cart(self.rng, 1, [items[0][0]])
+            before = calculate_delivery_fees(items, self.delivery_policies)[items[0][0]]
+            after = calculate_delivery_fees(added, self.delivery_policies)[items[0][0]]
+            self.assertLessEqual(after.delivery_charge, before.delivery_charge)
+
+    def test_benchmark(self):
+        report = benchmark_delivery_fees([500], carts=5)
+        self.assertEqual(report[500]['carts'], 5)
+
+
+def create_cart(buyer):
+    """
+    셀러 3명의 상품을 3개씩 buyer 의 장바구니에 담습니다.
+    셀러 0: 20000원 이상 무료배송, 1: 3개 이상 무료배송, 2: 할인 없음
+    """
+    brand = Brand.objects.create(name='brand')
+    sellers = []
+    for i in range(3):
+        seller = User.objects.create(email='seller{}@pepup.com'.format(i), nickname='seller{}'.format(i),
+                                     phone='0100000000{}'.format(i + 1))
+        Profile.objects.create(user=seller)
+        DeliveryPolicy.objects.create(seller=seller, general=2500, mountain=5000,
+                                      amount=20000, active_amount=i == 0, volume=3, active_volume=i == 1)
+        for j in range(3):
+            product = Product.objects.create(name='product{}-{}'.format(i, j), brand=brand, price=10000,
+                                             content='', seller=seller)
+            Trade.objects.create(product=product, seller=seller, buyer=buyer)
+        sellers.append(seller)
+    return sellers
+
+
+def create_deals(buyer, trades, price, mountain=False):
+    """
+    get_payform 처럼 payment 와 deal 들을 만듭니다. (payment, create_deals 의 쿼리 수) 를 return 합니다.
+    """
+    view = PaymentViewSet()
+    view.request = SimpleNamespace(user=buyer, data={'price': price})
+    view.serializer = SimpleNamespace(data={'address': 'address', 'memo': '', 'mountain': mountain})
+    view.trades = trades
+    view.create_payment()
+    with CaptureQueriesContext(connection) as context:
+        view.create_deals()
+    return view.payment, len(context.captured_queries)
+
+
+class CreateDealsTestCase(TestCase):
+
+    def setUp(self):
+        self.buyer = User.objects.create(email='buyer@pepup.com', nickname='buyer', phone='01000000000')
+        Commission.objects.create(rate=0.1, info='')
+        self.sellers = create_cart(self.buyer)
+
+    def create_deals(self, trades, price, mountain=False):
+        return create_deals(self.buyer, trades, price, mountain=mountain)
+
+    def test_create_deals(self):
+        payment, query_count = self.create_deals(Trade.objects.filter(buyer=self.buyer), 30000 * 3 + 2500)
+        self.assertEqual(payment.price, 92500)
+        self.assertEqual(payment.name, 'product0-0 외 8건')
+        deals = {deal.seller_id: deal for deal in Deal.objects.filter(payment=payment)}
+        self.assertEqual([deals[seller.id].delivery_charge for seller in self.sellers], [0, 0, 2500])
+        self.assertEqual(deals[self.sellers[2].id].remain, 29500)
+        self.assertEqual(Delivery.objects.filter(deal__payment=payment).count(), 3)
+        for seller in self.sellers:
+            self.assertEqual(set(Trade.objects.filter(seller=seller).values_list('deal', flat=True)),
+                             {deals[seller.id].id})
+
+        # 셀러 수와 관계없이 같은 쿼리 수
+        Trade.objects.update(deal=None)
+        _, single_query_count = self.create_deals(Trade.objects.filter(seller=self.sellers[0]), 30000)
+        self.assertEqual(query_count, single_query_count)
+        self.assertLessEqual(query_count, 9)
+
+    def test_mountain(self):
+        payment, _ = self.create_deals(Trade.objects.filter(seller=self.sellers[0]), 35000, mountain=True)
+        self.assertEqual(payment.deal_set.get().delivery_charge, 5000)
+
+
+class CartTestCase(TestCase):
+
+    def setUp(self):
+        self.buyer = User.objects.create(email='buyer@pepup.com', nickname='buyer', phone='01000000000')
+        self.sellers = create_cart(self.buyer)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.buyer)
+
+    def test_cart(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/trades/cart/')
+        self.assertEqual(response.status_code, 200)
+        # trades, 셀러 socialaccount
+        self.assertEqual(len(context.captured_queries), 2)
+
+        self.assertEqual([group['seller']['id'] for group in response.data], [seller.id for seller in self.sellers])
+        self.assertEqual([group['payinfo']['delivery_charge'] for group in response.data], [0, 0, 2500])
+        self.assertEqual(response.data[2]['payinfo']['total'], 30000)
+        self.assertEqual(len(response.data[0]['products']), 3)
+
+    def test_sold(self):
+        Product.objects.filter(seller=self.sellers[0]).update(sold=True)
+        response = self.client.get('/api/trades/cart/')
+        self.assertEqual(len(response.data), 2)
+        self.assertFalse(Trade.objects.filter(seller=self.sellers[0]).exists())
+
+
+@override_settings(PAYMENT_COMPLETION_BACKEND='payment.completion.SyncBackend', BOOTPAY_BACKOFF=0)
+class PaymentCompletionTestCase(TransactionTestCase):
+    """
+    on_commit 이후 worker 가 실행되므로 TransactionTestCase 를 사용합니다.
+    """
+
+    def setUp(self):
+        self.buyer = User.objects.create(email='buyer@pepup.com', nickname='buyer', phone='01000000000')
+        Commission.objects.create(rate=0.1, info='')
+        create_cart(self.buyer)
+        self.payment, _ = create_deals(self.buyer, Trade.objects.filter(buyer=self.buyer), 92500)
+
+        self.stub = StubBootpayServer().__enter__()
+        self.stub.price = 92500
+        bootpay = BootpayApi(application_id='app', private_key='key', api_url=self.stub.url)
+        patcher = mock.patch('payment.completion.get_bootpay', return_value=bootpay)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.stub.__exit__)
+        # cleanup 은 역순으로 실행되므로 stub 종료 전에 session 의 keep-alive 연결을 닫습니다.
+        self.addCleanup(bootpay.session.close)
+
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.buyer)
+
+    def done(self, receipt_id='receipt1'):
+        response = self.client.post('/api/payment/done/', {'order_id': self.payment.id, 'receipt_id': receipt_id},
+                                    format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data['detail']
+
+    def assert_completed(self):
+        self.assertEqual(set(Deal.objects.filter(payment=self.payment).values_list('status', flat=True)), {2})
+        self.assertEqual(set(Trade.objects.filter(buyer=self.buyer).values_list('status', flat=True)), {2})
+        self.assertFalse(Product.objects.filter(sold=False).exists())
+        self.assertEqual(WalletLog.objects.filter(deal__payment=self.payment).count(), 3)
+        self.assertEqual(UserActivityLog.objects.filter(reference__deal__payment=self.payment).count(), 6)
+
+    def test_done(self):
+        self.assertEqual(self.done(), 'done')
+        self.assert_completed()
+
+        # 같은 receipt_id 로 다시 호출해도 한번만 처리
+        self.assertEqual(self.done(), 'done')
+        self.assert_completed()
+        self.assertEqual(len([path for _, path, _ in self.stub.requests if path.startswith('/receipt/')]), 1)
+
+    def test_other_receipt(self):
+        self.assertEqual(self.done(), 'done')
+        # 같은 주문에 다른 receipt_id 로 done 을 호출해도 다시 처리하지 않음
+        response = self.client.post('/api/payment/done/', {'order_id': self.payment.id, 'receipt_id': 'receipt2'},
+                                    format='json')
+        self.assertEqual(response.status_code, 406)
+        self.assertEqual(PaymentCompletion.objects.filter(payment=self.payment).count(), 1)
+        self.assert_completed()
+
+    def test_price_mismatch(self):
+        self.stub.price = 1000
+        self.assertEqual(self.done(), 'canceled')
+        self.assertEqual(set(Deal.objects.filter(payment=self.payment).values_list('status', flat=True)), {-3})
+        self.assertEqual(len([path for _, path, _ in self.stub.requests if path == '/cancel.json']), 1)
+        self.assertFalse(WalletLog.objects.exists())
+
+    def test_verify_failed(self):
+        # 4xx 는 다시 시도하지 않고 결제 실패로 끝내며, 결제되지 않았으므로 취소 요청도 하지 않음
+        self.stub.statuses = {'/receipt/receipt1': 404}
+        self.assertEqual(self.done(), 'failed')
+        completion = PaymentCompletion.objects.get(receipt_id='receipt1')
+        self.assertEqual(completion.status, PaymentCompletion.FAILED)
+        self.assertEqual(completion.attempts, 1)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, -2)
+        self.assertEqual(set(Deal.objects.filter(payment=self.payment).values_list('status', flat=True)), {-20})
+        self.assertFalse([path for _, path, _ in self.stub.requests if path == '/cancel.json'])
+
+        call_command('process_payment_completions', stdout=StringIO())
+        self.assertEqual(len([path for _, path, _ in self.stub.requests if path.startswith('/receipt/')]), 1)
+
+    def test_resume(self):
+        # 재시도 횟수보다 많이 실패하면 진행 중으로 남고, command 로 다시 처리
+        self.stub.failures = {'/receipt/receipt1': 3}
+        self.assertEqual(self.done(), 'processing')
+        completion = PaymentCompletion.objects.get(receipt_id='receipt1')
+        self.assertEqual(completion.status, PaymentCompletion.PENDING)
+        self.assertTrue(completion.error)
+
+        call_command('process_payment_completions', stdout=StringIO())
+        completion.refresh_from_db()
+        self.assertEqual(completion.status, PaymentCompletion.DONE)
+        self.assertEqual(completion.attempts, 2)
+        self.assert_completed()
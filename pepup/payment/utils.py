@@ -1,54 +1,65 @@
+"""
+배송비 계산입니다. cart, payform, create_deals 모두 calculate_delivery_fees 를 사용하므로
+장바구니에서 보여준 금액과 결제 금액이 항상 같습니다.
+"""
+from collections import OrderedDict, namedtuple
 
-def groupbyseller(dict_ls):
-    ret_ls = []
-    store = {}
-    helper = 0
-    for d in dict_ls:
-        if d['seller']['id'] in store.keys():
-            store[d['seller']['id']]['products'] \
-                .append({'trade_id': d['id'], 'product': d['product']})
-            store[d['seller']['id']]['payinfo']['total'] += d['product']['discounted_price']
-
-            helper += 1  # 한번 else 부터 갔다 들어오기 때문에 첫번째 들어왔을 때 뺴줌.
-            if helper == 1:
-                store[d['seller']['id']]['payinfo']['lack_amount'] -= d['product']['discounted_price']
-                store[d['seller']['id']]['payinfo']['lack_volume'] -= 1
-
-            if store[d['seller']['id']]['payinfo']['lack_amount'] > 0:  # 가격할인정책에서 남은 가격이 0원보다 클 때
-                store[d['seller']['id']]['payinfo']['lack_amount'] -= d['product']['discounted_price']
-            elif store[d['seller']['id']]['payinfo']['delivery_charge'] > 0 and d['payinfo']['active_amount']:
-                store[d['seller']['id']]['payinfo']['delivery_charge'] = 0
-
-            if store[d['seller']['id']]['payinfo']['lack_volume'] > 0:  # 수량할인정책에서 남은 개수가 0개보다 클 때
-                store[d['seller']['id']]['payinfo']['lack_volume'] -= 1
-            elif store[d['seller']['id']]['payinfo']['delivery_charge'] > 0 and d['payinfo']['active_volume']:
-                store[d['seller']['id']]['payinfo']['delivery_charge'] = 0
 
+class DeliveryFee(namedtuple('DeliveryFee', ['seller_id', 'total', 'volume', 'delivery_charge',
+                                             'mountain_delivery_charge', 'lack_amount', 'lack_volume'])):
+    """
+    셀러 한 곳의 상품 합계와 배송비입니다.
+    lack_amount, lack_volume 은 무료배송 조건까지 남은 금액, 수량입니다. (0 이면 조건 충족)
+    """
+    __slots__ = ()
+
+    def get_charge(self, mountain=False):
+        """
+        결제시 배송비 : 도서산간 이면 산간지역 배송비, 아니면 일반 배송비(무료배송 조건 적용)
+        """
+        return self.mountain_delivery_charge if mountain else self.delivery_charge
+
+
+def get_delivery_charge(delivery_policy, total, volume):
+    """
+    셀러 한 곳에서 구매하는 상품들의 일반 배송비입니다.
+    :param delivery_policy: 셀러의 DeliveryPolicy (또는 같은 속성을 가진 row)
+    :param total: 상품 할인가 합
+    :param volume: 상품 수
+    """
+    if delivery_policy.active_amount and total >= delivery_policy.amount:  # 총액 조건 무료배송
+        return 0
+    if delivery_policy.active_volume and volume >= delivery_policy.volume:  # 수량 조건 무료배송
+        return 0
+    return delivery_policy.general
+
+
+def calculate_delivery_fees(items, delivery_policies):
+    """
+    장바구니 전체의 셀러 별 합계, 배송비를 한번에 계산합니다. DB 를 조회하지 않습니다.
+    :param items: (seller_id, discounted_price) 의 iterable
+    :param delivery_policies: {seller_id: DeliveryPolicy}
+    :return: {seller_id: DeliveryFee}, items 에 처음 나온 셀러 순
+    """
+    totals = OrderedDict()  # seller_id: [할인가 합, 상품 수]
+    for seller_id, discounted_price in items:
+        total = totals.get(seller_id)
+        if total is None:
+            totals[seller_id] = [discounted_price, 1]
         else:
-            lack_amount = d['payinfo']['amount'] - d['product']['discounted_price']
-            lack_volume = d['payinfo']['volume'] - 1
-
-            if lack_amount <= 0 and d['payinfo']['active_amount']:
-                delivery_charge = 0
-            elif lack_volume <= 0 and d['payinfo']['active_volume']:
-                delivery_charge = 0
-            else:
-                delivery_charge = d['payinfo']['general']
-            mountain_delivery_charge = d['payinfo']['mountain']
-
-            store[d['seller']['id']] = {
-                'seller': d['seller'],
-                'products': [{'trade_id': d['id'], 'product': d['product']}],
-                'payinfo': {
-                    'total': d['product']['discounted_price'],
-                    'delivery_charge': delivery_charge,
-                    'mountain_delivery_charge': mountain_delivery_charge,
-                    'active_amount': d['payinfo']['active_amount'],
-                    'active_volume': d['payinfo']['active_volume'],
-                    'lack_amount': lack_amount,
-                    'lack_volume': lack_volume
-                }
-            }
-    for key in store:
-        ret_ls.append(store[key])
-    return ret_ls
\ No newline at end of file
+            total[0] += discounted_price
+            total[1] += 1
+
+    fees = OrderedDict()
+    for seller_id, (total, volume) in totals.items():
+        delivery_policy = delivery_policies[seller_id]
+        fees[seller_id] = DeliveryFee(
+            seller_id=seller_id,
+            total=total,
+            volume=volume,
+            delivery_charge=get_delivery_charge(delivery_policy, total, volume),
+            mountain_delivery_charge=delivery_policy.mountain,
+            lack_amount=max(delivery_policy.amount - total, 0),
+            lack_volume=max(delivery_policy.volume - volume, 0),
+        )
+    return fees
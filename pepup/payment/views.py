@@ -1,5 +1,3 @@
-from datetime import datetime
-
 from django.shortcuts import render
 import json
 import uuid
@@ -13,32 +11,29 @@ from rest_framework.decorators import authentication_classes, action
 from rest_framework import status, viewsets
 from rest_framework import exceptions
 
-from django.db.models import F, Sum, Count, ExpressionWrapper
+from django.db.models import Count, ExpressionWrapper
 from django.http import Http404, JsonResponse
 from django.shortcuts import render
 from django.db.models import Q as q
 from django.db import transaction
 from django.db.models import IntegerField, Value, Case, When
-from django.db.models.functions import Ceil
 
 from api.models import Product
-from user_activity.models import UserActivityLog, UserActivityReference
-from .Bootpay import BootpayApi
+from .Bootpay import get_bootpay
+from . import completion as completion_pipeline
 # model
 from accounts.models import User, DeliveryPolicy
-from .loader import load_credential
-from .models import Payment, Trade, Deal, Delivery, DeliveryMemo, TradeErrorLog, PaymentErrorLog, WalletLog
+from .models import Payment, Trade, Deal, Delivery, DeliveryMemo, TradeErrorLog, PaymentErrorLog, PaymentCompletion
 from payment.models import Commission
 
 # serializer
 from .serializers import (
     TradeSerializer,
     PayformSerializer,
-    PaymentDoneSerialzier,
-    PaymentCancelSerialzier,
     GetPayFormSerializer,
     AddressSerializer, UserNamenPhoneSerializer, DeliveryMemoSerializer)
-from .utils import groupbyseller
+from .utils import calculate_delivery_fees
+from .cart import get_cart_queryset, group_by_seller
 
 
 def pay_test(request):
@@ -125,27 +120,19 @@ class TradeViewSet(viewsets.GenericViewSet, mixins.DestroyModelMixin):
     #         ret_ls.append(store[key])
     #     return ret_ls
 
-    # todo: code, status and serializer data
-    # todo: query duplicate fix
     @action(methods=['get'], detail=False, )
     def cart(self, request):
         """
         method: GET
         :param request:
-        :return: code, status, and serializer data(trades)
+        :return: code, status, and 셀러 별로 묶은 trades (payment.cart.group_by_seller)
         """
-        self.buyer = request.user
-        self.trades = Trade.objects \
-            .select_related('seller', 'seller__profile') \
-            .select_related('seller__delivery_policy') \
-            .select_related('product', 'product__size', 'product__size__category', 'product__brand',
-                            'product__second_category') \
-            .prefetch_related('product__prodthumbnail__product') \
-            .filter(buyer=self.buyer, status=1)
-        if self.trades.filter(product__sold=True):
-            self.trades.filter(product__sold=True).delete()
-        serializer = TradeSerializer(self.trades, many=True)
-        return Response(groupbyseller(serializer.data))
+        trades = list(get_cart_queryset(Trade.objects.filter(buyer=request.user, status=1)))
+        sold_trade_ids = [trade.id for trade in trades if trade.product.sold]
+        if sold_trade_ids:
+            Trade.objects.filter(id__in=sold_trade_ids).delete()
+            trades = [trade for trade in trades if not trade.product.sold]
+        return Response(group_by_seller(trades))
 
     @action(methods=['post'], detail=False)
     def cancel(self, request):
@@ -166,11 +153,12 @@ class TradeViewSet(viewsets.GenericViewSet, mixins.DestroyModelMixin):
         user = request.user
 
         trades_id = request.data['trades']
-        trades = Trade.objects.filter(pk__in=trades_id, buyer=user, status=1)
+        trades = list(get_cart_queryset(Trade.objects.filter(pk__in=trades_id, buyer=user, status=1)))
 
         # delete sold trades
-        if trades.filter(product__sold=True):
-            trades.filter(product__sold=True).delete()
+        sold_trade_ids = [trade.id for trade in trades if trade.product.sold]
+        if sold_trade_ids:
+            Trade.objects.filter(id__in=sold_trade_ids).delete()
             return Response(status=status.HTTP_400_BAD_REQUEST)  # TODO: how to 깔끔?
 
         if not trades:
@@ -187,8 +175,7 @@ class TradeViewSet(viewsets.GenericViewSet, mixins.DestroyModelMixin):
         memos = DeliveryMemo.objects.filter(is_active=True).order_by('order')
         memo_list = DeliveryMemoSerializer(memos, many=True).data
 
-        trade_serializer = TradeSerializer(trades, many=True)
-        ordering_product = groupbyseller(trade_serializer.data)
+        ordering_product = group_by_seller(trades)
         total_price = 0
         delivery_charge = 0
         mountain_delivery_charge = 0
@@ -236,77 +223,82 @@ class PaymentViewSet(viewsets.GenericViewSet):
     def create_payment(self):
         self.payment = Payment.objects.create(user=self.request.user)
 
-    def get_deal_total_and_delivery_charge(self, seller, trades):
+    def get_deal_total_and_delivery_charge(self, delivery_fee, commission_rate):
         """
-        :param seller:
-        :param trades:
+        :param delivery_fee: 셀러의 payment.utils.DeliveryFee
+        :param commission_rate: Commission.rate
         :return: (total, remain, delivery_charge)
         """
-        commission_rate = Commission.objects.last().rate  # admin에서 처리
-
-        total_discounted_price = trades.aggregate(
-            total_discounted_price=Sum(
-                Ceil((F('product__price') * (1 - F('product__discount_rate'))) / 100) * 100,
-                output_field=IntegerField()
-            )
-        )['total_discounted_price']
-        if self.serializer.data['mountain']:  # client 에서 도서산간 On 했을 때.
-            delivery_charge = seller.delivery_policy.mountain
-        else:
-            volume = trades.count()
-            if volume > seller.delivery_policy.volume and seller.delivery_policy.active_volume:
-                delivery_charge = 0
-            elif total_discounted_price > seller.delivery_policy.amount and seller.delivery_policy.active_amount:
-                delivery_charge = 0
-            else:
-                delivery_charge = seller.delivery_policy.general  # 배송비 할인 없믕.
+        # client 에서 도서산간 On 했을 때 산간지역 배송비, 아니면 cart 에서 보여준 것과 같은 배송비.
+        delivery_charge = delivery_fee.get_charge(mountain=self.serializer.data['mountain'])
 
         return (
-            total_discounted_price + delivery_charge,
-            total_discounted_price * (1 - commission_rate) + delivery_charge,
+            delivery_fee.total + delivery_charge,
+            delivery_fee.total * (1 - commission_rate) + delivery_charge,
             # reamin : 셀러한테 줄 값. 배송비는 결제시 우리한테 결제하고 추후 셀러한테 지급.
             delivery_charge
         )
 
     def create_deals(self):
-        bulk_list_delivery = []
-        for seller_id in self.trades.values_list('seller', flat=True).distinct():  # 서로 다른 셀러들 결제시 한 셀러씩.
-            trades_groupby_seller = self.trades.filter(seller_id=seller_id)  # 셀러 별로 묶기.
-            seller = trades_groupby_seller.first().seller  # 셀러 인스턴스 가져오기.
-            total, remain, delivery_charge = self.get_deal_total_and_delivery_charge(seller, trades_groupby_seller)
-            deal = Deal.objects.create(
-                buyer=self.request.user,
-                seller=seller,
+        """
+        셀러 별로 deal, delivery 를 만들고 trades 에 연결합니다.
+        셀러 수와 관계없이 (셀러, 할인가) 조회 1번, 배송정책 1번, deal/delivery 의 bulk_create, trade update 1번으로 처리합니다.
+        """
+        buyer = self.request.user
+        # 서로 다른 셀러들 결제시 셀러 별로 묶기.
+        items = list(self.trades.order_by('pk').values_list('seller_id', 'product__discounted_price', 'product__name'))
+        seller_ids = {seller_id for seller_id, _, _ in items}
+        delivery_policies = DeliveryPolicy.objects.in_bulk(list(seller_ids), field_name='seller_id')
+        if len(delivery_policies) != len(seller_ids):
+            raise exceptions.NotAcceptable(detail='배송정책이 없는 셀러의 상품이 포함되어 있습니다.')
+        delivery_fees = calculate_delivery_fees([(seller_id, price) for seller_id, price, _ in items],
+                                                delivery_policies)
+        commission_rate = Commission.objects.last().rate  # admin에서 처리
+
+        deals = []
+        for seller_id, delivery_fee in delivery_fees.items():
+            total, remain, delivery_charge = self.get_deal_total_and_delivery_charge(delivery_fee, commission_rate)
+            deals.append(Deal(
+                buyer=buyer,
+                seller_id=seller_id,
                 total=total,
                 remain=remain,
                 delivery_charge=delivery_charge,
                 payment=self.payment
-            )
-            bulk_list_delivery.append(Delivery(
-                sender=seller,
-                receiver=self.request.user,
-                address=self.serializer.data['address'],
-                memo=self.serializer.data['memo'],
-                mountain=self.serializer.data['mountain'],
-                state='step0',
-                deal=deal  # 유저가 결제시(한 셀러 샵에서 여러개 상품 구매시 하나의 delivery생성), 배송 정보 기입.
             ))
-            trades_groupby_seller.update(deal=deal)
+        Deal.objects.bulk_create(deals)
+        # MySQL 은 bulk_create 후 pk 를 돌려주지 않으므로 새 payment 의 deal 을 다시 조회
+        deal_ids = dict(Deal.objects.filter(payment=self.payment).values_list('seller_id', 'id'))
+
+        # 유저가 결제시(한 셀러 샵에서 여러개 상품 구매시 하나의 delivery생성), 배송 정보 기입.
+        Delivery.objects.bulk_create([Delivery(
+            sender_id=seller_id,
+            receiver=buyer,
+            address=self.serializer.data['address'],
+            memo=self.serializer.data['memo'],
+            mountain=self.serializer.data['mountain'],
+            state='step0',
+            deal_id=deal_id
+        ) for seller_id, deal_id in deal_ids.items()])
+        self.trades.update(deal=Case(*[When(seller_id=seller_id, then=Value(deal_id))
+                                       for seller_id, deal_id in deal_ids.items()],
+                                     output_field=IntegerField()))
+
         # payment의 price
-        # for 문이 끝나고 생성된 payment의 total(할인된 가격이면 할인된 가격)을 계산해서 유저가 요청한 금액과 비교(유저 카트에서 계산해서 할인가 띄워줌: group_by_seller)
+        # 생성된 deal 들의 total(할인된 가격이면 할인된 가격)을 유저가 요청한 금액과 비교(유저 카트에서 계산해서 할인가 띄워줌: group_by_seller)
         # 에러 나는 경우 : 구매 중에 셀러가 할인가 적용시.
         ## 아직 payment 부르지도 않음. 검증과정.
-        total_sum = self.payment.deal_set.aggregate(total_sum=Sum('total'))['total_sum']
+        total_sum = sum(deal.total for deal in deals)
         if not total_sum == int(self.request.data.get('price')):
             raise exceptions.NotAcceptable(detail='가격을 확인해주시길 바랍니다.')
         self.payment.price = total_sum
 
-        if self.trades.count() > 1:
-            self.payment.name = self.trades.first().product.name + ' 외 ' + str(self.trades.count() - 1) + '건'
+        name = items[0][2]
+        if len(items) > 1:
+            self.payment.name = name + ' 외 ' + str(len(items) - 1) + '건'
         else:
-            self.payment.name = self.trades.first().product.name
+            self.payment.name = name
         self.payment.save()
-        Delivery.objects.bulk_create(bulk_list_delivery)
 
     @action(methods=['post'], detail=False, serializer_class=GetPayFormSerializer)
     def get_payform(self, request):
@@ -400,21 +392,21 @@ class PaymentViewSet(viewsets.GenericViewSet):
         return Response(status=status.HTTP_200_OK)
 
     def get_access_token(self):
-        bootpay = BootpayApi(application_id=load_credential("application_id"),
-                             private_key=load_credential("private_key"))
-        result = bootpay.get_access_token()
-        if result['status'] is 200:
+        bootpay = get_bootpay()
+        if bootpay.ensure_token():
             return bootpay
         else:
             raise exceptions.APIException(detail='bootpay access token 확인바람')
 
-    @transaction.atomic
     @action(methods=['post'], detail=False)
     def done(self, request):
         """
         method: POST
-        :param request: order_id, receipt_d
-        :return: status, code
+        결제 완료 처리를 접수하고 바로 응답합니다. 부트페이 검증과 결제 완료 처리는 payment.completion 의 worker 에서 진행되며,
+        같은 receipt_id 로 다시 호출하면 새로 처리하지 않고 현재 진행 상태를 return 하며,
+        order_id 당 하나의 receipt_id 만 접수합니다.
+        :param request: order_id, receipt_id
+        :return: status, detail (processing / done / canceled / failed)
         """
         receipt_id = request.data.get('receipt_id')
         order_id = request.data.get('order_id')
@@ -425,78 +417,33 @@ class PaymentViewSet(viewsets.GenericViewSet):
             PaymentErrorLog.objects.create(user=request.user, temp_payment=request.user.payment_set.last())
             raise exceptions.NotFound(detail='해당 order_id의 payment가 존재하지 않습니다.')
 
-        # todo: receipt_id와 order_id로 payment를 못 찾을 시 payment와 trades의 status를 조정할 알고리즘 필요
-        # todo: front에서 제대로 값만 잘주면 문제될 것은 없지만,
-        # todo: https://docs.bootpay.co.kr/deep/submit 해당 링크를 보고 서버사이드 결제승인으로 바꿀 필요성 있음
-        # todo: https://github.com/bootpay/server_python/blob/master/lib/BootpayApi.py 맨 밑줄
-        if not (receipt_id or order_id):
+        if not receipt_id:
             raise exceptions.NotAcceptable(detail='request body is not validated')
 
-        # 결제 승인 중 (부트페이에선 결제 되었지만, done 에서 처리 전)
-        payment.status = 3
-        payment.save()
-
-        # deal : bootpay 결제 완료
-        payment.deal_set.all().update(status=13)
-
-        buyer = payment.user
-
-        bootpay = self.get_access_token()
-        result = bootpay.verify(receipt_id)
-        if result['status'] == 200:
-            # 성공!
-            if payment.price == result['data']['price']:
-                serializer = PaymentDoneSerialzier(payment, data=result['data'])
-                if serializer.is_valid():
-                    serializer.save()
-                    # 관련 상품 sold처리
-                    products = Product.objects.filter(trade__deal__payment=payment)
-                    products.update(sold=True, sold_status=1)
-                    # 하위 trade 2번처리 : 결제완료
-                    trades = Trade.objects.filter(deal__payment=payment)
-                    trades.update(status=2)
-                    # deal : 결제완료, 거래 시간 저장
-                    payment.deal_set.update(status=2, transaction_completed_date=datetime.now())
-                    # walletlog 생성 : 정산은 walletlog를 통해서만 정산
-                    for deal in payment.deal_set.all():
-                        WalletLog.objects.create(deal=deal, user=deal.seller)
-
-                        reference = UserActivityReference.objects.create(deal=deal)
-                        # activity log 생성 : seller
-                        UserActivityLog.objects.create(user=deal.seller, status=200, reference=reference)
-                        # activity log 생성 : buyer
-                        UserActivityLog.objects.create(user=buyer, status=100, reference=reference)
-                    return Response(status.HTTP_200_OK)
-        else:
-            result = bootpay.cancel('receipt_id')
-            serializer = PaymentCancelSerialzier(payment, data=result['data'])
-            if serializer.is_valid():
-                serializer.save()
-                # trade : bootpay 환불 완료
-                Trade.objects.filter(deal__payment=payment).update(status=-3) #결제되었다가 취소이므로 환불.
-                # deal : bootpay 환불 완료
-                payment.deal_set.all().update(status=-3)
-
-                # activity log : buyer 결제 취소됨
-                UserActivityLog.objects.create(user=buyer, status=190)
-
-                return Response({'detail': 'canceled'}, status=status.HTTP_200_OK)
-
-        # todo: http stateless 특성상 데이터 집계가 될수 없을 수도 있어서 서버사이드랜더링으로 고쳐야 함...
-        return Response({'detail': ''}, status=status.HTTP_200_OK)
+        completion = completion_pipeline.accept(payment, receipt_id)
+        if completion.payment_id != payment.id:
+            raise exceptions.NotAcceptable(detail='다른 결제에 사용된 receipt_id 입니다.')
+        if completion.receipt_id != receipt_id:
+            raise exceptions.NotAcceptable(detail='이미 다른 receipt_id 로 결제 완료 처리가 접수된 주문입니다.')
+
+        # SyncBackend 이거나 이미 처리된 경우 최신 상태
+        completion.refresh_from_db(fields=['status'])
+        if completion.status == PaymentCompletion.DONE:
+            return Response({'detail': 'done'}, status=status.HTTP_200_OK)
+        if completion.status == PaymentCompletion.CANCELED:
+            return Response({'detail': 'canceled'}, status=status.HTTP_200_OK)
+        if completion.status == PaymentCompletion.FAILED:
+            return Response({'detail': 'failed'}, status=status.HTTP_200_OK)
+        return Response({'detail': 'processing'}, status=status.HTTP_200_OK)
 
     def error(self, request):
         pass
 
 
 class PayInfo(APIView):
-    # todo : 최적화 필요 토큰을 저장하고 25분마다 생성하고 그 안에서는 있는 토큰 사용할 수 있게
-    # todo : private_key 초기화 및 가져오는 처리도 필요
     def get_access_token(self):
-        bootpay = BootpayApi(application_id=load_credential("application_id"),
-                             private_key=load_credential("private_key"))
-        result = bootpay.get_access_token()
-        if result['status'] is 200:
+        bootpay = get_bootpay()
+        if bootpay.ensure_token():
             return bootpay
 
     @authentication_classes(authentication.TokenAuthentication)
@@ -528,12 +475,9 @@ class PayInfo(APIView):
 
 
 class RefundInfo(APIView):
-    # todo: 부트페이 계정 초기화 및 일반화
     def get_access_token(self):
-        bootpay = BootpayApi(application_id=load_credential("application_id"),
-                             private_key=load_credential("private_key"))
-        result = bootpay.get_access_token()
-        if result['status'] is 200:
+        bootpay = get_bootpay()
+        if bootpay.ensure_token():
             return bootpay
 
     def post(self, request, format=None, **kwargs):
@@ -244,6 +244,68 @@ FCM_DJANGO_SETTINGS = {
 }
 ########## FCM DJANGO CONFIGURATION
 
+########## CACHE CONFIGURATION
+# 기본은 locmem 이며, CACHE_BACKEND / CACHE_LOCATION 으로 redis 등으로 교체할 수 있습니다.
+CACHES = {
+    'default': {
+        'BACKEND': load_credential('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': load_credential('CACHE_LOCATION', 'pepup'),
+    }
+}
+
+# 상품 상세 캐시
+PRODUCT_DETAIL_CACHE = 'default'
+PRODUCT_DETAIL_CACHE_TIMEOUT = 60 * 10
+
+# 브랜드 목록, 카테고리 계층 snapshot(api.snapshot) 을 다시 만드는 주기
+# (locmem 처럼 process 별 캐시에서 다른 process 의 변경이 반영되기까지의 최대 시간)
+SNAPSHOT_TIMEOUT = 60 * 5
+########## END CACHE CONFIGURATION
+
+########## FOLLOW FEED CONFIGURATION
+# follow feed : follower 가 이 수 이상인 판매자는 fan-out 하지 않고 조회 시점에 합칩니다.
+FOLLOW_FEED_FANOUT_LIMIT = 5000
+# follow 시 inbox 에 채워 넣는 최근 상품 수
+FOLLOW_FEED_BACKFILL_COUNT = 50
+########## END FOLLOW FEED CONFIGURATION
+
+########## PRODUCT SEARCH CONFIGURATION
+# 상품 검색 index backend (api.search). test 에서는 api.search.MemorySearchBackend 를 사용할 수 있습니다.
+PRODUCT_SEARCH_BACKEND = 'api.search.DatabaseSearchBackend'
+# 검색어 자동완성의 추정 상품 수 캐시 시간
+PRODUCT_SEARCH_COUNT_TIMEOUT = 60
+# hot query 첫 페이지 캐시 (api.hot_search)
+HOT_SEARCH_SIZE = 300
+HOT_SEARCH_TIMEOUT = 60 * 10
+HOT_SEARCH_WINDOW_HOURS = 24
+# 태그별 판매중 상품 id posting list(api.postings) 캐시 시간
+TAG_POSTINGS_TIMEOUT = 60 * 60
+# 검색어 자동완성 index(api.autocomplete) 를 DB 에서 다시 읽는 주기
+AUTOCOMPLETE_REFRESH_SECONDS = 60 * 5
+########## END PRODUCT SEARCH CONFIGURATION
+
+########## BOOTPAY CONFIGURATION
+# payment.Bootpay client : (connect, read) timeout, 조회 요청의 재시도 횟수와 backoff(초, 재시도마다 2배)
+BOOTPAY_TIMEOUT = (3, 10)
+BOOTPAY_RETRIES = 2
+BOOTPAY_BACKOFF = 0.5
+# access token 재사용 시간 (bootpay token 유효시간 30분보다 짧게)
+BOOTPAY_TOKEN_TTL = 60 * 25
+# None 이면 https://api.bootpay.co.kr, test 에서는 local stub server 주소로 바꿉니다.
+BOOTPAY_API_URL = None
+########## END BOOTPAY CONFIGURATION
+
+########## PAYMENT COMPLETION CONFIGURATION
+# done 이후 부트페이 검증, 결제 완료 처리 worker (payment.completion)
+# test 에서는 payment.completion.SyncBackend 를 사용할 수 있습니다.
+PAYMENT_COMPLETION_BACKEND = 'payment.completion.ThreadBackend'
+PAYMENT_COMPLETION_WORKERS = 4
+# worker 가 작업을 점유하는 시간, 이 시간이 지나도 끝나지 않은 작업은 process_payment_completions 에서 다시 처리
+PAYMENT_COMPLETION_LEASE_SECONDS = 60
+# process_payment_completions 에서 재시도하는 최대 횟수
+PAYMENT_COMPLETION_MAX_ATTEMPTS = 10
+########## END PAYMENT COMPLETION CONFIGURATION
+
 APPEND_SLASH = False
 
 # toolbar
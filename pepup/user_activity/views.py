@@ -11,8 +11,8 @@ from django.db.models.functions import TruncDate
 
 from core.pagination import PepupPagination
 from payment.models import Deal, Review, Delivery
-from payment.serializers import TradeSerializer, UserNamenPhoneSerializer, AddressSerializer
-from payment.utils import groupbyseller
+from payment.cart import get_cart_queryset, group_by_seller
+from payment.serializers import UserNamenPhoneSerializer, AddressSerializer
 from user_activity.models import UserActivityLog, UserActivityReference
 from user_activity.serializers import PurchasedDealSerializer, ReviewSerializer, ReviewRetrieveSerializer, \
     SimpleWaybillSerializer, SoldDealSerializer, WaybillCreateSerializer, ActivitySerializer
@@ -55,9 +55,8 @@ class PurchasedViewSet(viewsets.ModelViewSet):
         if deal.buyer != user:
             return Response(status=status.HTTP_406_NOT_ACCEPTABLE)
 
-        trades = deal.trade_set.all()
-        trade_serializer = TradeSerializer(trades, many=True)
-        data = groupbyseller(trade_serializer.data)[0]
+        trades = get_cart_queryset(deal.trade_set.all())
+        data = group_by_seller(trades)[0]
         data.pop('payinfo')
 
         # ordered product info
@@ -203,9 +202,8 @@ class SoldViewSet(viewsets.ModelViewSet):
         if deal.seller != user:
             return Response(status=status.HTTP_406_NOT_ACCEPTABLE)
 
-        trades = deal.trade_set.all()
-        trade_serializer = TradeSerializer(trades, many=True)
-        data = groupbyseller(trade_serializer.data)[0]
+        trades = get_cart_queryset(deal.trade_set.all())
+        data = group_by_seller(trades)[0]
         data.pop('payinfo')
 
         # ordered product info